@@ -0,0 +1,264 @@
+"""
+benchmarks/chat_load.py
+Concurrent /chat capacity of one gunicorn worker, per worker class.
+
+A mock OpenAI Assistants API is started in-process: every call takes --rtt-ms
+and a run stays in_progress for --run-s before completing, so a /chat request
+spends almost all of its time waiting on the API, as it does in production.
+For each worker class, one gunicorn worker (gunicorn_config.py, pointed at the
+mock through OPENAI_BASE_URL) is sent --concurrency simultaneous /chat
+requests. Reported per mode:
+    ok         requests answered with 200
+    wall       time until the last answer arrived
+    p50/p95    per-request latency
+    req/s      ok / wall
+    in flight  most runs the mock saw in progress at once — the number of
+               requests the worker actually serves concurrently
+    calls/req  API round trips per answered request
+
+Usage:
+    python benchmarks/chat_load.py                       # sync vs gthread
+    python benchmarks/chat_load.py --concurrency 32 --run-s 3
+    python benchmarks/chat_load.py --modes gthread --threads 32
+"""
+
+import argparse
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+
+
+# ─────────────────────────────────────────────────────────────
+# Mock Assistants API
+# ─────────────────────────────────────────────────────────────
+
+class MockAssistants(ThreadingHTTPServer):
+    """Just enough of /v1/threads for server.py's chat pipeline."""
+
+    daemon_threads = True
+
+    def __init__(self, rtt_s, run_s):
+        super().__init__(("127.0.0.1", 0), _MockHandler)
+        self.rtt_s = rtt_s
+        self.run_s = run_s
+        self.lock = threading.Lock()
+        self.runs = {}          # run_id -> (thread_id, finishes_at)
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._ids = 0
+
+    def new_id(self, prefix):
+        with self.lock:
+            self._ids += 1
+            return f"{prefix}_{self._ids}"
+
+    def start_run(self, thread_id):
+        run_id = self.new_id("run")
+        with self.lock:
+            self.runs[run_id] = (thread_id, time.monotonic() + self.run_s)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return run_id
+
+    def run_status(self, run_id):
+        with self.lock:
+            thread_id, finishes_at = self.runs[run_id]
+            if finishes_at is None:
+                return "completed"
+            if time.monotonic() < finishes_at:
+                return "in_progress"
+            self.runs[run_id] = (thread_id, None)
+            self.in_flight -= 1
+            return "completed"
+
+    def reset(self):
+        with self.lock:
+            self.runs.clear()
+            self.calls = self.in_flight = self.peak_in_flight = 0
+
+
+def _thread(thread_id):
+    return {"id": thread_id, "object": "thread", "created_at": 0, "metadata": {}, "tool_resources": None}
+
+
+def _run(run_id, thread_id, status):
+    return {"id": run_id, "object": "thread.run", "thread_id": thread_id, "assistant_id": "asst_bench",
+            "status": status, "created_at": 0, "last_error": None}
+
+
+def _message(message_id, thread_id, role, text):
+    return {"id": message_id, "object": "thread.message", "thread_id": thread_id, "role": role,
+            "created_at": 0, "content": [{"type": "text", "text": {"value": text, "annotations": []}}]}
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _begin(self):
+        mock = self.server
+        with mock.lock:
+            mock.calls += 1
+        time.sleep(mock.rtt_s)
+        return mock, self.path.split("?")[0]
+
+    def do_POST(self):
+        mock, path = self._begin()
+        self._body()
+        if path == "/v1/threads":
+            return self._reply(_thread(mock.new_id("thread")))
+        if path == "/v1/threads/runs":                  # create_and_run
+            thread_id = mock.new_id("thread")
+            return self._reply(_run(mock.start_run(thread_id), thread_id, "queued"))
+        m = re.fullmatch(r"/v1/threads/([\w-]+)/messages", path)
+        if m:
+            return self._reply(_message(mock.new_id("msg"), m.group(1), "user", "question"))
+        m = re.fullmatch(r"/v1/threads/([\w-]+)/runs", path)
+        if m:
+            return self._reply(_run(mock.start_run(m.group(1)), m.group(1), "queued"))
+        self._reply({"error": {"message": f"no mock for POST {path}"}}, 404)
+
+    def do_GET(self):
+        mock, path = self._begin()
+        m = re.fullmatch(r"/v1/threads/([\w-]+)/runs/([\w-]+)", path)
+        if m:
+            return self._reply(_run(m.group(2), m.group(1), mock.run_status(m.group(2))))
+        m = re.fullmatch(r"/v1/threads/([\w-]+)/messages", path)
+        if m:
+            data = [_message(mock.new_id("msg"), m.group(1), "assistant", "Tommy is a cardiac physiologist."),
+                    _message(mock.new_id("msg"), m.group(1), "user", "question")]
+            limit = re.search(r"[?&]limit=(\d+)", self.path)
+            if limit:
+                data = data[:int(limit.group(1))]
+            return self._reply({"object": "list", "data": data, "has_more": False})
+        self._reply({"error": {"message": f"no mock for GET {path}"}}, 404)
+
+
+# ─────────────────────────────────────────────────────────────
+# Load generation
+# ─────────────────────────────────────────────────────────────
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_gunicorn(mode, threads, api_url):
+    port = _free_port()
+    env = dict(os.environ, OPENAI_API_KEY="bench", OPENAI_BASE_URL=api_url,
+               GUNICORN_WORKER_CLASS=mode, GUNICORN_THREADS=str(threads), TILT_WARM_UP="0")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn_config.py", "server:app",
+         "--bind", f"127.0.0.1:{port}", "--workers", "1", "--log-level", "warning",
+         "--access-logfile", "/dev/null"],
+        cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn ({mode}) exited: {proc.stderr.read().decode()[-2000:]}")
+        try:
+            urllib.request.urlopen(f"{base}/debug", timeout=1).read()
+            return proc, base
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"gunicorn ({mode}) did not come up")
+
+
+def _chat(base, i, timeout):
+    req = urllib.request.Request(
+        f"{base}/chat", data=json.dumps({"message": f"Who is Tommy? ({i})"}).encode(),
+        headers={"Content-Type": "application/json", "X-Forwarded-For": f"10.0.{i // 250}.{i % 250}"},
+    )
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            ok = resp.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return ok, time.perf_counter() - t0
+
+
+def run_mode(mode, mock, args):
+    proc, base = _start_gunicorn(mode, args.threads, f"http://127.0.0.1:{mock.server_port}/v1")
+    try:
+        _chat(base, 10_000, args.timeout)             # first request pays lazy imports and connection set-up
+        mock.reset()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda i: _chat(base, i, args.timeout), range(args.concurrency)))
+        wall = time.perf_counter() - t0
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    latencies = sorted(t for ok, t in results if ok)
+    ok = len(latencies)
+    return {
+        "ok": ok,
+        "wall": wall,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": latencies[max(0, int(len(latencies) * 0.95) - 1)] if latencies else 0.0,
+        "rps": ok / wall,
+        "in_flight": mock.peak_in_flight,
+        "calls": mock.calls / ok if ok else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent /chat capacity per gunicorn worker.")
+    parser.add_argument("--modes", nargs="+", default=["sync", "gthread"], help="gunicorn worker classes")
+    parser.add_argument("--concurrency", type=int, default=16, help="simultaneous /chat requests")
+    parser.add_argument("--threads", type=int, default=16, help="GUNICORN_THREADS for gthread")
+    parser.add_argument("--run-s", type=float, default=2.0, help="how long each mock run stays in progress")
+    parser.add_argument("--rtt-ms", type=float, default=50.0, help="latency added to every mock API call")
+    parser.add_argument("--timeout", type=float, default=120.0, help="client timeout per request (s)")
+    args = parser.parse_args(argv)
+
+    mock = MockAssistants(args.rtt_ms / 1000, args.run_s)
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+
+    print(f"1 worker, {args.concurrency} concurrent /chat requests, "
+          f"runs take {args.run_s:.1f} s, {args.rtt_ms:.0f} ms per API call")
+    print(f"{'mode':<8} {'ok':>4} {'wall s':>7} {'p50 s':>6} {'p95 s':>6} {'req/s':>6} "
+          f"{'in flight':>9} {'calls/req':>9}")
+    for mode in args.modes:
+        r = run_mode(mode, mock, args)
+        print(f"{mode:<8} {r['ok']:>4} {r['wall']:>7.1f} {r['p50']:>6.2f} {r['p95']:>6.2f} "
+              f"{r['rps']:>6.2f} {r['in_flight']:>9} {r['calls']:>9.1f}")
+    mock.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
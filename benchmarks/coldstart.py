@@ -0,0 +1,92 @@
+"""
+benchmarks/coldstart.py
+Cold vs warm first-request latency for a fresh tilt_table_extractor worker.
+
+Each trial starts a new interpreter (as gunicorn does for every worker) and
+measures
+    import     importing tilt_table_extractor
+    warm_up    warm_up() — only in the warm trials
+    first      process_pdf on the first document the worker sees
+    steady     median process_pdf over the following requests
+The cold trials skip warm_up(), so `first` carries every lazy first-use cost;
+in the warm trials those costs move into `warm_up` and `first` should sit
+close to `steady`.
+
+Usage:
+    python benchmarks/coldstart.py                 # 5 trials per mode
+    python benchmarks/coldstart.py --trials 10 --requests 20
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+
+
+def _child(warm, requests):
+    """Runs inside the fresh interpreter; prints one JSON line of timings in ms."""
+    sys.path.insert(0, BENCH_DIR)
+    from corpus import make_document
+    docs = [make_document(seed)[0] for seed in range(requests + 1)]
+
+    sys.path.insert(0, REPO_ROOT)
+    t0 = time.perf_counter()
+    import tilt_table_extractor as tte
+    result = {"import": (time.perf_counter() - t0) * 1000}
+
+    if warm:
+        t0 = time.perf_counter()
+        tte.warm_up()
+        result["warm_up"] = (time.perf_counter() - t0) * 1000
+
+    times = []
+    for pdf in docs:
+        t0 = time.perf_counter()
+        tte.process_pdf(pdf)
+        times.append((time.perf_counter() - t0) * 1000)
+    result["first"] = times[0]
+    result["steady"] = statistics.median(times[1:])
+    print(json.dumps(result))
+
+
+def _trial(warm, requests):
+    env = dict(os.environ)
+    env.pop("TILT_CACHE_DIR", None)
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", "warm" if warm else "cold",
+         "--requests", str(requests)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold vs warm worker start-up latency.")
+    parser.add_argument("--trials", type=int, default=5, help="fresh interpreters per mode")
+    parser.add_argument("--requests", type=int, default=10, help="steady-state requests per trial")
+    parser.add_argument("--child", choices=("cold", "warm"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        _child(args.child == "warm", args.requests)
+        return 0
+
+    print(f"{args.trials} trials per mode, {args.requests} steady-state requests each (ms, median)")
+    print(f"{'mode':<6} {'import':>8} {'warm_up':>8} {'first':>8} {'steady':>8} {'first/steady':>13}")
+    for warm in (False, True):
+        runs = [_trial(warm, args.requests) for _ in range(args.trials)]
+        med = {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+        print(f"{'warm' if warm else 'cold':<6} {med['import']:>8.1f} "
+              f"{med.get('warm_up', 0.0):>8.1f} {med['first']:>8.1f} {med['steady']:>8.1f} "
+              f"{med['first'] / med['steady']:>12.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
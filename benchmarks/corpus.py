@@ -0,0 +1,381 @@
+"""
+benchmarks/corpus.py
+Synthetic REDCap-style tilt table test PDFs with known answers, for the
+extractor benchmark (benchmarks/run.py).
+
+Each document mimics the layout tilt_table_extractor.py expects — the same
+question labels, option labels and ~8pt checkboxes to the left of each
+option — with randomly chosen checkbox states, vitals tables and free text.
+Next to every <name>.pdf the generator writes <name>.json holding the
+ground truth:
+
+    {"checkboxes": {field: [selected option, ...]},
+     "fields":     {field: expected extract_fields value},
+     "pages": int, "noise": int, "seed": int}
+
+Corpus variety:
+  extra_pages — free-text clinical-note pages inserted between form pages
+                (the real exports run from 7 to 20+ pages).
+  noise       — 0: clean form; 1: filler note lines between sections and
+                small horizontal jitter; 2: more of both, plus long
+                free-text answers.
+  box         — checkbox side / label gap: the default 8/4 everywhere, plus
+                BOX_VARIANTS on form-only documents.
+
+Generation is deterministic for a given (seed, extra_pages, noise, box), so two
+revisions benchmarked against the same corpus see identical inputs.
+
+Usage:
+    python benchmarks/corpus.py --out benchmarks/corpus
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+PAGE_W, PAGE_H = A4
+FONT = "Helvetica"
+FONT_SIZE = 9
+BOX = 8          # checkbox side, points
+BOX_GAP = 4      # checkbox → label gap, points
+# Other (side, gap) geometries seen in exports; the extractor's probe window
+# assumes ~9pt boxes 2-3pt from the label, so these sit right against it
+BOX_VARIANTS = ((9, 2), (8.5, 2.5), (8, 2.5))
+
+# Default corpus grid: every (extra_pages, noise) pair × SEEDS_PER_CELL
+EXTRA_PAGES = (0, 4, 12)
+NOISE_LEVELS = (0, 1, 2)
+SEEDS_PER_CELL = 3
+
+
+# ─────────────────────────────────────────────────────────────
+# Form content (labels as printed on the REDCap export)
+# ─────────────────────────────────────────────────────────────
+
+YES_NO = ["No", "Yes"]
+TRIGGERS = ["Needle or blood test", "Acute pain or injury", "Emotional Stress",
+            "Known Dehydration", "Febrile illness", "Hot environment",
+            "Toilet (voiding)", "Eating (or after)", "During driving"]
+SYMPTOMS = ["Nausea", "Vomiting", "Sweating", "Visual changes/disturbances",
+            "Pallor/paleness", "Seizure activity", "Urinary Incontinence",
+            "Bowel Incontinence", "Fatigue post event", "Hearing loss"]
+FAMILY_HX = ["Sudden Cardiac Death", "Cardiomyopathy",
+             "Family members with cardiac devices", "Other"]
+CONDITIONS = ["Chronic fatigue", "Brain Fogging", "Joint Hyper-mobility",
+              "Fibromyalgia or other pain syndrome", "Frequent headaches or migraine",
+              "MCAS - mast cell activation syndrome", "High blood pressure", "Asthma",
+              "Diabetes", "Coronary heart disease", "Valvular heart disease"]
+GI_DIAGNOSIS = ["Oesophageal Dysmotility", "Gastroperesis/early satiety", "IBS"]
+GI_SYMPTOMS = ["Constipation only", "Diarrhoea only", "Alternating constipation and diarrhoea",
+               "Bloating", "Abdominal pain/cramping"]
+MENTAL_HEALTH = ["Anxiety", "Depression", "ADHD - Attention deficit hyperactivity disorder",
+                 "Autism", "Other mental health"]
+MED_STATUS = ["Current", "Discontinued", "Never taken"]
+INVESTIGATIONS = ["ECG", "Holter Monitor", "ECHO", "Stress Test", "Loop recorder",
+                  "EP study", "Coronary Angiogram", "CT or MRI Brain", "EEG", "Carotid Doppler"]
+RESULTS = ["Normal", "POTS", "Postural Hypotension", "Vasovagal syncope",
+           "Vasovagal presyncope", "Mixed"]
+CORRELATION = ["Symptoms correlate with baseline", "Symptoms that are different to baseline",
+               "No symptoms"]
+
+NOTE_PHRASES = [
+    "Patient reports intermittent light-headedness on prolonged standing",
+    "Reviewed previous Holter and echocardiogram reports",
+    "Advised to increase oral fluid intake to two to three litres per day",
+    "Discussed compression garments and physical counter-manoeuvres",
+    "Symptoms worse in the morning and after hot showers",
+    "No chest pain or exertional dyspnoea reported",
+    "Attends full-time study with reduced attendance this term",
+    "Family present for the consultation",
+]
+OBSERVATIONS = ["worse in hot showers", "better after salty food",
+                "worse around exams", "worse after long car trips"]
+MEDICATIONS = ["Salt tablets", "Oral contraceptive pill", "Melatonin", "Iron supplements"]
+INVESTIGATION_COMMENTS = ["Holter showed sinus tachycardia", "Echo structurally normal",
+                          "ECG normal sinus rhythm", "Loop recorder pending"]
+CONCLUSIONS = ["POTS response with reproduction of symptoms",
+               "Normal haemodynamic response to tilt",
+               "Vasovagal response with presyncope at ten minutes"]
+
+
+class _Writer:
+    """Line-by-line page writer with checkbox option rows."""
+
+    def __init__(self, c, rng, noise, box=BOX, gap=BOX_GAP):
+        self.c = c
+        self.rng = rng
+        self.noise = noise
+        self.box = box
+        self.gap = gap
+        self.pages = 0
+        self.y = PAGE_H - 50
+
+    def _x(self, x):
+        return x + (self.rng.uniform(-3, 3) if self.noise else 0)
+
+    def line(self, text, x=40, dy=14):
+        if self.y < 60:
+            self.page_break()
+        self.c.setFont(FONT, FONT_SIZE)
+        self.c.drawString(self._x(x), self.y, text)
+        self.y -= dy
+
+    def filler(self, max_lines):
+        """Free-text note lines that carry no form fields (noise levels 1-2)."""
+        for _ in range(self.rng.randint(0, max_lines * self.noise)):
+            self.line(self.rng.choice(NOTE_PHRASES))
+
+    def options(self, options, checked, x=60, dy=14, per_line=4):
+        if self.y < 60:
+            self.page_break()
+        self.c.setFont(FONT, FONT_SIZE)
+        cx = self._x(x)
+        n = 0
+        for option in options:
+            width = self.c.stringWidth(option, FONT, FONT_SIZE)
+            bx = cx - self.box - self.gap
+            by = self.y - 1.5
+            self.c.setLineWidth(0.6)
+            self.c.rect(bx, by, self.box, self.box, stroke=1, fill=0)
+            if option in checked:
+                self.c.rect(bx + 1.2, by + 1.2, self.box - 2.4, self.box - 2.4, stroke=0, fill=1)
+            self.c.drawString(cx, self.y, option)
+            cx += width + 30
+            n += 1
+            if n % per_line == 0 or cx > PAGE_W - 120:
+                self.y -= dy
+                cx = self._x(x)
+        if n % per_line:
+            self.y -= dy
+
+    def page_break(self):
+        self.c.setFont(FONT, 7)
+        self.c.drawString(40, 20, "18/10/2026 10:00 projectredcap.org")
+        self.c.showPage()
+        self.pages += 1
+        self.y = PAGE_H - 50
+
+    def note_pages(self, count):
+        """Whole pages of clinical-note free text."""
+        for _ in range(count):
+            self.line("Clinical notes")
+            while self.y > 80:
+                self.line(" ".join(self.rng.sample(NOTE_PHRASES, 2)))
+            self.page_break()
+
+
+def make_document(seed, extra_pages=0, noise=0, box=BOX, gap=BOX_GAP):
+    """Return (pdf_bytes, truth) for one synthetic tilt table export."""
+    rng = random.Random(f"{seed}:{extra_pages}:{noise}")
+    buf = io.BytesIO()
+    w = _Writer(canvas.Canvas(buf, pagesize=A4), rng, noise, box, gap)
+    boxes = {}
+    fields = {}
+    # Spread the padding pages between the form pages
+    padding = [0] * 6
+    for _ in range(extra_pages):
+        padding[rng.randrange(len(padding))] += 1
+
+    def single(field, options):
+        boxes[field] = [rng.choice(options)]
+        return boxes[field]
+
+    def multi(field, options, p=0.35):
+        boxes[field] = [o for o in options if rng.random() < p]
+        return boxes[field]
+
+    # Page 1 — demographics
+    fields["mrn"] = str(rng.randint(1000000, 9999999))
+    fields["age"] = str(rng.randint(12, 45))
+    fields["sex"] = rng.choice(["Female", "Male"])
+    fields["height"] = str(rng.randint(150, 195))
+    fields["weight"] = str(rng.randint(45, 110))
+    w.line("Tilt Table Test")
+    w.line("Surname Smith")
+    w.line(f"Eastern Health MRN {fields['mrn']}")
+    w.line("Date of birth 01/02/1990")
+    w.line(f"Age (years) {fields['age']}")
+    w.line(f"Sex {fields['sex']}")
+    w.line(f"Height (cm) {fields['height']}")
+    w.line(f"Weight (kilograms) {fields['weight']}")
+    w.line("BMI 22.0")
+    w.filler(5)
+    w.page_break()
+    w.note_pages(padding[0])
+
+    # Page 2 — history
+    w.line("Symptom onset (syncope / presyncope) 2 Years 6 Months")
+    w.line("Frequency of events (syncope / presyncope) 2 Month 3 Week")
+    w.line("Number of episodes in the last month? 1 4")
+    w.line("Date of most recent episode? 01/09/2024")
+    w.line("No warning syncope")
+    w.options(["Frequent", "Rare", "Never"], single("no_warning_syncope", ["Frequent", "Rare", "Never"]))
+    w.filler(3)
+    w.line("Known initiating life event?")
+    w.options(YES_NO, single("initiating_life_event", YES_NO))
+    if boxes["initiating_life_event"] == ["Yes"]:
+        w.line("Yes viral illness in 2019", x=60)
+    for question, field in [("If YES, was it a medical illness?", "event_was_medical"),
+                            ("If YES, was it surgical or trauma?", "event_was_surgical"),
+                            ("If YES, was it an emotional trauma?", "event_was_emotional")]:
+        w.line(question)
+        w.options(YES_NO, single(field, YES_NO))
+    w.page_break()
+    w.note_pages(padding[1])
+
+    # Page 3 — activity and symptoms
+    w.line("Usual Posture at symptom onset")
+    w.options(["Standing", "Sitting", "Lying down", "No association with posture"],
+              single("posture", ["Standing", "Sitting", "Lying down"]))
+    for question, field in [("Does change in posture from lying to standing provoke symptoms?",
+                             "posture_change_provokes"),
+                            ("Are symptoms better lying down?", "better_lying_down")]:
+        w.line(question)
+        w.options(YES_NO, single(field, YES_NO))
+    w.line("Describe any Symptom Triggers")
+    w.options(TRIGGERS, multi("triggers", TRIGGERS), per_line=3)
+    w.filler(3)
+    w.line("Describe associated symptoms")
+    w.options(SYMPTOMS, multi("symptoms", SYMPTOMS), per_line=3)
+    for question, field in [("Any syncope during exercise?", "syncope_during_exercise"),
+                            ("Any syncope after exercise?", "syncope_after_exercise"),
+                            ("Any correlation with the menstrual cycle?", "menstrual_correlation"),
+                            ("Do you experience palpitations?", "palpitations")]:
+        w.line(question)
+        w.options(YES_NO, single(field, YES_NO))
+    w.line("If Yes, were they")
+    w.options(["fast", "slow", "stronger", "irregular"],
+              multi("palpitation_type", ["fast", "slow", "stronger", "irregular"]))
+    observation = rng.choice(OBSERVATIONS)
+    if noise == 2:
+        observation += " and " + rng.choice(OBSERVATIONS)
+    fields["other_observations"] = observation
+    w.line("Anything else you have observed about your")
+    w.line(f"symptoms? ________ {observation}")
+    w.page_break()
+    w.note_pages(padding[2])
+
+    # Page 4 — medical history and medications
+    w.line("Family history of hypotension or syncope? No")
+    w.line("Family history of...")
+    w.options(FAMILY_HX, multi("family_hx_cardiac", FAMILY_HX, p=0.2), per_line=2)
+    w.line("Have you been diagnosed with any of the following?")
+    w.options(CONDITIONS, multi("conditions", CONDITIONS), per_line=2)
+    w.filler(2)
+    w.line("Have you had a formal diagnosis of")
+    w.options(GI_DIAGNOSIS, multi("gi_diagnosis", GI_DIAGNOSIS))
+    w.line("Do you suffer from the following")
+    w.options(GI_SYMPTOMS, multi("gi_symptoms", GI_SYMPTOMS), per_line=2)
+    w.line("Have you had a diagnosis of Anxiety or other mental health")
+    w.options(MENTAL_HEALTH, multi("mental_health", MENTAL_HEALTH), per_line=2)
+    w.line("Negative chronotropes")
+    w.options(["No", "Beta blocker", "Ivabradine"],
+              single("negative_chronotropes", ["No", "Beta blocker", "Ivabradine"]))
+    w.line("Anti-depressant")
+    w.options(["SSRI", "Tricyclic", "SNRI"], multi("antidepressants", ["SSRI", "Tricyclic", "SNRI"]))
+    w.line("Fludrocortisone")
+    w.options(MED_STATUS, single("fludrocortisone_status", MED_STATUS))
+    w.line("Midodrine")
+    w.options(MED_STATUS, single("midodrine_status", MED_STATUS))
+    fields["other_medications"] = rng.choice(MEDICATIONS)
+    w.line(f"List any other relevant medications {fields['other_medications']}")
+    w.page_break()
+    w.note_pages(padding[3])
+
+    # Page 5 — investigations
+    w.line("Investigations")
+    w.options(INVESTIGATIONS, multi("investigations", INVESTIGATIONS), per_line=4)
+    fields["investigation_comments"] = rng.choice(INVESTIGATION_COMMENTS)
+    w.line("Additional comments")
+    w.line(fields["investigation_comments"])
+    w.page_break()
+    w.note_pages(padding[4])
+
+    # Page 6 — test results
+    baseline_sbp, baseline_hr = rng.randint(100, 135), rng.randint(55, 95)
+    recovery_sbp, recovery_hr = rng.randint(100, 135), rng.randint(55, 95)
+    fields["baseline_hr"] = baseline_hr
+    fields["baseline_bp"] = f"{baseline_sbp}/{rng.randint(60, 85)}"
+    fields["recovery_hr"] = recovery_hr
+    fields["recovery_bp"] = f"{recovery_sbp}/{rng.randint(60, 85)}"
+    control = [(rng.randint(95, 135), rng.randint(60, 140)) for _ in range(rng.randint(3, 10))]
+    phase2 = [(rng.randint(95, 135), rng.randint(60, 140)) for _ in range(rng.randint(1, 6))]
+    phase2_baseline = (rng.randint(100, 135), rng.randint(60, 100))
+    fields["control_readings"] = control
+    fields["phase2_readings"] = [phase2_baseline] + phase2
+
+    w.line("Type of test")
+    w.options(["Isoprenaline", "GTN", "Passive only"],
+              single("test_type", ["Isoprenaline", "GTN", "Passive only"]))
+    w.line(f"Baseline Rhythm Sinus rhythm Recovery Blood Pressure {fields['recovery_bp']}")
+    w.line(f"Baseline Heart Rate {baseline_hr}")
+    w.line(f"Baseline Blood Pressure {fields['baseline_bp']}")
+    w.line(f"Recovery Heart Rate {recovery_hr}")
+    w.line("Control Tilting")
+    for minute, (sbp, hr) in enumerate(control, 1):
+        w.line(f"Control {minute} minute {sbp} {hr}")
+    w.line("Any symptoms? Yes mild dizziness and nausea")
+    w.line(f"Phase 2 Phase 2 Baseline {phase2_baseline[0]} {phase2_baseline[1]}")
+    w.line("Dizzy lightheaded")
+    for minute, (sbp, hr) in enumerate(phase2, 1):
+        w.line(f"Phase 2 {minute * 2} minute {sbp} {hr}")
+    w.line("Phase Stage")
+    w.line("Control Results")
+    w.options(RESULTS, single("control_result_raw", RESULTS), per_line=3)
+    w.line("Phase 2 results")
+    w.options(RESULTS, single("phase2_result_raw", RESULTS), per_line=3)
+    w.line("Symptom Correlation")
+    w.options(CORRELATION, single("symptom_correlation", CORRELATION), per_line=1)
+    fields["results_conclusion"] = rng.choice(CONCLUSIONS)
+    w.line("Results Conclusion")
+    w.line("____________")
+    w.line(fields["results_conclusion"])
+    w.page_break()
+    w.note_pages(padding[5])
+
+    w.c.save()
+    truth = {"checkboxes": boxes, "fields": fields, "pages": w.pages,
+             "noise": noise, "seed": seed, "box": f"{box:g}/{gap:g}"}
+    return buf.getvalue(), truth
+
+
+def build_corpus(out_dir, extra_pages=EXTRA_PAGES, noise_levels=NOISE_LEVELS,
+                 seeds=SEEDS_PER_CELL, box_variants=BOX_VARIANTS):
+    """
+    Write the corpus grid to out_dir; returns the list of PDF paths. Each
+    box_variants geometry adds one form-only document per (noise, seed).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    grid = [(f"tilt_p{pages:02d}_n{noise}_s{seed}", seed, pages, noise, BOX, BOX_GAP)
+            for pages in extra_pages for noise in noise_levels for seed in range(seeds)]
+    grid += [(f"tilt_p00_n{noise}_s{seed}_b{box:g}g{gap:g}", seed, 0, noise, box, gap)
+             for box, gap in box_variants for noise in noise_levels for seed in range(seeds)]
+    paths = []
+    for name, seed, pages, noise, box, gap in grid:
+        pdf_bytes, truth = make_document(seed, pages, noise, box, gap)
+        pdf_path = os.path.join(out_dir, name + ".pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(pdf_bytes)
+        with open(os.path.join(out_dir, name + ".json"), "w") as f:
+            json.dump(truth, f, indent=1)
+        paths.append(pdf_path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate the synthetic tilt PDF corpus.")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "corpus"))
+    parser.add_argument("--seeds", type=int, default=SEEDS_PER_CELL,
+                        help="documents per (extra pages, noise) cell")
+    args = parser.parse_args(argv)
+    paths = build_corpus(args.out, seeds=args.seeds)
+    print(f"Wrote {len(paths)} PDFs to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
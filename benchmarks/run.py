@@ -0,0 +1,378 @@
+"""
+benchmarks/run.py
+Benchmark tilt_table_extractor against the synthetic corpus (benchmarks/corpus.py).
+
+Per PDF it times each pipeline stage —
+    parse      pdfplumber open (shared parse; folded into the others on
+               revisions that predate it)
+    text       extract_text_from_pdf
+    raster     poppler rasterisation (the share of ocr spent rendering)
+    ocr        _ocr_checkboxes, rasterisation included
+    fields     extract_fields
+    report     build_report
+— then measures the peak Python heap per document (tracemalloc, separate
+pass so it doesn't distort the timings) and the process peak RSS, and scores
+the extracted checkbox and text fields against the corpus ground truth.
+Checkbox accuracy is also broken down by box geometry (side/gap); the run
+exits with status 1 if any geometry scores more than --max-box-gap below the
+default 8/4 boxes, since the box layout shouldn't change what is read.
+
+Usage:
+    python benchmarks/run.py                       # working tree
+    python benchmarks/run.py --repeat 3 --json out.json
+    python benchmarks/run.py --compare main        # main vs working tree
+    python benchmarks/run.py --compare v1 v2       # two revisions
+
+--compare checks each revision out into a temporary git worktree and runs
+this script against it in a subprocess, so both sides use the same corpus
+and the same harness. The result cache is always disabled while
+benchmarking.
+"""
+
+import argparse
+import glob
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+DEFAULT_CORPUS = os.path.join(BENCH_DIR, "corpus")
+STAGES = ("parse", "text", "raster", "ocr", "fields", "report", "total")
+DEFAULT_BOX = "8/4"
+
+
+# ─────────────────────────────────────────────────────────────
+# Running one revision
+# ─────────────────────────────────────────────────────────────
+
+# Seconds spent rasterising during the current document
+_raster_seconds = [0.0]
+
+
+def _timed(fn):
+    """Wrap fn so its wall time accumulates into _raster_seconds."""
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _raster_seconds[0] += time.perf_counter() - t0
+    return wrapper
+
+
+def _timed_iter(fn):
+    """Wrap a generator function so time spent producing items accumulates into _raster_seconds."""
+    def wrapper(*args, **kwargs):
+        it = fn(*args, **kwargs)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                return
+            finally:
+                _raster_seconds[0] += time.perf_counter() - t0
+            yield item
+    return wrapper
+
+
+def _load_extractor(repo):
+    os.environ.pop("TILT_CACHE_DIR", None)
+    sys.path.insert(0, repo)
+    tte = importlib.import_module("tilt_table_extractor")
+    if not hasattr(tte, "_ParsedDocument"):
+        # Older revisions render whole pages through pdf2image, imported at call time
+        try:
+            import pdf2image
+            pdf2image.convert_from_bytes = _timed(pdf2image.convert_from_bytes)
+        except ImportError:
+            pass
+    return tte
+
+
+def _run_document(tte, pdf_bytes):
+    """Run the pipeline stage by stage. Returns (timings, ocr_results, fields)."""
+    timings = {"parse": 0.0}
+    _raster_seconds[0] = 0.0
+    t_start = time.perf_counter()
+
+    if hasattr(tte, "_ParsedDocument"):
+        t0 = time.perf_counter()
+        doc = tte._ParsedDocument(pdf_bytes)
+        timings["parse"] = time.perf_counter() - t0
+        if hasattr(doc, "iter_regions"):
+            doc.iter_regions = _timed_iter(doc.iter_regions)
+        else:
+            doc.render_region = _timed(doc.render_region)
+        source = doc
+    else:
+        # Older revisions parse inside each stage
+        doc = None
+        source = pdf_bytes
+
+    try:
+        t0 = time.perf_counter()
+        text = tte.extract_text_from_pdf(source)
+        t1 = time.perf_counter()
+        ocr = tte._ocr_checkboxes(source)
+        t2 = time.perf_counter()
+    finally:
+        if doc is not None:
+            doc.close()
+    fields = tte.extract_fields(text, ocr)
+    t3 = time.perf_counter()
+    tte.build_report(fields)
+    t4 = time.perf_counter()
+
+    timings.update(text=t1 - t0, ocr=t2 - t1, raster=_raster_seconds[0],
+                   fields=t3 - t2, report=t4 - t3, total=t4 - t_start)
+    return timings, ocr, fields
+
+
+def _expected_checkbox(tte, cfg, selected):
+    """Format a ground-truth selection the way _ocr_checkboxes reports it."""
+    display_map = cfg.get("display_map", {})
+    values = [display_map.get(opt, opt) for opt in cfg["options"] if opt in selected]
+    if not values:
+        return "none reported"
+    if not cfg["multi"]:
+        return values[0]
+    return tte._join_and(values)
+
+
+def _score(tte, truth, ocr, fields):
+    """Per-field correctness {field: bool} for checkbox and text fields."""
+    scores = {}
+    for field, selected in truth["checkboxes"].items():
+        cfg = tte._CHECKBOX_FIELDS.get(field)
+        if cfg is not None:
+            scores[field] = (ocr or {}).get(field) == _expected_checkbox(tte, cfg, selected)
+    for field, expected in truth["fields"].items():
+        got = fields.get(field)
+        if field.endswith("_readings"):
+            expected = [tuple(row) for row in expected]
+            got = [tuple(row) for row in got or []]
+        scores[field] = got == expected
+    return scores
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def benchmark(repo, corpus, repeat=1):
+    """Benchmark the extractor in repo against every PDF in corpus."""
+    tte = _load_extractor(repo)
+    tte.logger.disabled = True
+    pdf_paths = sorted(glob.glob(os.path.join(corpus, "*.pdf")))
+    if not pdf_paths:
+        raise SystemExit(f"No PDFs in {corpus} — run benchmarks/corpus.py first")
+
+    docs = []
+    for path in pdf_paths:
+        with open(path, "rb") as f:
+            pdf_bytes = f.read()
+        with open(os.path.splitext(path)[0] + ".json") as f:
+            truth = json.load(f)
+        docs.append((os.path.basename(path), pdf_bytes, truth))
+
+    # Warm-up: imports, poppler lookup, regex compilation
+    _run_document(tte, docs[0][1])
+
+    samples = {stage: [] for stage in STAGES}
+    by_pages = {}
+    field_hits = {}
+    box_hits = {}
+    wall0 = time.perf_counter()
+    for _ in range(repeat):
+        for name, pdf_bytes, truth in docs:
+            timings, ocr, fields = _run_document(tte, pdf_bytes)
+            for stage in STAGES:
+                samples[stage].append(timings[stage])
+            by_pages.setdefault(truth["pages"], []).append(timings["total"])
+            for field, ok in _score(tte, truth, ocr, fields).items():
+                field_hits.setdefault(field, []).append(ok)
+                if field in tte._CHECKBOX_FIELDS:
+                    box_hits.setdefault(truth.get("box", DEFAULT_BOX), []).append(ok)
+    wall = time.perf_counter() - wall0
+
+    # Memory pass — tracemalloc slows allocation-heavy code, so it runs apart
+    heap_peaks = []
+    for _, pdf_bytes, _ in docs:
+        tracemalloc.start()
+        _run_document(tte, pdf_bytes)
+        heap_peaks.append(tracemalloc.get_traced_memory()[1] / (1024 * 1024))
+        tracemalloc.stop()
+
+    stage_stats = {
+        stage: {
+            "mean_ms": float(np.mean(values) * 1000),
+            "p50_ms": float(np.percentile(values, 50) * 1000),
+            "p95_ms": float(np.percentile(values, 95) * 1000),
+        }
+        for stage, values in samples.items()
+    }
+    checkbox_fields = set(tte._CHECKBOX_FIELDS)
+    accuracy = {field: sum(hits) / len(hits) for field, hits in sorted(field_hits.items())}
+
+    def _overall(names):
+        hits = [ok for f in names for ok in field_hits[f]]
+        return sum(hits) / len(hits) if hits else None
+
+    return {
+        "repo": repo,
+        "documents": len(docs),
+        "repeat": repeat,
+        "pdfs_per_s": len(docs) * repeat / wall,
+        "stages": stage_stats,
+        "total_ms_by_pages": {str(p): float(np.mean(v) * 1000) for p, v in sorted(by_pages.items())},
+        "peak_heap_mb": float(max(heap_peaks)),
+        "peak_rss_mb": _peak_rss_mb(),
+        "checkbox_accuracy": _overall([f for f in field_hits if f in checkbox_fields]),
+        "text_accuracy": _overall([f for f in field_hits if f not in checkbox_fields]),
+        "checkbox_accuracy_by_box": {box: sum(h) / len(h) for box, h in sorted(box_hits.items())},
+        "field_accuracy": accuracy,
+    }
+
+
+def print_result(result):
+    print(f"{result['documents']} PDFs × {result['repeat']} — {result['pdfs_per_s']:.2f} PDFs/s")
+    print(f"{'stage':<8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for stage, s in result["stages"].items():
+        print(f"{stage:<8} {s['mean_ms']:>9.1f} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f}")
+    print("mean total by page count: " + ", ".join(
+        f"{p}p {ms:.0f} ms" for p, ms in result["total_ms_by_pages"].items()))
+    rss = result["peak_rss_mb"]
+    print(f"peak heap/document: {result['peak_heap_mb']:.1f} MB"
+          + (f", peak RSS: {rss:.1f} MB" if rss is not None else ""))
+    print(f"checkbox accuracy: {result['checkbox_accuracy']:.1%}, "
+          f"text field accuracy: {result['text_accuracy']:.1%}")
+    by_box = result.get("checkbox_accuracy_by_box", {})
+    if len(by_box) > 1:
+        print("checkbox accuracy by box side/gap: " + ", ".join(
+            f"{box} {acc:.1%}" for box, acc in by_box.items()))
+    misses = [(acc, f) for f, acc in result["field_accuracy"].items() if acc < 1.0]
+    for acc, field in sorted(misses):
+        print(f"  {field:<28} {acc:.0%}")
+
+
+# ─────────────────────────────────────────────────────────────
+# Comparing git revisions
+# ─────────────────────────────────────────────────────────────
+
+def _run_revision(rev, corpus, repeat, workdir):
+    """Benchmark one revision (None = working tree) in a subprocess."""
+    out = os.path.join(workdir, f"{rev or 'worktree'}.json".replace("/", "_"))
+    repo = REPO_ROOT
+    worktree = None
+    if rev is not None:
+        worktree = os.path.join(workdir, "tree-" + rev.replace("/", "_"))
+        subprocess.run(["git", "-C", REPO_ROOT, "worktree", "add", "--detach", "-q", worktree, rev],
+                       check=True)
+        repo = worktree
+    try:
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--repo", repo,
+                        "--corpus", corpus, "--repeat", str(repeat), "--json", out, "--quiet",
+                        "--max-box-gap", "1"],
+                       check=True)
+    finally:
+        if worktree:
+            subprocess.run(["git", "-C", REPO_ROOT, "worktree", "remove", "--force", worktree],
+                           check=False)
+    with open(out) as f:
+        return json.load(f)
+
+
+def compare(rev_a, rev_b, corpus, repeat):
+    with tempfile.TemporaryDirectory(prefix="tilt-bench-") as workdir:
+        a = _run_revision(rev_a, corpus, repeat, workdir)
+        b = _run_revision(rev_b, corpus, repeat, workdir)
+    label_a, label_b = rev_a or "worktree", rev_b or "worktree"
+    print(f"{'':<10} {label_a[:12]:>12} {label_b[:12]:>12} {'change':>9}")
+
+    def row(name, va, vb, fmt="{:.1f}", lower_is_better=True):
+        change = (vb - va) / va if va else 0.0
+        mark = "" if abs(change) < 0.05 else ("  better" if (change < 0) == lower_is_better else "  WORSE")
+        print(f"{name:<10} {fmt.format(va):>12} {fmt.format(vb):>12} {change:>+8.1%}{mark}")
+
+    for stage in STAGES:
+        row(stage + " ms", a["stages"][stage]["mean_ms"], b["stages"][stage]["mean_ms"])
+    row("PDFs/s", a["pdfs_per_s"], b["pdfs_per_s"], "{:.2f}", lower_is_better=False)
+    row("heap MB", a["peak_heap_mb"], b["peak_heap_mb"])
+    if a["peak_rss_mb"] and b["peak_rss_mb"]:
+        row("RSS MB", a["peak_rss_mb"], b["peak_rss_mb"])
+    row("checkbox", a["checkbox_accuracy"], b["checkbox_accuracy"], "{:.1%}", lower_is_better=False)
+    row("text", a["text_accuracy"], b["text_accuracy"], "{:.1%}", lower_is_better=False)
+    for box in sorted(set(a.get("checkbox_accuracy_by_box", {})) & set(b.get("checkbox_accuracy_by_box", {}))):
+        row("box " + box, a["checkbox_accuracy_by_box"][box], b["checkbox_accuracy_by_box"][box],
+            "{:.1%}", lower_is_better=False)
+    for field in sorted(set(a["field_accuracy"]) | set(b["field_accuracy"])):
+        fa, fb = a["field_accuracy"].get(field), b["field_accuracy"].get(field)
+        if fa != fb:
+            print(f"  {field:<28} {fa if fa is None else f'{fa:.0%}'} → {fb if fb is None else f'{fb:.0%}'}")
+
+
+def box_regressions(result, max_gap):
+    """Box geometries whose checkbox accuracy trails the default boxes by more than max_gap."""
+    by_box = result.get("checkbox_accuracy_by_box", {})
+    baseline = by_box.get(DEFAULT_BOX)
+    if baseline is None:
+        return []
+    return [(box, acc) for box, acc in by_box.items() if acc < baseline - max_gap]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark tilt_table_extractor.")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=1, help="timing passes over the corpus")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--max-box-gap", type=float, default=0.02,
+                        help="fail if a box geometry's checkbox accuracy trails the default 8/4 by more")
+    parser.add_argument("--repo", default=REPO_ROOT, help=argparse.SUPPRESS)
+    parser.add_argument("--quiet", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--compare", nargs="+", metavar="REV",
+                        help="compare two git revisions (one REV = REV vs working tree)")
+    args = parser.parse_args(argv)
+
+    if not glob.glob(os.path.join(args.corpus, "*.pdf")):
+        sys.path.insert(0, BENCH_DIR)
+        from corpus import build_corpus
+        print(f"Generating corpus in {args.corpus} ...", file=sys.stderr)
+        build_corpus(args.corpus)
+
+    if args.compare:
+        if len(args.compare) > 2:
+            parser.error("--compare takes one or two revisions")
+        rev_a = args.compare[0]
+        rev_b = args.compare[1] if len(args.compare) == 2 else None
+        compare(rev_a, rev_b, os.path.abspath(args.corpus), args.repeat)
+        return
+
+    result = benchmark(args.repo, args.corpus, args.repeat)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if not args.quiet:
+        print_result(result)
+    failed = box_regressions(result, args.max_box_gap)
+    for box, acc in failed:
+        print(f"FAIL: checkbox accuracy on {box} boxes is {acc:.1%}, vs "
+              f"{result['checkbox_accuracy_by_box'][DEFAULT_BOX]:.1%} on {DEFAULT_BOX}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,37 @@
 import multiprocessing
+import os
 
 # Gunicorn configuration
 bind = "0.0.0.0:10000"
-workers = multiprocessing.cpu_count() * 2 + 1
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# /chat and /HEART/assess spend nearly all their time waiting on OpenAI, so
+# each worker runs a pool of threads: a request blocked on an Assistants run
+# holds one thread, not the whole process. Everything shared in server.py
+# (OpenAI client, rate limiter, HEART case file, job store) is safe to use
+# from several threads. GUNICORN_WORKER_CLASS=sync restores the old
+# one-request-per-process model. See benchmarks/chat_load.py.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+# gunicorn silently upgrades sync to gthread when threads > 1, so only set it
+# for the threaded class.
+threads = int(os.getenv("GUNICORN_THREADS", "16")) if worker_class == "gthread" else 1
 timeout = 120  # 2 minutes timeout
 keepalive = 5
-worker_class = "sync"
 accesslog = "-"
 errorlog = "-"
-loglevel = "info" 
\ No newline at end of file
+loglevel = "info"
+
+
+def post_fork(server, worker):
+    # Warm the tilt table extractor in each worker so the first upload it
+    # serves doesn't pay for poppler lookup, lazy imports and cold caches.
+    # Done after the fork (not via preload_app) so workers never share
+    # pdfplumber/numpy state or SDK connection pools. TILT_WARM_UP=0 disables.
+    if os.getenv("TILT_WARM_UP", "1") == "0":
+        return
+    from tilt_table_extractor import warm_up
+    try:
+        timings = warm_up()
+        server.log.info("Worker %s warmed up: %s", worker.pid,
+                        ", ".join(f"{k} {v:.0f}" for k, v in timings.items()))
+    except Exception as e:
+        server.log.warning("Worker %s warm-up failed: %s", worker.pid, e)
@@ -304,6 +304,10 @@ document.addEventListener('DOMContentLoaded', function() {
     const chatInput = document.querySelector('.chat-input input');
     const sendButton = document.querySelector('.send-button');
     const chatMessages = document.querySelector('.chat-messages');
+    // One conversation per page visit: the server keeps the thread for this id,
+    // so follow-up questions are answered with the earlier ones in context
+    const chatSessionId = Array.from(crypto.getRandomValues(new Uint8Array(16)),
+        b => b.toString(16).padStart(2, '0')).join('');
 
     // Handle sending messages
     async function sendMessage() {
@@ -312,6 +316,7 @@ document.addEventListener('DOMContentLoaded', function() {
             // Add user message to chat
             addMessage(message, 'user');
             chatInput.value = '';
+            let bubble = null;
 
             try {
                 // Show animated typing indicator
@@ -326,37 +331,46 @@ document.addEventListener('DOMContentLoaded', function() {
 
                 // Determine the API URL based on the environment
                 const apiUrl = window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1'
-                    ? 'http://localhost:8081/chat'
-                    : 'https://tommymoran-com-chatbot.onrender.com/chat';
+                    ? 'http://localhost:8081/chat/stream'
+                    : 'https://tommymoran-com-chatbot.onrender.com/chat/stream';
 
-                // Call the backend API
+                // Call the backend API; the answer streams back as server-sent events
                 const response = await fetch(apiUrl, {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
-                        'Accept': 'application/json',
+                        'Accept': 'text/event-stream',
                     },
                     mode: 'cors',
                     credentials: 'omit',
-                    body: JSON.stringify({ message: message })
+                    body: JSON.stringify({ message: message, session_id: chatSessionId })
                 });
 
-                if (!response.ok) {
+                if (!response.ok || !response.body) {
                     throw new Error(`HTTP error! status: ${response.status}`);
                 }
 
-                const data = await response.json();
+                await readEvents(response.body, (event, data) => {
+                    if (event === 'delta') {
+                        // Replace the typing indicator with the answer as it arrives
+                        if (!bubble) {
+                            if (loadingDiv.parentNode) chatMessages.removeChild(loadingDiv);
+                            bubble = addMessage('', 'bot');
+                        }
+                        bubble.textContent += data.text;
+                        chatMessages.scrollTop = chatMessages.scrollHeight;
+                    } else if (event === 'done') {
+                        if (bubble) bubble.textContent = data.response;
+                    } else if (event === 'error') {
+                        throw new Error(data.error);
+                    }
+                });
 
-                // Remove loading indicator
                 if (loadingDiv.parentNode) {
                     chatMessages.removeChild(loadingDiv);
                 }
-
-                if (data.error) {
-                    console.error('Server error:', data.error);
-                    addMessage("Sorry, I'm having trouble connecting right now. Please try again later.", 'bot');
-                } else {
-                    addMessage(data.response, 'bot');
+                if (!bubble) {
+                    throw new Error('Empty response');
                 }
             } catch (error) {
                 console.error('Error:', error);
@@ -365,11 +379,39 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (loadingDiv) {
                     chatMessages.removeChild(loadingDiv);
                 }
+                // Drop a half-streamed answer
+                if (bubble && bubble.parentNode.parentNode) {
+                    chatMessages.removeChild(bubble.parentNode);
+                }
                 addMessage("Sorry, I'm having trouble connecting right now. Please try again later.", 'bot');
             }
         }
     }
 
+    // Parse a server-sent event stream, calling onEvent(name, data) per event
+    async function readEvents(body, onEvent) {
+        const reader = body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        for (;;) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let end;
+            while ((end = buffer.indexOf('\n\n')) !== -1) {
+                const raw = buffer.slice(0, end);
+                buffer = buffer.slice(end + 2);
+                let event = 'message';
+                let data = '';
+                for (const line of raw.split('\n')) {
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }
+                onEvent(event, data ? JSON.parse(data) : null);
+            }
+        }
+    }
+
     // Add message to chat
     function addMessage(text, sender) {
         const messageDiv = document.createElement('div');
@@ -379,6 +421,7 @@ document.addEventListener('DOMContentLoaded', function() {
         messageDiv.appendChild(p);
         chatMessages.appendChild(messageDiv);
         chatMessages.scrollTop = chatMessages.scrollHeight;
+        return p;
     }
 
     // Send message on button click
@@ -1,6 +1,6 @@
-from flask import Flask, request, jsonify, send_from_directory, redirect
+from flask import Flask, request, jsonify, send_from_directory, redirect, Response, stream_with_context
 from flask_cors import CORS
-from openai import OpenAI
+from openai import OpenAI, APIStatusError, NOT_GIVEN
 from dotenv import load_dotenv
 import os
 import time
@@ -12,8 +12,13 @@ from datetime import datetime
 import csv
 from io import StringIO
 import re
+import zipfile
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from collections import defaultdict
-from tilt_table_extractor import process_pdf, llm_cleanup_report
+from tilt_table_extractor import (generate_report, generate_report_stream, process_pdf_batch,
+                                  StageTimer, warm_up)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -49,6 +54,12 @@ CORS(app, resources={
         "allow_headers": ["Content-Type"],
         "supports_credentials": False
     },
+    r"/chat/stream": {
+        "origins": ALLOWED_ORIGINS,
+        "methods": ["POST", "OPTIONS"],
+        "allow_headers": ["Content-Type"],
+        "supports_credentials": False
+    },
     r"/HEART/assess": {
         "origins": [
             "https://tommymoran.com",
@@ -81,6 +92,42 @@ CORS(app, resources={
         ],
         "methods": ["POST", "OPTIONS"],
         "allow_headers": ["Content-Type"],
+        "expose_headers": ["Server-Timing"],
+        "supports_credentials": False
+    },
+    r"/tilt-table-test/batch": {
+        "origins": [
+            "https://tommymoran.com",
+            "https://tommymoran-com-chatbot.onrender.com",
+            "http://localhost:8000",
+            "http://127.0.0.1:8000",
+            "http://localhost:8080",
+            "http://127.0.0.1:8080",
+            "http://localhost:8081",
+            "http://127.0.0.1:8081",
+            "http://localhost:8082",
+            "http://127.0.0.1:8082"
+        ],
+        "methods": ["POST", "OPTIONS"],
+        "allow_headers": ["Content-Type"],
+        "supports_credentials": False
+    },
+    r"/tilt-table-test/jobs.*": {
+        "origins": [
+            "https://tommymoran.com",
+            "https://tommymoran-com-chatbot.onrender.com",
+            "http://localhost:8000",
+            "http://127.0.0.1:8000",
+            "http://localhost:8080",
+            "http://127.0.0.1:8080",
+            "http://localhost:8081",
+            "http://127.0.0.1:8081",
+            "http://localhost:8082",
+            "http://127.0.0.1:8082"
+        ],
+        "methods": ["GET", "POST", "OPTIONS"],
+        "allow_headers": ["Content-Type"],
+        "expose_headers": ["Location", "Retry-After"],
         "supports_credentials": False
     }
 })
@@ -98,20 +145,23 @@ def add_security_headers(response):
 
 # Simple in-memory rate limiting (per IP, 10 requests/minute)
 _rate_limit_store = defaultdict(list)
+_rate_limit_lock = threading.Lock()
 MAX_REQUESTS_PER_MINUTE = 10
 MAX_MESSAGE_LENGTH = 1000
 
 def is_rate_limited(ip):
     now = time.time()
     window_start = now - 60
-    _rate_limit_store[ip] = [t for t in _rate_limit_store[ip] if t > window_start]
-    if len(_rate_limit_store[ip]) >= MAX_REQUESTS_PER_MINUTE:
-        return True
-    _rate_limit_store[ip].append(now)
-    return False
+    with _rate_limit_lock:
+        _rate_limit_store[ip] = [t for t in _rate_limit_store[ip] if t > window_start]
+        if len(_rate_limit_store[ip]) >= MAX_REQUESTS_PER_MINUTE:
+            return True
+        _rate_limit_store[ip].append(now)
+        return False
 
 # Setup database file for HEART case tracking
 HEART_DB_FILE = "heart_cases.json"
+_heart_db_lock = threading.Lock()  # save_heart_case is read-modify-write
 
 # Initialize the database if it doesn't exist
 def initialize_heart_db():
@@ -123,21 +173,22 @@ def initialize_heart_db():
 # Save a HEART case to the database
 def save_heart_case(case_id, clinical_context, clinical_question, patient_urn, ai_response):
     try:
-        if os.path.exists(HEART_DB_FILE):
-            with open(HEART_DB_FILE, 'r') as f:
-                cases = json.load(f)
-        else:
-            cases = []
-        cases.append({
-            'case_id': case_id,
-            'timestamp': datetime.now().isoformat(),
-            'clinical_context': clinical_context,
-            'clinical_question': clinical_question,
-            'patient_urn': patient_urn,
-            'ai_response': ai_response
-        })
-        with open(HEART_DB_FILE, 'w') as f:
-            json.dump(cases, f, indent=2)
+        with _heart_db_lock:
+            if os.path.exists(HEART_DB_FILE):
+                with open(HEART_DB_FILE, 'r') as f:
+                    cases = json.load(f)
+            else:
+                cases = []
+            cases.append({
+                'case_id': case_id,
+                'timestamp': datetime.now().isoformat(),
+                'clinical_context': clinical_context,
+                'clinical_question': clinical_question,
+                'patient_urn': patient_urn,
+                'ai_response': ai_response
+            })
+            with open(HEART_DB_FILE, 'w') as f:
+                json.dump(cases, f, indent=2)
         logger.info(f"Successfully saved HEART case {case_id} to database")
         return True
     except Exception as e:
@@ -158,9 +209,15 @@ try:
         request.headers["OpenAI-Beta"] = "assistants=v2"
         return request
 
-    # Create HTTP client with event hook and increased timeout
+    # Create HTTP client with event hook and increased timeout. One client is
+    # shared by every request thread in the worker, so the pool is sized to
+    # the gunicorn thread count rather than httpx's default.
     http_client = httpx.Client(
         timeout=60.0,
+        limits=httpx.Limits(
+            max_connections=max(20, int(os.getenv('GUNICORN_THREADS', '16')) * 2),
+            max_keepalive_connections=int(os.getenv('GUNICORN_THREADS', '16')),
+        ),
         event_hooks={
             'request': [add_v2_header]
         }
@@ -176,11 +233,265 @@ except Exception as e:
     logger.error(f"Failed to initialize OpenAI client: {str(e)}")
     raise
 
+# ─────────────────────────────────────────────────────────────
+# Assistant run polling
+# ─────────────────────────────────────────────────────────────
+
+class RunWaiter:
+    """
+    Waits for an Assistants run to finish by polling runs.retrieve: the first
+    poll comes after initial_s and the gap grows by `backoff` per poll up to
+    max_s, so short runs are seen within tens of milliseconds of finishing
+    while long ones cost few API calls. Per-label totals (runs, polls, time
+    spent waiting, timeouts) are kept for /debug; they are per process.
+    """
+
+    PENDING_STATUSES = ('queued', 'in_progress', 'cancelling')
+
+    def __init__(self, initial_s=0.05, max_s=1.0, backoff=1.6):
+        self.initial_s = initial_s
+        self.max_s = max_s
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'runs': 0, 'polls': 0, 'wait_s': 0.0, 'timeouts': 0})
+
+    def wait(self, thread_id, run_id, timeout_s, label='run'):
+        """
+        Return the run once it has left queued/in_progress, or None if it is
+        still going after timeout_s. API errors propagate to the caller.
+        """
+        started = time.monotonic()
+        deadline = started + timeout_s
+        delay = self.initial_s
+        polls = 0
+        run_status = None
+        try:
+            while True:
+                time.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+                run_status = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+                polls += 1
+                if run_status.status not in self.PENDING_STATUSES:
+                    return run_status
+                if time.monotonic() >= deadline:
+                    run_status = None
+                    return None
+                delay = min(delay * self.backoff, self.max_s)
+        finally:
+            waited = time.monotonic() - started
+            with self._lock:
+                stats = self._stats[label]
+                stats['runs'] += 1
+                stats['polls'] += polls
+                stats['wait_s'] += waited
+                stats['timeouts'] += run_status is None
+            logger.info(f"{label} run {run_id}: "
+                        f"{run_status.status if run_status else 'timed out'} after {polls} polls, {waited * 1000:.0f} ms")
+
+    def stats(self):
+        """Totals and per-run averages by label."""
+        with self._lock:
+            return {
+                label: {
+                    'runs': s['runs'],
+                    'polls': s['polls'],
+                    'timeouts': s['timeouts'],
+                    'avg_polls': round(s['polls'] / s['runs'], 1) if s['runs'] else 0,
+                    'avg_wait_ms': round(s['wait_s'] * 1000 / s['runs']) if s['runs'] else 0,
+                }
+                for label, s in self._stats.items()
+            }
+
+
+run_waiter = RunWaiter()
+
+
+# ─────────────────────────────────────────────────────────────
+# Chat sessions
+# ─────────────────────────────────────────────────────────────
+#
+# A chat request may carry a session_id (the page picks one per visit). The
+# Assistants thread its first message was answered on is remembered, so
+# follow-ups go to the same thread: the assistant sees the conversation so far
+# and the turn skips threads.create. The mapping is one small file per session
+# under CHAT_SESSION_DIR, so a follow-up can land on any gunicorn worker.
+# Sessions idle for CHAT_SESSION_TTL_S are forgotten, and at most
+# CHAT_SESSION_MAX are kept (least recently used go first).
+
+CHAT_SESSION_DIR = os.getenv('CHAT_SESSION_DIR') or os.path.join(tempfile.gettempdir(), 'chat-sessions')
+CHAT_SESSION_TTL_S = int(os.getenv('CHAT_SESSION_TTL_S', '1800'))
+CHAT_SESSION_MAX = int(os.getenv('CHAT_SESSION_MAX', '1000'))
+_SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+# Wall-clock limit on a /chat/stream answer, matching /chat's run timeout. It
+# is also the stream's read timeout, so a stream that stalls can't hold the
+# request thread past it either.
+CHAT_STREAM_TIMEOUT_S = int(os.getenv('CHAT_STREAM_TIMEOUT_S', '30'))
+
+
+def _session_path(session_id):
+    return os.path.join(CHAT_SESSION_DIR, session_id)
+
+
+def _session_thread(session_id):
+    """Thread id of a live session, or None. The idle timer is only reset by _touch_session()."""
+    path = _session_path(session_id)
+    try:
+        if time.time() - os.path.getmtime(path) > CHAT_SESSION_TTL_S:
+            os.unlink(path)
+            return None
+        with open(path) as f:
+            thread_id = f.read().strip()
+    except OSError:
+        return None
+    return thread_id or None
+
+
+def _touch_session(session_id):
+    """Reset a session's idle timer once its thread has taken a new run."""
+    try:
+        os.utime(_session_path(session_id))
+    except OSError:
+        pass
+
+
+def _save_session(session_id, thread_id):
+    """Remember the session's thread, then prune expired and surplus sessions."""
+    os.makedirs(CHAT_SESSION_DIR, mode=0o700, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=CHAT_SESSION_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(thread_id)
+        os.replace(tmp, _session_path(session_id))
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    _prune_sessions()
+
+
+def _forget_session(session_id):
+    try:
+        os.unlink(_session_path(session_id))
+    except OSError:
+        pass
+
+
+def _prune_sessions():
+    cutoff = time.time() - CHAT_SESSION_TTL_S
+    live = []
+    try:
+        names = os.listdir(CHAT_SESSION_DIR)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(CHAT_SESSION_DIR, name)
+        try:
+            mtime = os.path.getmtime(path)
+            if mtime < cutoff:
+                os.unlink(path)
+            else:
+                live.append((mtime, path))
+        except OSError:
+            pass
+    live.sort(reverse=True)
+    for _, path in live[CHAT_SESSION_MAX:]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _remember_thread(session_id, thread_id):
+    """Record a new thread for the session, if there is one; failure only costs continuity."""
+    if not session_id:
+        return
+    try:
+        _save_session(session_id, thread_id)
+    except OSError as e:
+        logger.warning(f"Could not save chat session: {str(e)}")
+
+
+def _start_chat_run(session_id, user_message, stream=False):
+    """
+    Start the assistant's run for a chat turn in one round trip: on the
+    session's live thread, with the message going in alongside the run, or
+    with thread, message and run created together (create_and_run).
+
+    If the session's thread refuses the run (deleted, or still busy with a
+    run that was abandoned), the session is forgotten and the turn starts a
+    new thread instead.
+
+    Returns (thread_id, run). With stream=True, run is the event stream and a
+    new thread's id is None here; it arrives in the stream's thread.created
+    event.
+    """
+    message = {'role': 'user', 'content': user_message}
+    timeout = CHAT_STREAM_TIMEOUT_S if stream else NOT_GIVEN
+    thread_id = _session_thread(session_id) if session_id else None
+    if thread_id:
+        logger.info(f"Continuing session on thread: {thread_id}")
+        try:
+            run = client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=assistant_id,
+                additional_messages=[message],
+                stream=stream,
+                timeout=timeout
+            )
+        except APIStatusError as e:
+            logger.warning(f"Session thread {thread_id} refused the run ({e.status_code}); starting a new thread")
+            _forget_session(session_id)
+        else:
+            _touch_session(session_id)
+            return thread_id, run
+
+    run = client.beta.threads.create_and_run(
+        assistant_id=assistant_id,
+        thread={'messages': [message]},
+        stream=stream,
+        timeout=timeout
+    )
+    if stream:
+        return None, run
+    logger.info(f"Created thread: {run.thread_id}")
+    _remember_thread(session_id, run.thread_id)
+    return run.thread_id, run
+
+
 @app.route('/')
 def index():
     logger.info("Root route accessed")
     return jsonify({"status": "ok", "message": "Server is running"})
 
+def _validate_chat_request():
+    """
+    Rate-limit and validate a chat request. Returns (message, session_id, None)
+    — session_id is None when the request has none — or (None, None, error response).
+    """
+    client_ip = request.headers.get('X-Forwarded-For', request.remote_addr or '')
+    client_ip = client_ip.split(',')[0].strip()
+    if is_rate_limited(client_ip):
+        return None, None, (jsonify({'error': 'Too many requests. Please wait a moment and try again.'}), 429)
+
+    data = request.get_json(silent=True)
+    if not data:
+        return None, None, (jsonify({'error': 'Invalid request body.'}), 400)
+
+    user_message = str(data.get('message', '')).strip()
+    if not user_message:
+        return None, None, (jsonify({'error': 'Message is required.'}), 400)
+    if len(user_message) > MAX_MESSAGE_LENGTH:
+        return None, None, (jsonify({'error': f'Message too long. Maximum {MAX_MESSAGE_LENGTH} characters.'}), 400)
+
+    session_id = data.get('session_id')
+    if session_id is not None and not (isinstance(session_id, str) and _SESSION_ID_RE.match(session_id)):
+        return None, None, (jsonify({'error': 'Invalid session_id.'}), 400)
+
+    logger.info(f"Received message of length {len(user_message)}")
+    return user_message, session_id, None
+
 @app.route('/chat', methods=['POST', 'OPTIONS'])
 def chat():
     logger.info("Chat endpoint accessed")
@@ -193,85 +504,46 @@ def chat():
         response.headers.add('Access-Control-Allow-Methods', 'POST,OPTIONS')
         return response
 
-    # Rate limiting
-    client_ip = request.headers.get('X-Forwarded-For', request.remote_addr or '')
-    client_ip = client_ip.split(',')[0].strip()
-    if is_rate_limited(client_ip):
-        return jsonify({'error': 'Too many requests. Please wait a moment and try again.'}), 429
+    user_message, session_id, error = _validate_chat_request()
+    if error:
+        return error
 
     try:
-        data = request.json
-        if not data:
-            return jsonify({'error': 'Invalid request body.'}), 400
-
-        user_message = data.get('message', '').strip()
-        if not user_message:
-            return jsonify({'error': 'Message is required.'}), 400
-        if len(user_message) > MAX_MESSAGE_LENGTH:
-            return jsonify({'error': f'Message too long. Maximum {MAX_MESSAGE_LENGTH} characters.'}), 400
-
-        logger.info(f"Received message of length {len(user_message)}")
-
-        # Create a thread
-        thread = client.beta.threads.create()
-        logger.info(f"Created thread: {thread.id}")
-
-        # Add the user's message to the thread
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=user_message
-        )
-        logger.info(f"Added message to thread: {message.id}")
-
-        # Run the assistant on the thread
-        run = client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id=assistant_id
-        )
+        # Post the message and start the run in one call, on the session's
+        # thread or a new one
+        thread_id, run = _start_chat_run(session_id, user_message)
         logger.info(f"Created run: {run.id}")
 
         # Wait for the run to complete with a maximum timeout
-        max_attempts = 30  # 30 seconds maximum
-        attempts = 0
-
-        while attempts < max_attempts:
-            try:
-                run_status = client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-
-                if run_status.status == 'completed':
-                    break
-                elif run_status.status == 'failed':
-                    logger.error(f"Run failed: {run_status.last_error}")
-                    return jsonify({
-                        'error': f"Assistant run failed: {run_status.last_error}"
-                    }), 500
-                elif run_status.status == 'expired':
-                    logger.error("Run expired")
-                    return jsonify({
-                        'error': "Assistant run expired. Please try again."
-                    }), 500
-
-                attempts += 1
-                time.sleep(1)
-
-            except Exception as e:
-                logger.error(f"Error checking run status: {str(e)}")
-                return jsonify({
-                    'error': "Error communicating with OpenAI. Please try again."
-                }), 500
+        try:
+            run_status = run_waiter.wait(thread_id, run.id, timeout_s=30, label='chat')
+        except Exception as e:
+            logger.error(f"Error checking run status: {str(e)}")
+            return jsonify({
+                'error': "Error communicating with OpenAI. Please try again."
+            }), 500
 
-        if attempts >= max_attempts:
+        if run_status is None:
             logger.error("Run timed out")
+            if session_id:
+                # The run may still be going; a follow-up on this thread would be refused
+                _forget_session(session_id)
             return jsonify({
                 'error': "Request timed out. Please try again."
             }), 500
+        elif run_status.status == 'failed':
+            logger.error(f"Run failed: {run_status.last_error}")
+            return jsonify({
+                'error': f"Assistant run failed: {run_status.last_error}"
+            }), 500
+        elif run_status.status != 'completed':
+            logger.error(f"Run ended with status {run_status.status}")
+            return jsonify({
+                'error': "Assistant run expired. Please try again."
+            }), 500
 
-        # Get the assistant's response
-        messages = client.beta.threads.messages.list(thread_id=thread.id)
+        # Get the assistant's response: the newest message on the thread
+        messages = client.beta.threads.messages.list(thread_id=thread_id, order='desc', limit=1)
         logger.info("Retrieved messages from thread")
 
         # Get the last assistant message
@@ -295,7 +567,8 @@ def chat():
                         assistant_message = assistant_message.rstrip() + '.'
                     logger.info("Successfully processed assistant response")
                     return jsonify({
-                        'response': assistant_message
+                        'response': assistant_message,
+                        'session_id': session_id
                     })
                 except Exception as e:
                     logger.error(f"Error processing message content: {str(e)}")
@@ -313,6 +586,156 @@ def chat():
             'error': str(e)
         }), 500
 
+class _CitationStripper:
+    """
+    The /chat answer clean-up, applied to text that arrives in pieces:
+    【...】 citation markers are removed (like re.sub(r'【.*?】', '') — a
+    marker can't span lines), leading/trailing whitespace is stripped and
+    the answer ends with punctuation. A possible marker, and whitespace that
+    may turn out to be trailing, are held back until the next piece decides.
+    """
+
+    def __init__(self):
+        self._held = ""       # undecided text starting at an unclosed 【
+        self._space = ""      # whitespace after the last emitted character
+        self._started = False
+        self._last = ""
+
+    def feed(self, text):
+        """Add the next piece; returns the text that is now safe to send."""
+        buf = self._held + text
+        self._held = ""
+        out = []
+        i = 0
+        while True:
+            start = buf.find('【', i)
+            if start == -1:
+                out.append(buf[i:])
+                break
+            out.append(buf[i:start])
+            end = buf.find('】', start)
+            newline = buf.find('\n', start)
+            if end != -1 and (newline == -1 or end < newline):
+                i = end + 1                          # a marker: drop it
+            elif newline != -1:
+                out.append('【')                     # can't close on this line: literal
+                i = start + 1
+            else:
+                self._held = buf[start:]             # wait for more text
+                break
+        return self._emit(''.join(out))
+
+    def finish(self):
+        """Flush what's held and return the final piece (at least the closing punctuation)."""
+        tail = self._emit(self._held)  # an unclosed 【 at the end is just text
+        self._held = ""
+        if not self._last.endswith(('.', '!', '?')):
+            tail += '.'
+        return tail
+
+    def _emit(self, text):
+        if not self._started:
+            text = text.lstrip()
+        body = text.rstrip()
+        if not body:
+            self._space += text
+            return ""
+        self._started = True
+        out = self._space + body
+        self._space = text[len(body):]
+        self._last = body[-1]
+        return out
+
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Server-sent events version of /chat, backed by a streamed run: 'delta'
+    events carry the answer's text as the assistant writes it (citation
+    markers already removed), then 'done' carries the complete answer — or
+    'error' if the run fails part-way, stops without completing (e.g. on
+    requires_action), or runs past CHAT_STREAM_TIMEOUT_S.
+    """
+    logger.info("Chat stream endpoint accessed")
+    user_message, session_id, error = _validate_chat_request()
+    if error:
+        return error
+    deadline = time.monotonic() + CHAT_STREAM_TIMEOUT_S
+
+    try:
+        thread_id, stream = _start_chat_run(session_id, user_message, stream=True)
+        logger.info(f"Created streamed run on thread: {thread_id or 'new'}")
+    except Exception as e:
+        logger.error(f"Error starting streamed run: {str(e)}")
+        return jsonify({'error': "Error communicating with OpenAI. Please try again."}), 500
+
+    def sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+    def generate():
+        started = time.monotonic()
+        first_token_ms = None
+        stripper = _CitationStripper()
+        parts = []
+        completed = False
+        try:
+            for event in stream:
+                if time.monotonic() > deadline:
+                    logger.error(f"Streamed run timed out after {CHAT_STREAM_TIMEOUT_S} s")
+                    yield sse('error', {'error': "Request timed out. Please try again."})
+                    return
+                if event.event == 'thread.created':
+                    _remember_thread(session_id, event.data.id)
+                elif event.event == 'thread.run.completed':
+                    completed = True
+                elif event.event == 'thread.message.delta':
+                    for block in event.data.delta.content or []:
+                        if block.type != 'text' or not block.text or not block.text.value:
+                            continue
+                        text = stripper.feed(block.text.value)
+                        if text:
+                            if first_token_ms is None:
+                                first_token_ms = (time.monotonic() - started) * 1000
+                            parts.append(text)
+                            yield sse('delta', {'text': text})
+                elif event.event in ('thread.run.failed', 'thread.run.expired',
+                                     'thread.run.cancelled', 'thread.run.incomplete',
+                                     'thread.run.requires_action'):
+                    logger.error(f"Streamed run ended with {event.event}: {event.data.last_error}")
+                    yield sse('error', {'error': "The assistant couldn't finish its answer. Please try again."})
+                    return
+                elif event.event == 'error':
+                    logger.error(f"Error event in streamed run: {event.data}")
+                    yield sse('error', {'error': "Error communicating with OpenAI. Please try again."})
+                    return
+            if not completed:
+                logger.error("Streamed run ended without thread.run.completed")
+                yield sse('error', {'error': "The assistant couldn't finish its answer. Please try again."})
+                return
+            tail = stripper.finish()
+            if tail:
+                parts.append(tail)
+                yield sse('delta', {'text': tail})
+            yield sse('done', {'response': ''.join(parts)})
+            logger.info("Chat stream finished: first text after %s ms, total %.0f ms",
+                        'n/a' if first_token_ms is None else f"{first_token_ms:.0f}",
+                        (time.monotonic() - started) * 1000)
+        except httpx.TimeoutException:
+            logger.error(f"Streamed run stalled for {CHAT_STREAM_TIMEOUT_S} s")
+            yield sse('error', {'error': "Request timed out. Please try again."})
+        except Exception as e:
+            logger.error(f"Error in chat stream: {str(e)}")
+            yield sse('error', {'error': "Error communicating with OpenAI. Please try again."})
+        finally:
+            stream.close()
+            if session_id and not completed:
+                # A run that didn't finish (or that nobody is listening to any
+                # more) may still be active, and would block the next message
+                _forget_session(session_id)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+
 @app.route('/HEART/assess', methods=['POST', 'OPTIONS'])
 def heart_assess():
     logger.info("HEART assessment endpoint accessed")
@@ -359,66 +782,40 @@ def heart_assess():
             "Consider Consulting: List any teams or specialties that should be consulted, if relevant.\n"
         )
 
-        # Create a thread
-        thread = client.beta.threads.create()
-        logger.info(f"Created thread for HEART: {thread.id}")
-
-        # Add the user's message to the thread
-        message = client.beta.threads.messages.create(
-            thread_id=thread.id,
-            role="user",
-            content=user_message
+        # Create the thread with the user's message and run the HEART assistant on it, in one call
+        run = client.beta.threads.create_and_run(
+            assistant_id="asst_W3VfOMmKvt07w6WIR6yGpI9x",
+            thread={'messages': [{'role': 'user', 'content': user_message}]}
         )
-        logger.info(f"Added message to HEART thread: {message.id}")
+        logger.info(f"Created HEART run {run.id} on thread {run.thread_id}")
 
-        # Run the HEART assistant on the thread
-        run = client.beta.threads.runs.create(
-            thread_id=thread.id,
-            assistant_id="asst_W3VfOMmKvt07w6WIR6yGpI9x"
-        )
-        logger.info(f"Created HEART run: {run.id}")
+        # Wait for the run to complete with a maximum timeout (complex cases take longer)
+        try:
+            run_status = run_waiter.wait(run.thread_id, run.id, timeout_s=60, label='heart')
+        except Exception as e:
+            logger.error(f"Error checking HEART run status: {str(e)}")
+            return jsonify({
+                'error': "Error communicating with OpenAI. Please try again."
+            }), 500
 
-        # Wait for the run to complete with a maximum timeout
-        max_attempts = 60  # 60 seconds maximum (may need longer for complex cases)
-        attempts = 0
-        
-        while attempts < max_attempts:
-            try:
-                run_status = client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-                
-                if run_status.status == 'completed':
-                    break
-                elif run_status.status == 'failed':
-                    logger.error(f"HEART run failed: {run_status.last_error}")
-                    return jsonify({
-                        'error': f"HEART assessment failed: {run_status.last_error}"
-                    }), 500
-                elif run_status.status == 'expired':
-                    logger.error("HEART run expired")
-                    return jsonify({
-                        'error': "HEART assessment expired. Please try again."
-                    }), 500
-                
-                attempts += 1
-                time.sleep(1)  # Wait for 1 second before checking again
-                
-            except Exception as e:
-                logger.error(f"Error checking HEART run status: {str(e)}")
-                return jsonify({
-                    'error': "Error communicating with OpenAI. Please try again."
-                }), 500
-
-        if attempts >= max_attempts:
+        if run_status is None:
             logger.error("HEART run timed out")
             return jsonify({
                 'error': "HEART assessment timed out. Please try again."
             }), 500
+        elif run_status.status == 'failed':
+            logger.error(f"HEART run failed: {run_status.last_error}")
+            return jsonify({
+                'error': f"HEART assessment failed: {run_status.last_error}"
+            }), 500
+        elif run_status.status != 'completed':
+            logger.error(f"HEART run ended with status {run_status.status}")
+            return jsonify({
+                'error': "HEART assessment expired. Please try again."
+            }), 500
 
-        # Get the assistant's response
-        messages = client.beta.threads.messages.list(thread_id=thread.id)
+        # Get the assistant's response: the newest message on the thread
+        messages = client.beta.threads.messages.list(thread_id=run.thread_id, order='desc', limit=1)
         logger.info("Retrieved messages from HEART thread")
         
         # Get the last assistant message
@@ -584,7 +981,8 @@ def debug():
         "status": "ok",
         "openai_api_key_set": bool(os.getenv('OPENAI_API_KEY')),
         "port": os.getenv('PORT'),
-        "python_version": os.getenv('PYTHON_VERSION')
+        "python_version": os.getenv('PYTHON_VERSION'),
+        "run_waits": run_waiter.stats()
     })
 
 # Add the remove_references function and update all relevant calls in /HEART/assess
@@ -672,6 +1070,20 @@ def tilt_table_index():
 def tilt_table_static(path):
     return send_from_directory('tilt-table-test', path)
 
+# /process and /batch extract on the request thread. With gthread every web
+# worker runs GUNICORN_THREADS requests at once, so cap the extractions per
+# process and turn the rest away (as the job queue does) instead of letting a
+# burst of uploads pile up PDFs and OCR in memory. A streamed response keeps
+# its slot until the stream is closed.
+TILT_SYNC_SLOTS = int(os.getenv('TILT_SYNC_SLOTS', '2'))       # per gunicorn worker
+_sync_slots = threading.BoundedSemaphore(TILT_SYNC_SLOTS)
+
+def _busy_response():
+    response = jsonify({'error': 'The server is busy. Please try again shortly.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '10'
+    return response
+
 @app.route('/tilt-table-test/process', methods=['POST'])
 def tilt_table_process():
     logger.info("Tilt table PDF process endpoint accessed")
@@ -682,33 +1094,416 @@ def tilt_table_process():
     if not pdf_file.filename.lower().endswith('.pdf'):
         return jsonify({'error': 'Uploaded file must be a PDF.'}), 400
 
+    # Per-stage wall/CPU time (and tracemalloc peaks with TILT_TRACE_MEMORY=1),
+    # returned in a Server-Timing header, logged as one JSON line, and included
+    # in the body when the client asks for it with ?timing=1.
+    timer = StageTimer()
+    include_timing = request.args.get('timing') in ('1', 'true')
+
+    if not _sync_slots.acquire(blocking=False):
+        return _busy_response()
+    slot_held = True
+
+    def _timed_response(body, status=200):
+        timing = timer.as_dict()
+        logger.info("tilt_table_timing %s", json.dumps({'status': status, **timing}))
+        if include_timing:
+            body['timing'] = timing
+        response = jsonify(body)
+        response.status_code = status
+        response.headers['Server-Timing'] = timer.server_timing()
+        return response
+
     try:
-        pdf_bytes = pdf_file.read()
+        with timer.stage('upload'):
+            pdf_bytes = pdf_file.read()
         if len(pdf_bytes) == 0:
             return jsonify({'error': 'Uploaded PDF is empty.'}), 400
 
-        report_text, review_count = process_pdf(pdf_bytes)
+        if request.args.get('stream') in ('1', 'true') or \
+                request.accept_mimetypes.best == 'text/event-stream':
+            response = _tilt_table_stream(pdf_bytes, timer, include_timing)
+            response.call_on_close(_sync_slots.release)
+            slot_held = False
+            return response
 
         # Optional LLM grammar/prose cleanup. Prefers Claude Sonnet (ANTHROPIC_API_KEY),
         # falls back to GPT-4o-mini (OPENAI_API_KEY). The deterministic content (facts,
         # values, [undetermined] markers) is preserved by strict system-prompt rules.
-        anthropic_key = os.getenv('ANTHROPIC_API_KEY')
-        openai_key = os.getenv('OPENAI_API_KEY')
-        if anthropic_key or openai_key:
-            report_text = llm_cleanup_report(
-                report_text,
-                anthropic_api_key=anthropic_key,
-                openai_api_key=openai_key,
-            )
+        # With TILT_CACHE_DIR set, re-uploads of the same PDF are served from disk.
+        report_text, review_count = generate_report(
+            pdf_bytes,
+            anthropic_api_key=os.getenv('ANTHROPIC_API_KEY'),
+            openai_api_key=os.getenv('OPENAI_API_KEY'),
+            timer=timer,
+        )
 
-        return jsonify({'report': report_text, 'review_count': review_count})
+        return _timed_response({'report': report_text, 'review_count': review_count})
 
     except ValueError as e:
         logger.error("Tilt table PDF processing error: %s", str(e))
-        return jsonify({'error': str(e)}), 422
+        return _timed_response({'error': str(e)}, 422)
     except Exception as e:
         logger.error("Unexpected error in tilt table processing: %s", str(e))
-        return jsonify({'error': 'An unexpected error occurred while processing the PDF.'}), 500
+        return _timed_response({'error': 'An unexpected error occurred while processing the PDF.'}, 500)
+    finally:
+        if slot_held:
+            _sync_slots.release()
+
+def _tilt_table_stream(pdf_bytes, timer, include_timing):
+    """
+    Server-sent events for /process?stream=1: 'report' with the deterministic
+    report (and its blocks) as soon as extraction is done, a 'section' event
+    as each LLM-polished block is ready, then 'done' with the final report.
+    See generate_report_stream().
+    Extraction errors still come back as plain JSON with a 4xx/5xx status.
+    """
+    events = generate_report_stream(
+        pdf_bytes,
+        anthropic_api_key=os.getenv('ANTHROPIC_API_KEY'),
+        openai_api_key=os.getenv('OPENAI_API_KEY'),
+        timer=timer,
+    )
+    # Run extraction now, so failures can still change the status code
+    first = next(events)
+    server_timing = timer.server_timing()
+
+    def sse(event):
+        name = event.pop('event')
+        return f"event: {name}\ndata: {json.dumps(event)}\n\n"
+
+    def generate():
+        yield sse(first)
+        for event in events:
+            if event['event'] == 'done':
+                timing = timer.as_dict()
+                logger.info("tilt_table_timing %s", json.dumps({'status': 200, 'stream': True, **timing}))
+                if include_timing:
+                    event['timing'] = timing
+            yield sse(event)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+    # Covers extraction only: headers go out before the cleanup starts
+    response.headers['Server-Timing'] = server_timing
+    return response
+
+# Batch uploads: cap both the number of PDFs and the total uncompressed size so a
+# zip bomb or an oversized backlog can't exhaust worker memory.
+MAX_BATCH_FILES = 50
+MAX_BATCH_BYTES = 200 * 1024 * 1024
+
+def _collect_batch_pdfs():
+    """Gather (name, bytes) pairs from a zip upload or repeated 'pdf' fields."""
+    items = []
+    total = 0
+    for upload in request.files.getlist('pdf') + request.files.getlist('zip'):
+        filename = upload.filename or ''
+        if filename.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(upload.stream)
+            except zipfile.BadZipFile:
+                raise ValueError(f'{filename} is not a valid zip archive.')
+            with archive:
+                for info in archive.infolist():
+                    name = os.path.basename(info.filename)
+                    if info.is_dir() or name.startswith('.') or not name.lower().endswith('.pdf'):
+                        continue
+                    total += info.file_size
+                    if len(items) >= MAX_BATCH_FILES or total > MAX_BATCH_BYTES:
+                        raise ValueError(f'Batch too large. Maximum {MAX_BATCH_FILES} PDFs / '
+                                         f'{MAX_BATCH_BYTES // (1024 * 1024)} MB per upload.')
+                    items.append((name, archive.read(info)))
+        elif filename.lower().endswith('.pdf'):
+            data = upload.read()
+            total += len(data)
+            if len(items) >= MAX_BATCH_FILES or total > MAX_BATCH_BYTES:
+                raise ValueError(f'Batch too large. Maximum {MAX_BATCH_FILES} PDFs / '
+                                 f'{MAX_BATCH_BYTES // (1024 * 1024)} MB per upload.')
+            items.append((filename, data))
+        else:
+            raise ValueError(f'{filename} is not a PDF or zip file.')
+    return items
+
+@app.route('/tilt-table-test/batch', methods=['POST'])
+def tilt_table_batch():
+    logger.info("Tilt table batch endpoint accessed")
+    if not _sync_slots.acquire(blocking=False):
+        return _busy_response()
+    try:
+        items = _collect_batch_pdfs()
+    except (ValueError, zipfile.BadZipFile) as e:
+        _sync_slots.release()
+        return jsonify({'error': str(e)}), 400
+    except Exception:
+        _sync_slots.release()
+        raise
+    if not items:
+        _sync_slots.release()
+        return jsonify({'error': 'No PDF files uploaded.'}), 400
+
+    cleanup = bool(os.getenv('ANTHROPIC_API_KEY') or os.getenv('OPENAI_API_KEY'))
+
+    # One NDJSON line per PDF, written as soon as that PDF finishes (completion
+    # order, not upload order), followed by a summary line.
+    def generate():
+        failed = 0
+        for name, result in process_pdf_batch(items, cleanup=cleanup):
+            if 'error' in result:
+                failed += 1
+            yield json.dumps({'file': name, **result}) + '\n'
+        yield json.dumps({'done': True, 'total': len(items), 'failed': failed}) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                        headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+    response.call_on_close(_sync_slots.release)
+    return response
+
+
+# ─────────────────────────────────────────────────────────────
+# Tilt table background jobs
+# ─────────────────────────────────────────────────────────────
+#
+# POST /tilt-table-test/jobs answers 202 with a job id straight away; a small
+# per-process thread pool runs each job off the request path, so a burst of
+# uploads can't tie up every web worker for the length of a PDF. The thread
+# only does the bookkeeping and the LLM cleanup (network waits): extraction
+# itself runs on the batch process pool, outside the web worker's GIL. Job state lives in one JSON file per job under TILT_JOB_DIR, so the
+# GET / SSE request can land on any gunicorn worker. Results (PHI) are
+# deleted once they have been fetched, or TILT_JOB_TTL_S after they finish if
+# nobody collects them. The upload itself is kept in memory, apart from the
+# temporary copy poppler renders checkbox regions from (system temp dir,
+# removed when extraction ends), as for /process.
+# While the LLM cleanup runs, 'report' already holds the deterministic report.
+#
+# Disabled unless TILT_JOB_DIR is set: job files hold patient reports, so the
+# directory must live on storage approved for PHI (as for TILT_CACHE_DIR).
+# The job routes then answer 404 and the upload page falls back to /process.
+
+TILT_JOB_DIR = os.getenv('TILT_JOB_DIR') or None
+TILT_JOB_WORKERS = int(os.getenv('TILT_JOB_WORKERS', '2'))     # per gunicorn worker
+TILT_JOB_QUEUE = int(os.getenv('TILT_JOB_QUEUE', '8'))         # queued + running, per gunicorn worker
+TILT_JOB_TTL_S = int(os.getenv('TILT_JOB_TTL_S', '3600'))
+TILT_JOB_TIMEOUT_S = int(os.getenv('TILT_JOB_TIMEOUT_S', '300'))
+_JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+_JOB_POLL_S = 0.25
+_JOB_SWEEP_S = 60
+
+_job_pool = ThreadPoolExecutor(max_workers=TILT_JOB_WORKERS, thread_name_prefix='tilt-job')
+_job_slots = threading.BoundedSemaphore(TILT_JOB_QUEUE)
+
+
+def _job_path(job_id):
+    return os.path.join(TILT_JOB_DIR, job_id + '.json')
+
+
+def _write_job(job):
+    """Atomically replace the job's state file."""
+    job['updated'] = time.time()
+    fd, tmp = tempfile.mkstemp(dir=TILT_JOB_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp, _job_path(job['job_id']))
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _delete_job(job_id):
+    try:
+        os.unlink(_job_path(job_id))
+    except OSError:
+        pass
+
+
+def _read_job(job_id):
+    """Current state of a job, or None if unknown/expired (an expired job's file is deleted here)."""
+    if TILT_JOB_DIR is None or not _JOB_ID_RE.match(job_id):
+        return None
+    try:
+        with open(_job_path(job_id)) as f:
+            job = json.load(f)
+    except (OSError, ValueError):
+        return None
+    age = time.time() - job['updated']
+    if job['status'] in ('queued', 'running'):
+        if age <= TILT_JOB_TIMEOUT_S:
+            return job
+        # A job whose worker died (restart, OOM kill) would otherwise stay "running" forever
+        job.update(status='error', error='The job was interrupted. Please upload the PDF again.')
+        age -= TILT_JOB_TIMEOUT_S
+    if age > TILT_JOB_TTL_S:
+        _delete_job(job_id)
+        return None
+    return job
+
+
+def _sweep_jobs():
+    """Delete job files not updated for TILT_JOB_TTL_S (and stray temp files)."""
+    cutoff = time.time() - TILT_JOB_TTL_S
+    try:
+        names = os.listdir(TILT_JOB_DIR)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(TILT_JOB_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def _sweep_jobs_forever():
+    # Results must go at TILT_JOB_TTL_S even if no request ever touches the
+    # job store again; every web worker runs one of these on the shared dir.
+    while True:
+        time.sleep(_JOB_SWEEP_S)
+        _sweep_jobs()
+
+
+if TILT_JOB_DIR:
+    threading.Thread(target=_sweep_jobs_forever, name='tilt-job-sweep', daemon=True).start()
+
+
+def _run_job(job, pdf_bytes):
+    def on_stage(name):
+        if name != job['stage']:
+            job['stage'] = name
+            job['stages'].append(name)
+            _write_job(job)
+
+    timer = StageTimer(on_stage=on_stage)
+    try:
+        job['status'] = 'running'
+        _write_job(job)
+        for event in generate_report_stream(
+            pdf_bytes,
+            anthropic_api_key=os.getenv('ANTHROPIC_API_KEY'),
+            openai_api_key=os.getenv('OPENAI_API_KEY'),
+            timer=timer,
+            use_pool=True,
+        ):
+            if event['event'] == 'report' and event['cleanup']:
+                # Publish the deterministic report while the LLM polishes it
+                job.update(report=event['report'], review_count=event['review_count'])
+                _write_job(job)
+            elif event['event'] == 'done':
+                job.update(status='done', report=event['report'], review_count=event['review_count'])
+    except ValueError as e:
+        logger.error("Tilt table job %s failed: %s", job['job_id'], str(e))
+        job.update(status='error', error=str(e))
+    except Exception as e:
+        logger.error("Unexpected error in tilt table job %s: %s", job['job_id'], str(e))
+        job.update(status='error', error='An unexpected error occurred while processing the PDF.')
+    finally:
+        _job_slots.release()
+        job['stage'] = None
+        job['timing'] = timer.as_dict()
+        logger.info("tilt_table_timing %s", json.dumps({'job_id': job['job_id'], 'status': job['status'],
+                                                        **job['timing']}))
+        _write_job(job)
+
+
+def _job_view(job):
+    """Public JSON for a job: timing only on request, internal bookkeeping dropped."""
+    view = {k: v for k, v in job.items() if k not in ('timing', 'updated')}
+    if request.args.get('timing') in ('1', 'true') and 'timing' in job:
+        view['timing'] = job['timing']
+    return view
+
+
+@app.route('/tilt-table-test/jobs', methods=['POST'])
+def tilt_table_job_submit():
+    logger.info("Tilt table job submit endpoint accessed")
+    if TILT_JOB_DIR is None:
+        return jsonify({'error': 'Background jobs are not enabled on this server.'}), 404
+    if 'pdf' not in request.files:
+        return jsonify({'error': 'No PDF file uploaded.'}), 400
+
+    pdf_file = request.files['pdf']
+    if not pdf_file.filename.lower().endswith('.pdf'):
+        return jsonify({'error': 'Uploaded file must be a PDF.'}), 400
+    pdf_bytes = pdf_file.read()
+    if len(pdf_bytes) == 0:
+        return jsonify({'error': 'Uploaded PDF is empty.'}), 400
+
+    # Bounded backlog: refuse rather than queue work nobody will wait for
+    if not _job_slots.acquire(blocking=False):
+        return _busy_response()
+
+    try:
+        os.makedirs(TILT_JOB_DIR, mode=0o700, exist_ok=True)
+        _sweep_jobs()
+        job_id = uuid.uuid4().hex
+        job = {'job_id': job_id, 'status': 'queued', 'stage': None, 'stages': [],
+               'created': time.time()}
+        _write_job(job)
+        _job_pool.submit(_run_job, job, pdf_bytes)
+    except Exception:
+        _job_slots.release()
+        raise
+
+    response = jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f'/tilt-table-test/jobs/{job_id}',
+        'events_url': f'/tilt-table-test/jobs/{job_id}/events',
+    })
+    response.status_code = 202
+    response.headers['Location'] = f'/tilt-table-test/jobs/{job_id}'
+    return response
+
+
+@app.route('/tilt-table-test/jobs/<job_id>', methods=['GET'])
+def tilt_table_job_status(job_id):
+    """Job state; a finished job's result is handed out once and then deleted."""
+    job = _read_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job.'}), 404
+    if job['status'] in ('done', 'error'):
+        _delete_job(job_id)
+    response = jsonify(_job_view(job))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@app.route('/tilt-table-test/jobs/<job_id>/events', methods=['GET'])
+def tilt_table_job_events(job_id):
+    """
+    Server-sent events: a 'stage' event as each pipeline stage starts, then
+    one 'done' or 'error' event carrying the same JSON as the status route
+    (after which the job is deleted, as it is by the status route).
+    The stream holds a web worker while it is open; under the sync worker
+    class, clients that don't need live stages should poll the status route.
+    """
+    if _read_job(job_id) is None:
+        return jsonify({'error': 'Unknown or expired job.'}), 404
+
+    def generate():
+        seen = 0
+        deadline = time.time() + TILT_JOB_TIMEOUT_S + 5
+        while time.time() < deadline:
+            job = _read_job(job_id)
+            if job is None:
+                yield 'event: error\ndata: {"error": "Unknown or expired job."}\n\n'
+                return
+            for name in job['stages'][seen:]:
+                yield f'event: stage\ndata: {json.dumps({"stage": name})}\n\n'
+            seen = len(job['stages'])
+            if job['status'] in ('done', 'error'):
+                yield f"event: {job['status']}\ndata: {json.dumps(_job_view(job))}\n\n"
+                _delete_job(job_id)
+                return
+            time.sleep(_JOB_POLL_S)
+        yield 'event: error\ndata: {"error": "Timed out waiting for the job."}\n\n'
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
 
 
 # ─────────────────────────────────────────────────────────────
@@ -732,6 +1527,10 @@ if __name__ == '__main__':
     try:
         # Initialize HEART database
         initialize_heart_db()
+
+        # Under gunicorn this runs from the post_fork hook instead
+        if os.getenv('TILT_WARM_UP', '1') != '0':
+            warm_up()
         
         # Get port from environment variable or default to 8081
         port = int(os.environ.get('PORT', 8081))
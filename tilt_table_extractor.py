@@ -9,9 +9,14 @@ REDCap PDF format notes (from real PDF analysis):
 - All checkbox/radio options are ALWAYS printed regardless of selection state.
   The PDF is flattened — no AcroForm fields, and all rects are fill=False.
   Multi-select checkbox values cannot be reliably determined from text alone.
-- Checkbox detection uses pdf2image + PIL pixel analysis: each option's
-  checkbox region (to the left of the label text) is cropped and checked
-  for pixel darkness. A marked checkbox has significantly more dark pixels.
+- Checkbox detection reads the PDF vector layer first: each option's
+  checkbox region (to the left of the label text) is checked for drawn
+  marks — dark fills, strokes crossing the box, check glyphs. Boxes the
+  vector layer can't settle (images, stray glyphs, partial fills) fall
+  back to poppler (pdftoppm) + pixel-darkness analysis, where a marked
+  checkbox has significantly more dark pixels. Options are located from
+  the word layer first, so poppler only renders pages holding an
+  undecided box, clipped to those boxes.
 - Text fields (MRN, demographics, duration, frequency etc.) use consistent
   label text that we can match with targeted regexes.
 - For checkbox groups whose option labels collide (e.g. yes/no questions,
@@ -25,12 +30,35 @@ Output format: a flowing narrative under three headings:
   Recommendation — diagnosis-specific clinical recommendation
 
 Any field that cannot be confidently extracted is rendered as [undetermined].
+
+Bulk re-generation outside Flask:
+  python -m tilt_table_extractor <dir-or-files> --jobs N --out <dir>
 """
 
 import re
+import bisect
+import functools
+import concurrent.futures
+import multiprocessing
+import threading
+import queue
+import numpy as np
 import pdfplumber
 import io
+import os
+import shutil
+import subprocess
+import tempfile
 import logging
+import time
+import tracemalloc
+import contextlib
+import json
+import hashlib
+import inspect
+import types
+import sys
+import argparse
 
 logger = logging.getLogger(__name__)
 
@@ -56,22 +84,8 @@ def _has(val):
     return s != _UNDETERMINED
 
 
-def _field(text, *patterns, label="field"):
-    """
-    Try each regex pattern in order; return first non-empty match group(1),
-    or [undetermined] on failure.
-    """
-    for pat in patterns:
-        m = re.search(pat, text, re.IGNORECASE | re.DOTALL)
-        if m:
-            val = m.group(1).strip()
-            if val and val.lower() not in ("", "n/a", "none", "unknown", "______"):
-                return val
-    return _UNDETERMINED
-
-
 # ─────────────────────────────────────────────────────────────
-# Checkbox OCR detection (pdf2image + PIL pixel analysis)
+# Checkbox OCR detection (poppler + PIL pixel analysis)
 # ─────────────────────────────────────────────────────────────
 
 # Each entry defines a checkbox group:
@@ -325,179 +339,531 @@ _CHECKBOX_FIELDS = {
 
 
 def _build_word_text(words):
-    """Return (joined_text, char_to_word_idx_map) for a list of pdfplumber words."""
+    """Return (joined_text, word_start_offsets) for a list of pdfplumber words."""
     parts = []
-    char_to_word = {}
+    word_starts = []
     pos = 0
     for i, w in enumerate(words):
         if i > 0:
             parts.append(" ")
             pos += 1
-        text = w["text"]
-        for c in range(len(text)):
-            char_to_word[pos + c] = i
-        parts.append(text)
-        pos += len(text)
-    return "".join(parts), char_to_word
+        word_starts.append(pos)
+        parts.append(w["text"])
+        pos += len(w["text"])
+    return "".join(parts), word_starts
+
+
+def _phrase_tokens(phrase):
+    return tuple(t.lower() for t in re.findall(r"[A-Za-z0-9]+", phrase))
 
 
-def _find_anchor_word_index(words, phrase):
+def _build_anchor_table():
     """
-    Find first word index where the anchor phrase begins.
-    Phrase is matched as a regex against the joined word text;
-    whitespace and hyphens between phrase tokens are tolerated.
+    Tokenise every anchor / stop_anchor phrase in _CHECKBOX_FIELDS once and
+    bucket them by first token, so a page can be scanned for all of them in
+    a single pass over its words.
     """
-    tokens = re.findall(r"[A-Za-z0-9]+", phrase)
-    if not tokens:
-        return None
-    pat = r"\b" + r"[\s\-]+".join(re.escape(t) for t in tokens) + r"\b"
+    phrases = {
+        cfg[key]
+        for cfg in _CHECKBOX_FIELDS.values()
+        for key in ("anchor", "stop_anchor")
+        if cfg.get(key)
+    }
+    table = {}
+    for phrase in sorted(phrases):
+        tokens = _phrase_tokens(phrase)
+        if tokens:
+            table.setdefault(tokens[0], []).append((phrase, tokens))
+    return table
 
-    text, char_to_word = _build_word_text(words)
-    m = re.search(pat, text, re.IGNORECASE)
-    if not m:
-        return None
-    return char_to_word.get(m.start())
 
+_ANCHORS_BY_FIRST_TOKEN = _build_anchor_table()
+_WORD_RUN_RE = re.compile(r"\w+")
+_ANCHOR_GAP_RE = re.compile(r"[\s\-]+")
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]")
+
+
+class _PageWordIndex:
+    """
+    Per-page word index, built once. Every anchor phrase is matched in one
+    pass: each phrase token must equal a whole word-character run of the
+    joined page text (case-insensitive), and consecutive tokens may only be
+    separated by whitespace and hyphens.
 
-def _find_option_position(words, option_text, start_idx=0, end_idx=None):
+    Also holds each word's normalised (lowercase alphanumeric) token and an
+    inverted token → ascending word positions map for option lookup.
     """
-    Locate an option label within a slice of the page word list.
+
+    def __init__(self, words):
+        self.words = words
+        text, word_starts = _build_word_text(words)
+
+        self.norm_words = [_NON_ALNUM_RE.sub("", w["text"].lower()) for w in words]
+        self.token_positions = {}
+        for i, nt in enumerate(self.norm_words):
+            self.token_positions.setdefault(nt, []).append(i)
+
+        runs = [(m.group().lower(), m.start(), m.end()) for m in _WORD_RUN_RE.finditer(text)]
+        self.anchor_positions = {}   # phrase → ascending word indices where it begins
+        for i, (tok, run_start, _) in enumerate(runs):
+            for phrase, tokens in _ANCHORS_BY_FIRST_TOKEN.get(tok, ()):
+                if i + len(tokens) > len(runs):
+                    continue
+                matched = all(
+                    runs[i + k][0] == tokens[k]
+                    and _ANCHOR_GAP_RE.fullmatch(text, runs[i + k - 1][2], runs[i + k][1])
+                    for k in range(1, len(tokens))
+                )
+                if matched:
+                    word_idx = bisect.bisect_right(word_starts, run_start) - 1
+                    self.anchor_positions.setdefault(phrase, []).append(word_idx)
+
+    def field_ranges(self):
+        """
+        Map each _CHECKBOX_FIELDS field whose anchor is on this page to its
+        (start_idx, end_idx) word range: from the first anchor occurrence up to
+        the first stop_anchor occurrence after it (or the end of the page).
+        Fields without an anchor span the whole page.
+        """
+        ranges = {}
+        n = len(self.words)
+        for field_name, cfg in _CHECKBOX_FIELDS.items():
+            if not cfg.get("anchor"):
+                ranges[field_name] = (0, n)
+                continue
+            hits = self.anchor_positions.get(cfg["anchor"])
+            if not hits:
+                continue  # anchor not on this page, skip field
+            start_idx, end_idx = hits[0], n
+            if cfg.get("stop_anchor"):
+                stops = self.anchor_positions.get(cfg["stop_anchor"], [])
+                j = bisect.bisect_left(stops, start_idx + 1)
+                if j < len(stops):
+                    end_idx = stops[j]
+            ranges[field_name] = (start_idx, end_idx)
+        return ranges
+
+
+@functools.lru_cache(maxsize=None)
+def _option_tokens(option_text):
+    """
+    Normalised match tokens for an option label: strip trailing blanks/
+    underscores, take the first two tokens of length ≥ 2, and drop
+    non-alphanumerics from each.
+    """
+    clean = re.sub(r"[\s_]+$", "", option_text).strip().lower()
+    raw_tokens = [t for t in clean.split() if len(t) >= 2][:2]
+    return tuple(_NON_ALNUM_RE.sub("", t) for t in raw_tokens)
+
+
+def _find_option_position(index, option_text, start_idx=0, end_idx=None):
+    """
+    Locate an option label within a word range of a page's _PageWordIndex.
     Returns (x0, top, bottom) of the first matching word, or None.
 
-    Matching: strip trailing blanks/underscores, take the first two tokens of
-    length ≥ 2. The first token must equal a normalised word; if a second
+    Matching: the first option token must equal a normalised word; if a second
     token exists, it must appear within the next four words (loose proximity).
+    Candidate words come from the index's token → positions map, so only
+    words that already equal the first token are ever examined.
     """
+    words = index.words
     if end_idx is None:
         end_idx = len(words)
 
-    clean = re.sub(r"[\s_]+$", "", option_text).strip().lower()
-    raw_tokens = [t for t in clean.split() if len(t) >= 2][:2]
-    if not raw_tokens:
+    tokens = _option_tokens(option_text)
+    if not tokens:
         return None
 
-    # Normalize tokens (strip non-alphanumerics for comparison)
-    tokens = [re.sub(r"[^a-z0-9]", "", t) for t in raw_tokens]
-
-    for i in range(start_idx, end_idx):
-        wt = re.sub(r"[^a-z0-9]", "", words[i]["text"].lower())
-        if wt == tokens[0]:
-            if len(tokens) > 1:
-                nearby = []
-                for k in range(i + 1, min(i + 5, end_idx)):
-                    nt = re.sub(r"[^a-z0-9]", "", words[k]["text"].lower())
-                    if nt:
-                        nearby.append(nt)
-                if tokens[1] not in nearby:
-                    continue
-            return (words[i]["x0"], words[i]["top"], words[i]["bottom"])
+    positions = index.token_positions.get(tokens[0], ())
+    for j in range(bisect.bisect_left(positions, start_idx), len(positions)):
+        i = positions[j]
+        if i >= end_idx:
+            break
+        if len(tokens) > 1:
+            nearby = [nt for nt in index.norm_words[i + 1:min(i + 5, end_idx)] if nt]
+            if tokens[1] not in nearby:
+                continue
+        return (words[i]["x0"], words[i]["top"], words[i]["bottom"])
 
     return None
 
 
-def _ocr_checkboxes(pdf_bytes):
+# Checkbox OCR render settings. Pages are streamed from poppler as 8-bit
+# grayscale one at a time, so peak memory is one clipped page regardless of
+# page count; TILT_OCR_DPI can raise the resolution within a 512 MB instance.
+_OCR_DPI = int(os.getenv("TILT_OCR_DPI", "120"))
+_OCR_RENDER_TIMEOUT_S = 60
+_OCR_MAX_PAGE_GAP = 2           # render through up to this many option-free pages rather than respawn poppler
+
+# Detection mode (TILT_OCR_MODE):
+#   auto   — decide from the PDF vector layer; rasterise only ambiguous boxes
+#   vector — vector layer only; ambiguous boxes count as unmarked (no poppler)
+#   raster — always rasterise (the pre-vector behaviour)
+_OCR_MODE = os.getenv("TILT_OCR_MODE", "auto").lower()
+_VECTOR_MARKED_FILL = 0.30      # dark fill covering this much of the box core = marked
+_VECTOR_MIN_FILL = 0.05         # below this a fill is noise; in between is ambiguous
+_VECTOR_MAX_MARK = 20.0         # pt; longer strokes / larger fills are rules or shading, not marks
+_CHECK_GLYPHS = frozenset("✓✔✗✘☑☒■●◼⬛Xx×")
+_BOX_GLYPHS = frozenset("☐□▢❏❐❑❒")
+_OCR_DARK_THRESHOLD = 160       # pixel value below this counts as "dark"
+_OCR_MARKED_RATIO = 0.18        # fraction of dark pixels that implies a mark
+
+
+def _checkbox_probes(parsed_page):
+    """
+    Locate every _CHECKBOX_FIELDS option on a page using only its word layer.
+    Returns a list of (field_name, option, box) where box is the inner
+    checkbox region (x0, top, x1, bottom) in PDF points.
+    """
+    index = parsed_page.word_index
+    probes = []
+
+    for field_name, (start_idx, end_idx) in index.field_ranges().items():
+        cfg = _CHECKBOX_FIELDS[field_name]
+        for option in cfg["options"]:
+            pos = _find_option_position(index, option, start_idx=start_idx, end_idx=end_idx)
+            if pos is None:
+                continue
+
+            x0, y0, y1 = pos
+
+            # Checkbox sits immediately left of the label text.
+            # REDCap checkbox: ~9pt square, ~2-3pt gap before text.
+            # We crop the INNER region of the box (skipping its 1px border)
+            # so that empty boxes don't read as "marked" purely from their
+            # outline — at 120 DPI a full crop is otherwise dominated by
+            # border ink (~17%, just under the marked threshold).
+            y_h = max(1.0, y1 - y0)
+            y_mid = (y0 + y1) / 2.0
+            cb_x0 = max(0.0, x0 - 13)
+            cb_x1 = max(0.0, x0 - 5)
+            cb_y0 = max(0.0, y_mid - y_h * 0.30)
+            cb_y1 = min(parsed_page.height, y_mid + y_h * 0.30)
+            probes.append((field_name, option, (cb_x0, cb_y0, cb_x1, cb_y1)))
+
+    return probes
+
+
+def _dark_pixel_integral(img):
+    """
+    Threshold a rendered image into dark/light pixels and return its
+    summed-area table, padded with a leading zero row and column so that
+    sat[y, x] is the dark-pixel count of the region above and left of (x, y).
+    """
+    gray = img if isinstance(img, np.ndarray) else np.asarray(img.convert("L"))
+    dark = gray < _OCR_DARK_THRESHOLD
+    # int32 holds any page's pixel count and halves the table's footprint
+    sat = np.zeros((dark.shape[0] + 1, dark.shape[1] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(dark, axis=0), axis=1, out=sat[1:, 1:])
+    return sat
+
+
+def _dark_ratios(sat, boxes):
+    """
+    Dark-pixel ratio for each (x0, y0, x1, y1) pixel box, scored in one
+    vectorised summed-area-table lookup. Boxes are clamped to the image;
+    empty boxes score NaN.
     """
-    Render each PDF page (120 DPI to fit Render Starter memory budget) and
-    determine checkbox state by pixel-darkness analysis of the small region
-    immediately left of each option label.
+    if not boxes:
+        return np.empty(0)
+    h, w = sat.shape[0] - 1, sat.shape[1] - 1
+    b = np.asarray(boxes, dtype=np.int64)
+    x0, x1 = np.clip(b[:, 0], 0, w), np.clip(b[:, 2], 0, w)
+    y0, y1 = np.clip(b[:, 1], 0, h), np.clip(b[:, 3], 0, h)
+    area = np.maximum(x1 - x0, 0) * np.maximum(y1 - y0, 0)
+    dark = sat[y1, x1] - sat[y0, x1] - sat[y1, x0] + sat[y0, x0]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(area > 0, dark / area, np.nan)
+
+
+# ─────────────────────────────────────────────────────────────
+# Vector-layer checkbox detection (no rendering)
+# ─────────────────────────────────────────────────────────────
+
+def _is_dark(color):
+    """True if a pdfplumber colour (None = default black, gray/RGB/CMYK tuple) would read as ink."""
+    if color is None:
+        return True
+    if not isinstance(color, (tuple, list)) or not all(isinstance(c, (int, float)) for c in color):
+        return True     # pattern / named colour space — assume ink, as the renderer would show it
+    if len(color) == 1:
+        luminance = color[0]
+    elif len(color) == 3:
+        luminance = 0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2]
+    elif len(color) == 4:
+        c, m, y, k = color
+        luminance = (1 - k) * (1 - (0.299 * c + 0.587 * m + 0.114 * y))
+    else:
+        return True
+    return luminance * 255 < _OCR_DARK_THRESHOLD
+
+
+def _box_array(rows):
+    return np.asarray(rows, dtype=float).reshape(-1, 4)
+
+
+class _VectorLayer:
+    """
+    A page's drawn objects as numpy arrays of (x0, top, x1, bottom) boxes or
+    (xa, ya, xb, yb) segments, in PDF points from the page top:
+      fills        — dark filled rects / curves
+      strokes      — dark stroked line, curve and rect-side segments
+      outlines     — stroked rects the size of a checkbox (candidate box outlines)
+      mark_chars   — glyphs that are check marks (✓, ✗, X, ■ ...)
+      box_chars    — glyphs that draw an empty box (☐, □ ...)
+      other_chars  — any other glyph (could be either, so ambiguous)
+      images       — embedded images (content unknown without rendering)
+    Objects larger than a checkbox mark are dropped: table rules and
+    shading pass through boxes without meaning anything.
+    """
+
+    def __init__(self, page):
+        fills, strokes, outlines = [], [], []
+        for obj in page.rects + page.curves + page.lines:
+            if obj.get("fill") and _is_dark(obj.get("non_stroking_color")):
+                if max(obj["x1"] - obj["x0"], obj["bottom"] - obj["top"]) <= _VECTOR_MAX_MARK:
+                    fills.append((obj["x0"], obj["top"], obj["x1"], obj["bottom"]))
+            if obj.get("stroke", True) and _is_dark(obj.get("stroking_color")):
+                if obj["object_type"] == "rect":
+                    x0, top, x1, bottom = obj["x0"], obj["top"], obj["x1"], obj["bottom"]
+                    pts = [(x0, top), (x1, top), (x1, bottom), (x0, bottom), (x0, top)]
+                    if 4.0 <= min(x1 - x0, bottom - top) and max(x1 - x0, bottom - top) <= _VECTOR_MAX_MARK:
+                        outlines.append((x0, top, x1, bottom))
+                else:
+                    pts = obj.get("pts") or []
+                for (xa, ya), (xb, yb) in zip(pts, pts[1:]):
+                    if np.hypot(xb - xa, yb - ya) <= _VECTOR_MAX_MARK:
+                        strokes.append((xa, ya, xb, yb))
+
+        mark_chars, box_chars, other_chars = [], [], []
+        for ch in page.chars:
+            text = ch["text"]
+            if not text.strip():
+                continue
+            bbox = (ch["x0"], ch["top"], ch["x1"], ch["bottom"])
+            if text in _CHECK_GLYPHS:
+                mark_chars.append(bbox)
+            elif text in _BOX_GLYPHS:
+                box_chars.append(bbox)
+            else:
+                other_chars.append(bbox)
+
+        self.fills = _box_array(fills)
+        self.strokes = _box_array(strokes)
+        self.outlines = _box_array(outlines)
+        self.mark_chars = _box_array(mark_chars)
+        self.box_chars = _box_array(box_chars)
+        self.other_chars = _box_array(other_chars)
+        self.images = _box_array([(im["x0"], im["top"], im["x1"], im["bottom"])
+                                  for im in page.images])
+
+
+def _boxes_overlap(boxes, box):
+    """True if any of the (N, 4) boxes overlaps box with positive area."""
+    if not len(boxes):
+        return False
+    x0, y0, x1, y1 = box
+    return bool(np.any((boxes[:, 0] < x1) & (boxes[:, 2] > x0) &
+                       (boxes[:, 1] < y1) & (boxes[:, 3] > y0)))
+
+
+def _segments_cross(segments, box, interior=False):
+    """
+    True if any of the (N, 4) segments passes through box (vectorised
+    Liang–Barsky clip). With interior=True a segment must cross the box's
+    interior: running along or touching its boundary doesn't count.
+    """
+    if not len(segments):
+        return False
+    xa, ya, xb, yb = segments.T
+    dx, dy = xb - xa, yb - ya
+    t0 = np.zeros(len(segments))
+    t1 = np.ones(len(segments))
+    hit = np.ones(len(segments), dtype=bool)
+    for p, q in ((-dx, xa - box[0]), (dx, box[2] - xa), (-dy, ya - box[1]), (dy, box[3] - ya)):
+        parallel = p == 0
+        hit &= ~(parallel & ((q <= 0) if interior else (q < 0)))
+        r = q / np.where(parallel, 1.0, p)
+        t0 = np.where(~parallel & (p < 0), np.maximum(t0, r), t0)
+        t1 = np.where(~parallel & (p > 0), np.minimum(t1, r), t1)
+    return bool(np.any(hit & ((t0 < t1) if interior else (t0 <= t1))))
+
+
+def _on_outlines(segments, outlines, tol=0.5):
+    """Mask of the (N, 4) segments that lie along a side of one of the outline rects."""
+    on = np.zeros(len(segments), dtype=bool)
+    xa, ya, xb, yb = segments.T
+    horizontal = np.abs(yb - ya) <= tol
+    vertical = np.abs(xb - xa) <= tol
+    for x0, top, x1, bottom in outlines:
+        within_x = (np.minimum(xa, xb) >= x0 - tol) & (np.maximum(xa, xb) <= x1 + tol)
+        within_y = (np.minimum(ya, yb) >= top - tol) & (np.maximum(ya, yb) <= bottom + tol)
+        on |= horizontal & within_x & ((np.abs(ya - top) <= tol) | (np.abs(ya - bottom) <= tol))
+        on |= vertical & within_y & ((np.abs(xa - x0) <= tol) | (np.abs(xa - x1) <= tol))
+    return on
+
+
+def _vector_checkbox_state(layer, box):
+    """
+    Decide one checkbox from the vector layer alone.
+    box is the probe's inner checkbox region in PDF points (as returned by
+    _checkbox_probes). Returns True (marked), False (empty) or None when
+    the vector evidence is ambiguous and the box needs rasterising.
+    """
+    x0, y0, x1, y1 = box
+    # The probe can clip the box outline; its core stays clear of it.
+    mx, my = (x1 - x0) * 0.25, (y1 - y0) * 0.15
+    core = (x0 + mx, y0 + my, x1 - mx, y1 - my)
+    core_area = (core[2] - core[0]) * (core[3] - core[1])
+    if core_area <= 0:
+        return None
+
+    if _boxes_overlap(layer.images, box):
+        return None
+    if _boxes_overlap(layer.mark_chars, core):
+        return True
+    if _boxes_overlap(layer.other_chars, core):
+        return None
+
+    # The box's own outline is not a mark, wherever the probe window puts it:
+    # boxes sit 2-4pt from their label and are 8-9pt wide, so a side can run
+    # through the core
+    strokes = layer.strokes
+    if len(strokes) and len(layer.outlines):
+        o = layer.outlines
+        around_probe = o[(o[:, 0] < x1) & (o[:, 2] > x0) & (o[:, 1] < y1) & (o[:, 3] > y0)]
+        if len(around_probe):
+            strokes = strokes[~_on_outlines(strokes, around_probe)]
+
+    coverage = 0.0
+    if len(layer.fills):
+        f = layer.fills
+        w = np.clip(np.minimum(f[:, 2], core[2]) - np.maximum(f[:, 0], core[0]), 0, None)
+        h = np.clip(np.minimum(f[:, 3], core[3]) - np.maximum(f[:, 1], core[1]), 0, None)
+        coverage = min(1.0, float((w * h).sum()) / core_area)
+    if coverage >= _VECTOR_MARKED_FILL or _segments_cross(strokes, core, interior=True):
+        return True
+    if coverage >= _VECTOR_MIN_FILL:
+        return None
+
+    # Nothing inside: only call it empty if the box itself is drawn in the
+    # vector layer — otherwise it may be an image or an unusual glyph.
+    around = (x0 - 2, y0 - 2, x1 + 2, y1 + 2)
+    if (_segments_cross(layer.strokes, around) or _boxes_overlap(layer.box_chars, around)
+            or _boxes_overlap(layer.fills, around)):
+        return False
+    return None
+
+
+def _ocr_checkboxes(doc, stats=None):
+    """
+    Determine the state of every _CHECKBOX_FIELDS option.
+
+    Options are located from the word layer first. Each box is then decided
+    from the PDF vector layer where it can be (see _vector_checkbox_state —
+    no rendering at all); only ambiguous boxes, or every box with
+    TILT_OCR_MODE=raster, fall back to pixel-darkness analysis of the small
+    region immediately left of the option label.
+
+    For the raster fallback, only pages holding an undecided box are
+    rendered, and each is clipped to the bounding box of those boxes, so
+    most of the page is never rasterised.
+    Pages stream from poppler in grayscale and are scored and released one
+    at a time.
+    Each rendered region is thresholded once into a summed-area table and all
+    of its boxes are scored in a single vectorised lookup.
 
     An unchecked REDCap box shows only a thin border outline (very few dark
     pixels). A checked box contains a filled mark (significantly more dark
     pixels).
 
+    doc:   a _ParsedDocument (raw PDF bytes are also accepted and parsed here).
+    stats: optional dict; "ocr_vector", "ocr_pages", "ocr_crops" and
+           "ocr_renders" are incremented by the number of boxes decided from
+           the vector layer, pages rendered, boxes scored from pixels and
+           poppler processes started.
+
     Returns dict mapping field_name → formatted string value, or None for
-    fields where the options couldn't be located on any page.
+    fields where the options couldn't be located on any page, or where a box
+    needed rendering and poppler couldn't render it.
     """
-    try:
-        from pdf2image import convert_from_bytes
-    except ImportError:
-        logger.warning("pdf2image not installed — checkbox OCR unavailable")
-        return {}
+    if not isinstance(doc, _ParsedDocument):
+        with _ParsedDocument(doc) as parsed:
+            return _ocr_checkboxes(parsed, stats)
 
-    DPI = 120
-    SCALE = DPI / 72.0           # PDF points → image pixels
-    DARK_THRESHOLD = 160         # pixel value below this counts as "dark"
-    MARKED_RATIO = 0.18          # fraction of dark pixels that implies a mark
+    scale = _OCR_DPI / 72.0      # PDF points → image pixels
 
     found_checked = {f: [] for f in _CHECKBOX_FIELDS}
     found_on_page = {f: set() for f in _CHECKBOX_FIELDS}
+    marked = []         # (page_number, probe index, field, option), sorted into reading order below
+
+    page_probes = {}
+    for parsed_page in doc.pages:
+        page_number = parsed_page.page_number
+        probes = []
+        for idx, (field_name, option, box) in enumerate(_checkbox_probes(parsed_page)):
+            found_on_page[field_name].add(option)
+            if _OCR_MODE != "raster":
+                state = _vector_checkbox_state(parsed_page.vector_layer, box)
+                if state is not None or _OCR_MODE == "vector":
+                    if stats is not None:
+                        stats["ocr_vector"] = stats.get("ocr_vector", 0) + 1
+                    if state:
+                        marked.append((page_number, idx, field_name, option))
+                    continue
+            px0, py0, px1, py1 = (int(v * scale) for v in box)
+            if px1 <= px0 or py1 <= py0:
+                continue
+            probes.append((idx, field_name, option, (px0, py0, px1, py1)))
+        if probes:
+            page_probes[page_number] = probes
+        # pages whose boxes were all decided from the vector layer are never rendered
+
+    regions = [
+        (page_number, (
+            min(b[0] for *_, b in probes),
+            min(b[1] for *_, b in probes),
+            max(b[2] for *_, b in probes),
+            max(b[3] for *_, b in probes),
+        ))
+        for page_number, probes in page_probes.items()
+    ]
 
-    # Poppler may not be on the server's PATH (homebrew / Render image variations).
-    import shutil
-    poppler_path = None
-    for candidate in ["/opt/homebrew/bin", "/usr/local/bin", "/usr/bin"]:
-        if shutil.which("pdftoppm", path=candidate):
-            poppler_path = candidate
-            break
-
-    try:
-        images = convert_from_bytes(pdf_bytes, dpi=DPI, poppler_path=poppler_path)
-    except Exception as e:
-        logger.warning("pdf2image conversion failed: %s", e)
-        return {}
-
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-        for page, img in zip(pdf.pages, images):
-            words = page.extract_words(x_tolerance=5, y_tolerance=5)
-
-            for field_name, cfg in _CHECKBOX_FIELDS.items():
-                # Determine search range using anchor + optional stop_anchor
-                start_idx = 0
-                end_idx = len(words)
-
-                if cfg.get("anchor"):
-                    ai = _find_anchor_word_index(words, cfg["anchor"])
-                    if ai is None:
-                        continue  # anchor not on this page, skip field
-                    start_idx = ai
-                    if cfg.get("stop_anchor"):
-                        sub_words = words[start_idx + 1:]
-                        si = _find_anchor_word_index(sub_words, cfg["stop_anchor"])
-                        if si is not None:
-                            end_idx = start_idx + 1 + si
-
-                for option in cfg["options"]:
-                    pos = _find_option_position(words, option, start_idx=start_idx, end_idx=end_idx)
-                    if pos is None:
-                        continue
-
-                    x0, y0, y1 = pos
-                    found_on_page[field_name].add(option)
-
-                    # Checkbox sits immediately left of the label text.
-                    # REDCap checkbox: ~9pt square, ~2-3pt gap before text.
-                    # We crop the INNER region of the box (skipping its 1px border)
-                    # so that empty boxes don't read as "marked" purely from their
-                    # outline — at 120 DPI a full crop is otherwise dominated by
-                    # border ink (~17%, just under the marked threshold).
-                    y_h = max(1.0, y1 - y0)
-                    y_mid = (y0 + y1) / 2.0
-                    cb_x0 = max(0.0, x0 - 13)
-                    cb_x1 = max(0.0, x0 - 5)
-                    cb_y0 = max(0.0, y_mid - y_h * 0.30)
-                    cb_y1 = min(page.height, y_mid + y_h * 0.30)
-
-                    px0, px1 = int(cb_x0 * SCALE), int(cb_x1 * SCALE)
-                    py0, py1 = int(cb_y0 * SCALE), int(cb_y1 * SCALE)
-
-                    if px1 <= px0 or py1 <= py0:
-                        continue
-
-                    crop = img.crop((px0, py0, px1, py1))
-                    gray = crop.convert("L")
-                    pixels = list(gray.getdata())
-                    if not pixels:
-                        continue
-
-                    dark_count = sum(1 for p in pixels if p < DARK_THRESHOLD)
-                    if dark_count / len(pixels) >= MARKED_RATIO:
-                        if option not in found_checked[field_name]:
-                            found_checked[field_name].append(option)
+    rendered = set()
+    for page_number, gray, (off_x, off_y) in doc.iter_regions(regions, _OCR_DPI, stats):
+        probes = page_probes[page_number]
+        rendered.add(page_number)
+        if stats is not None:
+            stats["ocr_pages"] = stats.get("ocr_pages", 0) + 1
+            stats["ocr_crops"] = stats.get("ocr_crops", 0) + len(probes)
+
+        # Threshold the rendered region once; every box is then an O(1) lookup
+        sat = _dark_pixel_integral(gray)
+        boxes = [(px0 - off_x, py0 - off_y, px1 - off_x, py1 - off_y)
+                 for *_, (px0, py0, px1, py1) in probes]
+        ratios = _dark_ratios(sat, boxes)
+        del gray, sat   # release before poppler streams the next page
+
+        for (idx, field_name, option, _), ratio in zip(probes, ratios):
+            if not np.isnan(ratio) and ratio >= _OCR_MARKED_RATIO:
+                marked.append((page_number, idx, field_name, option))
+
+    # poppler unavailable or failed part-way: fields with a box on a page that
+    # wasn't rendered stay undetermined; vector-decided fields still stand
+    unrendered = {field_name
+                  for page_number, probes in page_probes.items() if page_number not in rendered
+                  for _, field_name, _, _ in probes}
+    if unrendered:
+        logger.warning("Checkbox regions not rendered; %d field(s) left undetermined", len(unrendered))
+
+    for _, _, field_name, option in sorted(marked):
+        if option not in found_checked[field_name]:
+            found_checked[field_name].append(option)
 
     # Build result strings
     results = {}
     for field_name, cfg in _CHECKBOX_FIELDS.items():
-        if not found_on_page[field_name]:
+        if not found_on_page[field_name] or field_name in unrendered:
             results[field_name] = None  # caller will use [undetermined]
             continue
 
@@ -515,306 +881,916 @@ def _ocr_checkboxes(pdf_bytes):
 
 
 # ─────────────────────────────────────────────────────────────
-# PDF text extraction
+# Parsed document (one pdfplumber parse shared by every stage)
 # ─────────────────────────────────────────────────────────────
 
-def extract_text_from_pdf(pdf_bytes):
-    """Extract all text from a PDF given as bytes, preserving layout."""
-    text_parts = []
-    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text(x_tolerance=3, y_tolerance=3)
-            if page_text:
-                text_parts.append(page_text)
-    return "\n".join(text_parts)
+class _ParsedPage:
+    """
+    One pdfplumber page with its text and word layers extracted on first use
+    and cached, so every stage reuses the same parse and char clustering.
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.page_number = page.page_number
+        self.width = page.width
+        self.height = page.height
+        self._words = None
+        self._text = None
+        self._word_index = None
+        self._vector_layer = None
+
+    @property
+    def chars(self):
+        return self.page.chars
+
+    @property
+    def words(self):
+        """Words clustered for checkbox-label lookup (x/y tolerance 5)."""
+        if self._words is None:
+            self._words = self.page.extract_words(x_tolerance=5, y_tolerance=5)
+        return self._words
+
+    @property
+    def word_index(self):
+        """_PageWordIndex over the words, with all checkbox anchors resolved."""
+        if self._word_index is None:
+            self._word_index = _PageWordIndex(self.words)
+        return self._word_index
+
+    @property
+    def vector_layer(self):
+        """Drawn marks (fills, strokes, glyphs, images) for vector checkbox detection."""
+        if self._vector_layer is None:
+            self._vector_layer = _VectorLayer(self.page)
+        return self._vector_layer
+
+    @property
+    def text(self):
+        """Layout text used by the field regexes (x/y tolerance 3)."""
+        if self._text is None:
+            self._text = self.page.extract_text(x_tolerance=3, y_tolerance=3) or ""
+        return self._text
+
+
+class _ParsedDocument:
+    """
+    A PDF upload parsed once with pdfplumber. Holds the per-page chars, words
+    and text, plus a lazy raster handle so poppler is only invoked if (and
+    when) checkbox OCR needs a page region.
+
+    Use as a context manager, or call close(), to release the pdfplumber handle.
+    """
+
+    def __init__(self, pdf_bytes):
+        self.pdf_bytes = pdf_bytes
+        self._pdf = pdfplumber.open(io.BytesIO(pdf_bytes))
+        self.pages = [_ParsedPage(p) for p in self._pdf.pages]
+        self._tmp_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._pdf.close()
+        if self._tmp_path is not None:
+            try:
+                os.remove(self._tmp_path)
+            except OSError:
+                pass
+            self._tmp_path = None
+
+    @property
+    def text(self):
+        return "\n".join(p.text for p in self.pages if p.text)
+
+    def _source_path(self):
+        """Write the upload to a temp file once so poppler can read it per page."""
+        if self._tmp_path is None:
+            fd, path = tempfile.mkstemp(suffix=".pdf")
+            with os.fdopen(fd, "wb") as f:
+                f.write(self.pdf_bytes)
+            self._tmp_path = path
+        return self._tmp_path
+
+    def iter_regions(self, regions, dpi, stats=None):
+        """
+        Render [(page_number, clip), ...] with poppler, yielding
+        (page_number, gray ndarray, (offset_x, offset_y)) one page at a time;
+        clip is (x0, y0, x1, y1) in output pixels and the offset is the clip
+        origin in full-page pixels.
+
+        Nearby pages share one pdftoppm process (one PDF parse) rendering the
+        union of their clips as 8-bit grayscale to stdout. Each page is read
+        off the pipe only when the caller asks for it, so at most one page is
+        in memory however long the document is. Stops early (yielding fewer
+        pages than requested) if poppler is unavailable or fails.
+        """
+        pdftoppm = _pdftoppm_path()
+        if pdftoppm is None:
+            logger.warning("poppler (pdftoppm) not found — checkbox OCR unavailable")
+            return
+
+        regions = sorted(regions)
+        runs = []
+        for page_number, clip in regions:
+            if runs and page_number - runs[-1][-1][0] <= _OCR_MAX_PAGE_GAP + 1:
+                runs[-1].append((page_number, clip))
+            else:
+                runs.append([(page_number, clip)])
+
+        for run in runs:
+            first, last = run[0][0], run[-1][0]
+            off_x = min(c[0] for _, c in run)
+            off_y = min(c[1] for _, c in run)
+            x1 = max(c[2] for _, c in run)
+            y1 = max(c[3] for _, c in run)
+            wanted = {page_number for page_number, _ in run}
+            cmd = [pdftoppm, "-gray", "-r", str(dpi), "-f", str(first), "-l", str(last),
+                   "-x", str(off_x), "-y", str(off_y),
+                   "-W", str(x1 - off_x), "-H", str(y1 - off_y),
+                   self._source_path()]
+            if stats is not None:
+                stats["ocr_renders"] = stats.get("ocr_renders", 0) + 1
+
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            watchdog = threading.Timer(_OCR_RENDER_TIMEOUT_S, proc.kill)
+            watchdog.start()
+            try:
+                for page_number in range(first, last + 1):
+                    gray = _read_pgm(proc.stdout)
+                    if gray is None:
+                        proc.wait()
+                        logger.warning("poppler render of pages %d-%d failed (exit %s)",
+                                       first, last, proc.returncode)
+                        return
+                    if page_number in wanted:
+                        yield page_number, gray, (off_x, off_y)
+                    del gray
+            finally:
+                watchdog.cancel()
+                proc.stdout.close()
+                if proc.poll() is None:
+                    proc.kill()
+                proc.wait()
+
+
+def _read_pgm(stream):
+    """
+    Read one binary PGM (P5, 8-bit) image from a pdftoppm stdout stream.
+    Returns a (height, width) uint8 array, or None at end of stream / on a
+    malformed header.
+    """
+    tokens = []
+    while len(tokens) < 4:
+        line = stream.readline()
+        if not line:
+            return None
+        tokens += line.split(b"#", 1)[0].split()
+    if tokens[0] != b"P5" or int(tokens[3]) > 255:
+        return None
+    width, height = int(tokens[1]), int(tokens[2])
+    data = stream.read(width * height)
+    if len(data) < width * height:
+        return None
+    return np.frombuffer(data, dtype=np.uint8).reshape(height, width)
+
+
+@functools.lru_cache(maxsize=1)
+def _pdftoppm_path():
+    """
+    Locate poppler's pdftoppm (not always on the server's PATH: homebrew / Render image variations).
+    Resolved once per process.
+    """
+    for candidate in ["/opt/homebrew/bin", "/usr/local/bin", "/usr/bin"]:
+        found = shutil.which("pdftoppm", path=candidate)
+        if found:
+            return found
+    return shutil.which("pdftoppm")
 
 
 # ─────────────────────────────────────────────────────────────
-# Field extraction
+# PDF text extraction
 # ─────────────────────────────────────────────────────────────
 
-def extract_fields(text, ocr_results=None):
+def extract_text_from_pdf(pdf):
     """
-    Parse REDCap PDF text into a structured dict of clinical fields.
-    Any unconfident field is the [undetermined] string.
-
-    ocr_results: optional dict from _ocr_checkboxes(); its values replace the
-                 [undetermined] placeholder for checkbox fields when present.
+    Extract all text from a PDF, preserving layout.
+    pdf: raw PDF bytes, or a _ParsedDocument to reuse its cached page text.
     """
-    d = {}
-    ocr = ocr_results or {}
+    if isinstance(pdf, _ParsedDocument):
+        return pdf.text
+    with _ParsedDocument(pdf) as doc:
+        return doc.text
 
-    # ── Patient demographics ──────────────────────────────────
-    d["first_name"] = "<HMS-Patient_FirstName>"
 
-    # Attempt to extract last name from common REDCap name field formats.
-    # Try broadest variety of label/format combinations first.
-    d["last_name"] = _field(
-        text,
-        # "Surname Smith" or "Patient surname Smith" (space-separated, no colon — REDCap flattened)
-        r"(?:Patient\s+)?[Ss]urname\s+([A-Za-z''\-]{2,})",
-        # "Last name: Smith" or "Last Name Smith"
-        r"[Ll]ast\s+[Nn]ame[:\s]+([A-Za-z''\-]{2,})",
-        # "Family name Smith" or "Family Name: Smith"
-        r"[Ff]amily\s+[Nn]ame[:\s]+([A-Za-z''\-]{2,})",
-        # "Name: Smith, John" or "Patient Name Smith," — last name before comma
-        r"(?:Patient\s+)?Name[:\s]+([A-Za-z''\-]{2,})\s*,",
-        # "Participant: Smith, John"
-        r"Participant[:\s]+([A-Za-z''\-]{2,})\s*,",
-        label="last_name"
-    )
-    # Title-case the extracted name (REDCap may store it all-caps or all-lowercase)
-    if d["last_name"] and d["last_name"] != _UNDETERMINED:
-        d["last_name"] = d["last_name"].capitalize()
-    else:
-        d["last_name"] = None
+# ─────────────────────────────────────────────────────────────
+# Unit normalisers
+# ─────────────────────────────────────────────────────────────
 
-    d["mrn"] = _field(
-        text,
-        r"(?:Eastern\s+Health\s+)?MRN[:\s#]*([0-9A-Za-z\-]+)",
-        r"(?:Medical\s+Record\s+Number|URN)[:\s]*([0-9A-Za-z\-]+)",
-        label="MRN"
-    )
+def _normalise_unit(raw):
+    r = raw.lower().rstrip("s") + "s"
+    if r in ("years", "months", "weeks", "days"):
+        return r
+    return raw
 
-    d["dob"] = _field(
-        text,
-        r"Date\s+of\s+birth\s+([\d/\-\.]+)",
-        r"D(?:ate\s+of\s+)?[Bb]irth[:\s]+([\d/\-\.]+)",
-        label="DOB"
-    )
 
-    d["age"] = _field(
-        text,
-        r"Age\s+\(years?\)\s+(\d{1,3})",
-        r"\bAge[:\s]+(\d{1,3})\b",
-        label="age"
-    )
+def _unit_to_frequency(unit_str, count_str=None):
+    """Convert a count + unit to a qualitative frequency word: daily/weekly/monthly/rarely."""
+    unit_lower = unit_str.lower()
 
-    d["sex"] = _field(
-        text,
-        r"\bSex\s+(Female|Male)\b",
-        r"\bSex[:\s]+(Female|Male|Non-binary|Other)\b",
-        label="sex"
-    )
+    count = 1
+    if count_str and count_str not in ("", "______"):
+        try:
+            count = int(count_str)
+        except (ValueError, TypeError):
+            count = 1
 
-    d["height"] = _field(
-        text,
-        r"Height\s+\(cm\)\s+([\d.]+)",
-        r"Height[:\s]+([\d.]+\s*(?:cm|m))",
-        label="height"
-    )
+    # Approximate weekly rate for bucketing
+    per_week = {
+        "day": count * 7,
+        "week": count,
+        "month": count / 4.33,
+        "year": count / 52,
+    }.get(unit_lower, count)
 
-    d["weight"] = _field(
-        text,
-        r"Weight\s+\(kilogram[^)]*\)\s+([\d.]+)",
-        r"Weight[:\s]+([\d.]+\s*(?:kg|lbs?))",
-        label="weight"
-    )
+    if per_week >= 6:
+        return "daily"
+    if per_week >= 1:
+        return "weekly"
+    if per_week >= 0.2:
+        return "monthly"
+    return "rarely"
 
-    d["bmi"] = _field(
-        text,
-        r"\bBMI\s+([\d.]+)",
-        label="BMI"
-    )
 
-    # ── Symptom onset ─────────────────────────────────────────
-    _DUR_VAL = r"(______|\d+(?:\.\d+)?)"
-    _DUR_UNIT = r"(______|Years?|Months?|Weeks?|Days?)"
-    onset_m = re.search(
-        r"Symptom\s+onset\s+\([^)]+\)\s+" + _DUR_VAL + r"\s+" + _DUR_UNIT
-        + r"(?:\s+" + _DUR_VAL + r"\s+" + _DUR_UNIT + r")?",
-        text, re.IGNORECASE
-    )
-    d["duration_number"] = None
-    d["duration_unit"] = None
-    d["presyncope_duration_number"] = None
-    d["presyncope_duration_unit"] = None
-    if onset_m:
-        sn, su = onset_m.group(1), onset_m.group(2)
-        pn, pu = onset_m.group(3), onset_m.group(4)
-        if sn and sn != "______" and su and su != "______":
-            d["duration_number"] = sn
-            d["duration_unit"] = _normalise_unit(su.lower())
-        if pn and pn != "______" and pu and pu != "______":
-            d["presyncope_duration_number"] = pn
-            d["presyncope_duration_unit"] = _normalise_unit(pu.lower())
-
-    # ── Frequency ─────────────────────────────────────────────
-    _FREQ_COUNT = r"(______|\d+(?:-\d+)?)"
-    _FREQ_UNIT = r"(______|Month|Week|Day|Year)"
-    freq_m = re.search(
-        r"Frequency\s+of\s+events\s+\([^)]+\)\s+" + _FREQ_COUNT + r"\s+" + _FREQ_UNIT
-        + r"(?:\s+" + _FREQ_COUNT + r"\s+" + _FREQ_UNIT + r")?",
-        text, re.IGNORECASE
-    )
-    d["frequency"] = None
-    d["presyncope_frequency"] = None
-    if freq_m:
-        sc, su = freq_m.group(1), freq_m.group(2)
-        pc, pu = freq_m.group(3), freq_m.group(4)
-        if sc and sc != "______" and su and su != "______":
-            d["frequency"] = _unit_to_frequency(su, sc)
-        if pc and pc != "______" and pu and pu != "______":
-            d["presyncope_frequency"] = _unit_to_frequency(pu, pc)
-
-    # ── Episode counts ────────────────────────────────────────
-    ep_m = re.search(
-        r"Number\s+of\s+episodes\s+in\s+the\s+last\s+month\??\s+(______|\d+)(?:\s+(______|\d+))?",
-        text, re.IGNORECASE
-    )
-    d["syncope_episodes_last_month"] = None
-    d["presyncope_episodes_last_month"] = None
-    if ep_m:
-        s = ep_m.group(1)
-        p = ep_m.group(2) if ep_m.group(2) else None
-        if s and s != "______":
-            d["syncope_episodes_last_month"] = s
-        if p and p != "______":
-            d["presyncope_episodes_last_month"] = p
-
-    # ── Most recent date ──────────────────────────────────────
-    d["most_recent_date"] = _field(
-        text,
-        r"Date\s+of\s+most\s+recent\s+episode\??\s+([\d]{1,2}[/\-\.]\d{1,2}[/\-\.]\d{2,4})",
-        r"Most\s+[Rr]ecent[:\s]+([\d/\-\.]+(?:\s+\d{4})?)",
-        label="most_recent_episode_date"
-    )
+# ─────────────────────────────────────────────────────────────
+# Field value parsers (match object → field value, None = reject)
+# ─────────────────────────────────────────────────────────────
 
-    # ── Initiating life event free text ───────────────────────
-    ile_m = re.search(
-        r"Known\s+initiating\s+life\s+event\?[^\n]*\n?[^\n]*Yes\s+([\w][^\n]{2,80}?)(?:\n|If\s+YES)",
-        text, re.IGNORECASE
-    )
-    d["initiating_event_detail"] = ile_m.group(1).strip() if ile_m else None
+def _group1(m):
+    return m.group(1).strip()
 
-    # ── Menstrual correlation free text ───────────────────────
-    mc_m = re.search(
-        r"correlation\s+with\s+the\s+menstrual\s+cycle\?[^\n]*\n?[^\n]*Yes\s+([\w][^\n]{2,80}?)(?:\n|Do\s+you)",
-        text, re.IGNORECASE
-    )
-    if mc_m:
-        candidate = mc_m.group(1).strip()
-        if candidate and "_" not in candidate and not candidate.startswith("__"):
-            d["menstrual_detail"] = candidate
-        else:
-            d["menstrual_detail"] = None
-    else:
-        d["menstrual_detail"] = None
-
-    # ── Other observations free text (page 3 final question) ─
-    # The label runs across two lines and is followed by underscores; if
-    # any user-supplied text is present it appears between the underscores
-    # and the page footer. Reject anything matching the REDCap footer pattern.
-    obs_m = re.search(
-        r"Anything\s+else\s+you\s+have\s+observed[^\n]*?(?:\n[^\n]*?)?_+\s*([^\n_][^\n]{2,200}?)(?:\n|$)",
-        text, re.IGNORECASE
-    )
-    if obs_m:
-        candidate = obs_m.group(1).strip()
-        if (
-            candidate
-            and "projectredcap" not in candidate.lower()
-            and not re.match(r"^\d{1,2}/\d{1,2}/\d{2,4}", candidate)
-            and "_" not in candidate[:30]
-        ):
-            d["other_observations"] = candidate
-        else:
-            d["other_observations"] = None
-    else:
-        d["other_observations"] = None
-
-    # ── Family history Q29 (free text after Yes) ─────────────
-    # The detail may appear on the same line as the question, OR on a following
-    # line (REDCap wraps "Yes <detail>" beneath "No" when the answer is yes).
-    fh_yes_m = re.search(
-        r"Family\s+history\s+of\s+hypotension[^?]*\?\s*"
-        r"(?:No\s*)?"
-        r"Yes\s+([^\n]+?)(?:\n\s*30\)|\n\s*Family\s+history\s+of\.\.\.|\n)",
-        text, re.IGNORECASE | re.DOTALL
-    )
-    if fh_yes_m:
-        detail = fh_yes_m.group(1).strip()
-        if detail and "_" not in detail and detail.lower() not in ("", "n/a"):
-            d["family_history"] = f"remarkable for {_lc_first(detail)}"
-        else:
-            d["family_history"] = "unremarkable"
-    elif re.search(r"Family\s+history\s+of\s+hypotension[^?]*\?\s*No\s*\n", text, re.IGNORECASE):
-        d["family_history"] = "unremarkable"
-    else:
-        d["family_history"] = None
 
-    # ── Other medications free text (Q40) ─────────────────────
-    om_m = re.search(
-        r"List\s+any\s+other\s+relevant\s+medications\s+([^\n]+?)(?:\n|$)",
-        text, re.IGNORECASE
-    )
-    if om_m:
-        val = om_m.group(1).strip()
-        if val and not val.startswith("_") and val.lower() not in ("none", "n/a", "nil"):
-            d["other_medications"] = val
-        else:
-            d["other_medications"] = None
-    else:
-        d["other_medications"] = None
+def _raw_group1(m):
+    return m.group(1)
 
-    # ── Investigation free-text comments (page 6) ────────────
-    inv_comm_m = re.search(
-        r"Additional\s+comments\s*\n?\s*([^\n_][^\n]{2,200}?)(?:\n|$)",
-        text, re.IGNORECASE
-    )
-    d["investigation_comments"] = inv_comm_m.group(1).strip() if inv_comm_m else None
+
+def _int_group1(m):
+    return int(m.group(1))
+
+
+def _filled(v):
+    """True if a REDCap blank-capable value was actually filled in."""
+    return bool(v) and v != "______"
+
+
+def _parse_onset(m):
+    sn, su, pn, pu = m.group(1), m.group(2), m.group(3), m.group(4)
+    d = dict.fromkeys(_ONSET_KEYS)
+    if _filled(sn) and _filled(su):
+        d["duration_number"] = sn
+        d["duration_unit"] = _normalise_unit(su.lower())
+    if _filled(pn) and _filled(pu):
+        d["presyncope_duration_number"] = pn
+        d["presyncope_duration_unit"] = _normalise_unit(pu.lower())
+    return d
+
+
+def _parse_frequency(m):
+    sc, su, pc, pu = m.group(1), m.group(2), m.group(3), m.group(4)
+    d = dict.fromkeys(_FREQUENCY_KEYS)
+    if _filled(sc) and _filled(su):
+        d["frequency"] = _unit_to_frequency(su, sc)
+    if _filled(pc) and _filled(pu):
+        d["presyncope_frequency"] = _unit_to_frequency(pu, pc)
+    return d
+
+
+def _parse_episodes(m):
+    s = m.group(1)
+    p = m.group(2) if m.group(2) else None
+    d = dict.fromkeys(_EPISODE_KEYS)
+    if _filled(s):
+        d["syncope_episodes_last_month"] = s
+    if _filled(p):
+        d["presyncope_episodes_last_month"] = p
+    return d
+
+
+def _parse_menstrual_detail(m):
+    candidate = m.group(1).strip()
+    if candidate and "_" not in candidate and not candidate.startswith("__"):
+        return candidate
+    return None
+
+
+def _parse_other_observations(m):
+    # Reject anything matching the REDCap footer pattern
+    candidate = m.group(1).strip()
+    if (
+        candidate
+        and "projectredcap" not in candidate.lower()
+        and not re.match(r"^\d{1,2}/\d{1,2}/\d{2,4}", candidate)
+        and "_" not in candidate[:30]
+    ):
+        return candidate
+    return None
+
+
+def _parse_family_history(m):
+    detail = m.groupdict().get("detail")
+    if detail is None:
+        return "unremarkable"   # explicit "No" answer
+    detail = detail.strip()
+    if detail and "_" not in detail and detail.lower() not in ("", "n/a"):
+        return f"remarkable for {_lc_first(detail)}"
+    return "unremarkable"
+
+
+def _parse_other_medications(m):
+    val = m.group(1).strip()
+    if val and not val.startswith("_") and val.lower() not in ("none", "n/a", "nil"):
+        return val
+    return None
+
+
+def _parse_results_conclusion(m):
+    # Reject the "Results table" heading or underscore-only blank boxes
+    cand = m.group(1).strip()
+    if (
+        cand
+        and not cand.lower().startswith("results table")
+        and not cand.startswith("_")
+        and "projectredcap" not in cand.lower()
+    ):
+        return cand
+    return None
+
+
+def _parse_phase_readings(m):
+    """Extract (systolic_bp, hr) tuples from a results-table phase block."""
+    readings = []
+    for rm in _READING_ROW_RE.finditer(m.group(0)):
+        sbp, hr = int(rm.group(1)), int(rm.group(2))
+        if 40 <= sbp <= 250 and 20 <= hr <= 250:
+            readings.append((sbp, hr))
+    return readings
+
+
+def _parse_phase2_notes(m):
+    raw_note = re.sub(r"\s*projectredcap\.org\s*", " ", m.group(1))
+    clean_tokens = [t for t in raw_note.split() if not re.search(r"\d", t)]
+    return " ".join(clean_tokens).strip()
+
+
+def _none_if_blank_line(v):
+    return None if v.startswith("_") else v
+
+
+# ─────────────────────────────────────────────────────────────
+# Field spec registry
+# ─────────────────────────────────────────────────────────────
+
+# Values that mean a REDCap text field was left blank
+_BLANK_VALUES = frozenset(("", "n/a", "none", "unknown", "______"))
+
+_ONSET_KEYS = (
+    "duration_number", "duration_unit",
+    "presyncope_duration_number", "presyncope_duration_unit",
+)
+_FREQUENCY_KEYS = ("frequency", "presyncope_frequency")
+_EPISODE_KEYS = ("syncope_episodes_last_month", "presyncope_episodes_last_month")
+
+_READING_ROW_RE = re.compile(r"(\d{2,3})\s+(\d{2,3})\s*$", re.MULTILINE)
+
+_DUR_VAL = r"(______|\d+(?:\.\d+)?)"
+_DUR_UNIT = r"(______|Years?|Months?|Weeks?|Days?)"
+_FREQ_COUNT = r"(______|\d+(?:-\d+)?)"
+_FREQ_UNIT = r"(______|Month|Week|Day|Year)"
+
+# Each entry defines one regex-extracted text field (or field group):
+#   name       — key in the fields dict (a group label when `keys` is set)
+#   section    — _SectionIndex section searched (see _SECTION_MARKERS)
+#   patterns   — regexes tried in order; the first accepted value wins
+#   flags      — re flags for the patterns (default IGNORECASE | DOTALL)
+#   value      — optional: match → value, None rejects it (default: group 1, stripped)
+#   reject     — optional: lowercase values treated as blank and skipped
+#   normalise  — optional: applied to the accepted value
+#   default    — value when no pattern is accepted (default [undetermined])
+#   keys       — optional: value is a dict that fills several fields at once
+#   match      — optional: "last" uses the final match in the text, not the first
+_FIELD_SPECS = [
+    # ── Patient demographics ──────────────────────────────────
+    {
+        # Try broadest variety of REDCap name label/format combinations first.
+        "name": "last_name",
+        "section": "demographics",
+        "patterns": [
+            # "Surname Smith" or "Patient surname Smith" (space-separated, no colon — REDCap flattened)
+            r"(?:Patient\s+)?[Ss]urname\s+([A-Za-z''\-]{2,})",
+            # "Last name: Smith" or "Last Name Smith"
+            r"[Ll]ast\s+[Nn]ame[:\s]+([A-Za-z''\-]{2,})",
+            # "Family name Smith" or "Family Name: Smith"
+            r"[Ff]amily\s+[Nn]ame[:\s]+([A-Za-z''\-]{2,})",
+            # "Name: Smith, John" or "Patient Name Smith," — last name before comma
+            r"(?:Patient\s+)?Name[:\s]+([A-Za-z''\-]{2,})\s*,",
+            # "Participant: Smith, John"
+            r"Participant[:\s]+([A-Za-z''\-]{2,})\s*,",
+        ],
+        "reject": _BLANK_VALUES,
+        # Title-case the extracted name (REDCap may store it all-caps or all-lowercase)
+        "normalise": str.capitalize,
+        "default": None,
+    },
+    {
+        "name": "mrn",
+        "section": "demographics",
+        "patterns": [
+            r"(?:Eastern\s+Health\s+)?MRN[:\s#]*([0-9A-Za-z\-]+)",
+            r"(?:Medical\s+Record\s+Number|URN)[:\s]*([0-9A-Za-z\-]+)",
+        ],
+        "reject": _BLANK_VALUES,
+    },
+    {
+        "name": "dob",
+        "section": "demographics",
+        "patterns": [
+            r"Date\s+of\s+birth\s+([\d/\-\.]+)",
+            r"D(?:ate\s+of\s+)?[Bb]irth[:\s]+([\d/\-\.]+)",
+        ],
+        "reject": _BLANK_VALUES,
+    },
+    {
+        "name": "age",
+        "section": "demographics",
+        "patterns": [
+            r"Age\s+\(years?\)\s+(\d{1,3})",
+            r"\bAge[:\s]+(\d{1,3})\b",
+        ],
+        "reject": _BLANK_VALUES,
+    },
+    {
+        "name": "sex",
+        "section": "demographics",
+        "patterns": [
+            r"\bSex\s+(Female|Male)\b",
+            r"\bSex[:\s]+(Female|Male|Non-binary|Other)\b",
+        ],
+        "reject": _BLANK_VALUES,
+    },
+    {
+        "name": "height",
+        "section": "demographics",
+        "patterns": [
+            r"Height\s+\(cm\)\s+([\d.]+)",
+            r"Height[:\s]+([\d.]+\s*(?:cm|m))",
+        ],
+        "reject": _BLANK_VALUES,
+    },
+    {
+        "name": "weight",
+        "section": "demographics",
+        "patterns": [
+            r"Weight\s+\(kilogram[^)]*\)\s+([\d.]+)",
+            r"Weight[:\s]+([\d.]+\s*(?:kg|lbs?))",
+        ],
+        "reject": _BLANK_VALUES,
+    },
+    {
+        "name": "bmi",
+        "section": "demographics",
+        "patterns": [r"\bBMI\s+([\d.]+)"],
+        "reject": _BLANK_VALUES,
+    },
+
+    # ── Symptom onset, frequency, episode counts ─────────────
+    {
+        "name": "onset",
+        "section": "history",
+        "keys": _ONSET_KEYS,
+        "patterns": [
+            r"Symptom\s+onset\s+\([^)]+\)\s+" + _DUR_VAL + r"\s+" + _DUR_UNIT
+            + r"(?:\s+" + _DUR_VAL + r"\s+" + _DUR_UNIT + r")?",
+        ],
+        "flags": re.IGNORECASE,
+        "value": _parse_onset,
+    },
+    {
+        "name": "frequency",
+        "section": "history",
+        "keys": _FREQUENCY_KEYS,
+        "patterns": [
+            r"Frequency\s+of\s+events\s+\([^)]+\)\s+" + _FREQ_COUNT + r"\s+" + _FREQ_UNIT
+            + r"(?:\s+" + _FREQ_COUNT + r"\s+" + _FREQ_UNIT + r")?",
+        ],
+        "flags": re.IGNORECASE,
+        "value": _parse_frequency,
+    },
+    {
+        "name": "episodes",
+        "section": "history",
+        "keys": _EPISODE_KEYS,
+        "patterns": [
+            r"Number\s+of\s+episodes\s+in\s+the\s+last\s+month\??\s+(______|\d+)(?:\s+(______|\d+))?",
+        ],
+        "flags": re.IGNORECASE,
+        "value": _parse_episodes,
+    },
+    {
+        "name": "most_recent_date",
+        "section": "history",
+        "patterns": [
+            r"Date\s+of\s+most\s+recent\s+episode\??\s+([\d]{1,2}[/\-\.]\d{1,2}[/\-\.]\d{2,4})",
+            r"Most\s+[Rr]ecent[:\s]+([\d/\-\.]+(?:\s+\d{4})?)",
+        ],
+        "reject": _BLANK_VALUES,
+    },
+
+    # ── Free-text answers ─────────────────────────────────────
+    {
+        "name": "initiating_event_detail",
+        "section": "history",
+        "patterns": [
+            r"Known\s+initiating\s+life\s+event\?[^\n]*\n?[^\n]*Yes\s+([\w][^\n]{2,80}?)(?:\n|If\s+YES)",
+        ],
+        "flags": re.IGNORECASE,
+        "default": None,
+    },
+    {
+        "name": "menstrual_detail",
+        "section": "activity",
+        "patterns": [
+            r"correlation\s+with\s+the\s+menstrual\s+cycle\?[^\n]*\n?[^\n]*Yes\s+([\w][^\n]{2,80}?)(?:\n|Do\s+you)",
+        ],
+        "flags": re.IGNORECASE,
+        "value": _parse_menstrual_detail,
+        "default": None,
+    },
+    {
+        # Page 3 final question. The label runs across two lines and is
+        # followed by underscores; any user-supplied text appears between the
+        # underscores and the page footer.
+        "name": "other_observations",
+        "section": "activity",
+        "patterns": [
+            r"Anything\s+else\s+you\s+have\s+observed[^\n]*?(?:\n[^\n]*?)?_+\s*([^\n_][^\n]{2,200}?)(?:\n|$)",
+        ],
+        "flags": re.IGNORECASE,
+        "value": _parse_other_observations,
+        "default": None,
+    },
+    {
+        # Q29 — the detail may appear on the same line as the question, OR on
+        # a following line (REDCap wraps "Yes <detail>" beneath "No").
+        "name": "family_history",
+        "section": "medical_history",
+        "patterns": [
+            r"Family\s+history\s+of\s+hypotension[^?]*\?\s*"
+            r"(?:No\s*)?"
+            r"Yes\s+(?P<detail>[^\n]+?)(?:\n\s*30\)|\n\s*Family\s+history\s+of\.\.\.|\n)",
+            r"Family\s+history\s+of\s+hypotension[^?]*\?\s*No\s*\n",
+        ],
+        "value": _parse_family_history,
+        "default": None,
+    },
+    {
+        # Q40
+        "name": "other_medications",
+        "section": "medical_history",
+        "patterns": [r"List\s+any\s+other\s+relevant\s+medications\s+([^\n]+?)(?:\n|$)"],
+        "flags": re.IGNORECASE,
+        "value": _parse_other_medications,
+        "default": None,
+    },
+    {
+        # Page 6
+        "name": "investigation_comments",
+        "section": "medical_history",
+        "patterns": [r"Additional\s+comments\s*\n?\s*([^\n_][^\n]{2,200}?)(?:\n|$)"],
+        "flags": re.IGNORECASE,
+        "default": None,
+    },
 
     # ── Page 7 free text fields ───────────────────────────────
-    d["baseline_rhythm"] = _field(
-        text,
-        r"Baseline\s+Rhythm\s+([^\n]+?)\s+Recovery\s+Blood",
-        r"Baseline\s+Rhythm\s+([^\n]+)",
-        label="baseline_rhythm"
-    )
-    if d["baseline_rhythm"] == _UNDETERMINED:
-        d["baseline_rhythm"] = None
-    elif d["baseline_rhythm"].startswith("_"):
-        d["baseline_rhythm"] = None
-
-    # Results Conclusion is a free-text box. In a blank PDF it shows only
-    # underscores, then "Results table" heading. We capture only NON-underscore
-    # NON-heading content. Reject if candidate is "Results table" or starts
-    # with whitespace/underscores only.
-    rc_m = re.search(
-        r"Results\s+Conclusion\s*\n_+\s*\n([^\n]+)",
-        text, re.IGNORECASE
-    )
-    if rc_m:
-        cand = rc_m.group(1).strip()
-        if (
-            cand
-            and not cand.lower().startswith("results table")
-            and not cand.startswith("_")
-            and "projectredcap" not in cand.lower()
-        ):
-            d["results_conclusion"] = cand
+    {
+        "name": "baseline_rhythm",
+        "section": "results",
+        "patterns": [
+            r"Baseline\s+Rhythm\s+([^\n]+?)\s+Recovery\s+Blood",
+            r"Baseline\s+Rhythm\s+([^\n]+)",
+        ],
+        "reject": _BLANK_VALUES,
+        "normalise": _none_if_blank_line,
+        "default": None,
+    },
+    {
+        # Free-text box. In a blank PDF it shows only underscores, then the
+        # "Results table" heading.
+        "name": "results_conclusion",
+        "section": "results",
+        "patterns": [r"Results\s+Conclusion\s*\n_+\s*\n([^\n]+)"],
+        "flags": re.IGNORECASE,
+        "value": _parse_results_conclusion,
+        "default": None,
+    },
+
+    # ── BP/HR table ───────────────────────────────────────────
+    {
+        "name": "baseline_hr",
+        "section": "results",
+        "patterns": [r"Baseline\s+Heart\s+Rate\s+(\d+)"],
+        "flags": re.IGNORECASE,
+        "value": _int_group1,
+        "default": None,
+    },
+    {
+        "name": "baseline_bp",
+        "section": "results",
+        "patterns": [
+            r"Baseline\s+Blood\s+Pressure\s+(\d+/\d+)",
+            r"Baseline\s+Blood\s+Pressure\s+(\d{2,3})\b",
+        ],
+        "reject": _BLANK_VALUES,
+        "default": None,
+    },
+    {
+        "name": "recovery_hr",
+        "section": "results",
+        "patterns": [r"Recovery\s+Heart\s+Rate\s+(\d+)"],
+        "flags": re.IGNORECASE,
+        "value": _int_group1,
+        "default": None,
+    },
+    {
+        "name": "recovery_bp",
+        "section": "results",
+        "patterns": [r"Recovery\s+Blood\s+Pressure\s+([\d/]+)"],
+        "flags": re.IGNORECASE,
+        "value": _raw_group1,
+        "default": None,
+    },
+    {
+        "name": "control_readings",
+        "section": "results",
+        "patterns": [r"Control\s+Tilting.*?(?=Phase\s+2|Phase\s+Stage|$)"],
+        "value": _parse_phase_readings,
+        "default": [],
+    },
+    {
+        "name": "phase2_readings",
+        "section": "results",
+        "patterns": [r"Phase\s+2\s+Phase\s+2\s+Baseline.*?(?=Phase\s+Stage|Results\s+Conclusion|$)"],
+        "value": _parse_phase_readings,
+        "default": [],
+    },
+
+    # ── Clinician notes ───────────────────────────────────────
+    {
+        "name": "control_notes",
+        "section": "results",
+        "patterns": [
+            r"^(?!Any\s+symptoms)(?!Phase)([A-Z][^\n]{9,120}?)[ \t]+Control[ \t]+\d+[ \t]+minute\b",
+        ],
+        "flags": re.IGNORECASE | re.MULTILINE,
+        "default": "",
+    },
+    {
+        "name": "phase2_notes",
+        "section": "results",
+        "patterns": [r"Any\s+symptoms\?[^\n]*\n([^\n]+)\n\s*Phase\s+2\s+10\s+minute"],
+        "flags": re.IGNORECASE,
+        "value": _parse_phase2_notes,
+        "default": "",
+    },
+    {
+        "name": "phase2_stop_minute",
+        "section": "results",
+        "patterns": [r"Phase\s+2\s+(\d+)\s+minute\s+(\d{2,3})\s+(\d{2,3})"],
+        "flags": re.IGNORECASE,
+        "match": "last",
+        "value": _int_group1,
+        "default": None,
+    },
+]
+
+
+def _compile_field_specs(specs):
+    """Compile every spec's patterns once and fill in engine defaults."""
+    compiled = []
+    for spec in specs:
+        flags = spec.get("flags", re.IGNORECASE | re.DOTALL)
+        compiled.append({
+            "name": spec["name"],
+            "section": spec.get("section", "document"),
+            "patterns": [re.compile(p, flags) for p in spec["patterns"]],
+            "value": spec.get("value", _group1),
+            "reject": spec.get("reject", frozenset()),
+            "normalise": spec.get("normalise"),
+            "default": spec.get("default", _UNDETERMINED),
+            "keys": spec.get("keys"),
+            "match": spec.get("match", "first"),
+        })
+    return compiled
+
+
+_COMPILED_FIELD_SPECS = _compile_field_specs(_FIELD_SPECS)
+
+
+def _run_field_spec(spec, text):
+    """Return the value of one compiled field spec against text."""
+    for pat in spec["patterns"]:
+        if spec["match"] == "last":
+            m = None
+            for m in pat.finditer(text):
+                pass
         else:
-            d["results_conclusion"] = None
-    else:
-        d["results_conclusion"] = None
+            m = pat.search(text)
+        if not m:
+            continue
+        val = spec["value"](m)
+        if val is None:
+            continue
+        if isinstance(val, str) and val.lower() in spec["reject"]:
+            continue
+        if spec["normalise"] is not None:
+            val = spec["normalise"](val)
+        return val
+
+    if spec["keys"]:
+        return dict.fromkeys(spec["keys"])
+    default = spec["default"]
+    return list(default) if isinstance(default, list) else default
+
+
+def _run_field_specs(sections, d, timings=None):
+    """
+    Run every compiled field spec against its section of the document,
+    storing results in d. If timings is a dict, the wall time (seconds) spent
+    on each spec is recorded under its name — useful to find patterns that
+    backtrack badly.
+    """
+    for spec in _COMPILED_FIELD_SPECS:
+        t0 = time.perf_counter()
+        val = _run_field_spec(spec, sections.section(spec["section"]))
+        if spec["keys"]:
+            d.update(val)
+        else:
+            d[spec["name"]] = val
+        if timings is not None:
+            timings[spec["name"]] = time.perf_counter() - t0
+
+
+# ─────────────────────────────────────────────────────────────
+# Document section index
+# ─────────────────────────────────────────────────────────────
+
+# Named REDCap sections, in document order. Each starts at the line holding
+# the first occurrence of any of its labels (so question order within a page
+# doesn't matter) and runs to the start of the next section found after it.
+# Sections are located by label rather than page number because page breaks
+# shift between exports. A section whose labels are missing is searched as
+# the whole document.
+_SECTION_MARKERS = [
+    ("demographics", None),   # always starts at the top of the document
+    ("history",
+     r"Symptom\s+onset|Frequency\s+of\s+events|Number\s+of\s+episodes"
+     r"|Date\s+of\s+most\s+recent|No\s+warning\s+syncope|Known\s+initiating\s+life\s+event"),
+    ("activity",
+     r"Usual\s+Posture|change\s+in\s+posture\s+from\s+lying|Describe\s+any\s+Symptom\s+Triggers"
+     r"|correlation\s+with\s+the\s+menstrual|Anything\s+else\s+you\s+have\s+observed"),
+    ("medical_history",
+     r"Family\s+history\s+of\s+hypotension|Have\s+you\s+been\s+diagnosed"
+     r"|Negative\s+chronotropes|List\s+any\s+other\s+relevant\s+medications"),
+    ("results",
+     r"Type\s+of\s+test|Baseline\s+Rhythm|Baseline\s+Heart\s+Rate|Control\s+Tilting"),
+]
+# Markers only count at the start of a line, where REDCap prints its question
+# text — a patient's free-text answer that mentions "type of test" or "family
+# history of hypotension" mid-line must not start a new section. Each entry
+# holds the exact-case pattern and a case-insensitive one tried if it misses.
+_COMPILED_SECTION_MARKERS = [
+    (name, tuple(re.compile(r"^[ \t]*(?:" + marker + ")", re.MULTILINE | flags)
+                 for flags in (0, re.IGNORECASE)) if marker else None)
+    for name, marker in _SECTION_MARKERS
+]
+
+# 'Any symptoms?' blocks of the results table, keyed by (phase, max width).
+# Control text runs until the Phase 2 rows; phase 2 text until the conclusion.
+_SYMPTOM_BLOCK_RES = {
+    ("control", 200): re.compile(
+        r"Any\s+symptoms\?(.{0,200}?)(?:Phase\s+2|Phase\s+Stage|$)", re.DOTALL | re.IGNORECASE),
+    ("control", 300): re.compile(
+        r"Any\s+symptoms\?(.{0,300}?)(?:Phase\s+2|Phase\s+Stage|$)", re.DOTALL | re.IGNORECASE),
+    ("phase 2", 400): re.compile(
+        r"Any\s+symptoms\?(.{0,400}?)(?:Results\s+Conclusion|$)", re.DOTALL | re.IGNORECASE),
+}
+
+
+class _SectionIndex:
+    """
+    Named slices of the document text, located once per document and
+    memoised, so each field regex and inference helper scans only its own
+    section. Section "document" is the full text.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._spans = None
+        self._slices = {"document": text}
+        self._symptom_blocks = {}
+
+    def _locate(self):
+        """
+        Section spans, in form order: each section's marker is searched for
+        only after the previous section's. If a marker turns up solely before
+        an earlier section (the layout isn't the one expected), no spans are
+        returned and every section falls back to the whole document.
+        """
+        starts = []
+        pos = 0
+        for name, markers in _COMPILED_SECTION_MARKERS:
+            if markers is None:
+                starts.append((name, 0))
+                continue
+            m = next((m for m in (marker.search(self.text, pos) for marker in markers) if m), None)
+            if m is None:
+                if any(marker.search(self.text) for marker in markers):
+                    logger.debug("Section '%s' is out of order; searching whole document", name)
+                    return {}
+                continue
+            starts.append((name, m.start()))
+            pos = m.end()
+
+        spans = {}
+        for (name, start), (_, end) in zip(starts, starts[1:] + [(None, len(self.text))]):
+            spans[name] = (start, end)
+        return spans
+
+    def section(self, name):
+        """Text of a named section, or the whole document if it wasn't found."""
+        if name not in self._slices:
+            if self._spans is None:
+                self._spans = self._locate()
+            span = self._spans.get(name)
+            self._slices[name] = self.text[span[0]:span[1]] if span else self.text
+        return self._slices[name]
+
+    def symptom_block(self, phase, width):
+        """Text following the first 'Any symptoms?' in the results section."""
+        key = (phase, width)
+        if key not in self._symptom_blocks:
+            m = _SYMPTOM_BLOCK_RES[key].search(self.section("results"))
+            self._symptom_blocks[key] = m.group(1) if m else ""
+        return self._symptom_blocks[key]
+
+
+# ─────────────────────────────────────────────────────────────
+# Field extraction
+# ─────────────────────────────────────────────────────────────
+
+# Checkbox fields whose values come straight from _ocr_checkboxes()
+_OCR_FIELD_KEYS = (
+    "no_warning_syncope", "initiating_life_event",
+    "event_was_medical", "event_was_surgical", "event_was_emotional",
+    "posture", "posture_change_provokes", "better_lying_down",
+    "triggers", "symptoms",
+    "syncope_during_exercise", "syncope_after_exercise",
+    "menstrual_correlation", "palpitations", "palpitation_type",
+    "family_hx_cardiac",
+    "conditions", "gi_diagnosis", "gi_symptoms", "mental_health",
+    "negative_chronotropes", "antidepressants",
+    "fludrocortisone_status", "midodrine_status",
+    "investigations",
+    "test_type", "control_result_raw", "phase2_result_raw",
+    "symptom_correlation",
+)
+
+
+def extract_fields(text, ocr_results=None, timings=None):
+    """
+    Parse REDCap PDF text into a structured dict of clinical fields.
+    Any unconfident field is the [undetermined] string.
+
+    ocr_results: optional dict from _ocr_checkboxes(); its values replace the
+                 [undetermined] placeholder for checkbox fields when present.
+    timings:     optional dict; receives per-field regex match time (seconds).
+    """
+    d = {}
+    ocr = ocr_results or {}
+    sections = _SectionIndex(text)
+
+    # ── Patient demographics ──────────────────────────────────
+    d["first_name"] = "<HMS-Patient_FirstName>"
+
+    # ── Regex-extracted text fields (see _FIELD_SPECS) ────────
+    _run_field_specs(sections, d, timings)
 
     # ── OCR-derived fields ────────────────────────────────────
     # Each OCR field name in d takes precedence; None means [undetermined]
-    for k in (
-        "no_warning_syncope", "initiating_life_event",
-        "event_was_medical", "event_was_surgical", "event_was_emotional",
-        "posture", "posture_change_provokes", "better_lying_down",
-        "triggers", "symptoms",
-        "syncope_during_exercise", "syncope_after_exercise",
-        "menstrual_correlation", "palpitations", "palpitation_type",
-        "family_hx_cardiac",
-        "conditions", "gi_diagnosis", "gi_symptoms", "mental_health",
-        "negative_chronotropes", "antidepressants",
-        "fludrocortisone_status", "midodrine_status",
-        "investigations",
-        "test_type", "control_result_raw", "phase2_result_raw",
-        "symptom_correlation",
-    ):
+    for k in _OCR_FIELD_KEYS:
         d[k] = ocr.get(k)
 
     # ── Tilt drug — derive from OCR test_type ─────────────────
@@ -828,138 +1804,19 @@ def extract_fields(text, ocr_results=None):
     else:
         d["tilt_drug"] = "__unknown__"  # marker for downstream
 
-    # ── BP/HR table ───────────────────────────────────────────
-    d["baseline_hr"] = _extract_numeric(text, r"Baseline\s+Heart\s+Rate\s+(\d+)")
-    d["baseline_bp"] = _field(
-        text,
-        r"Baseline\s+Blood\s+Pressure\s+(\d+/\d+)",
-        r"Baseline\s+Blood\s+Pressure\s+(\d{2,3})\b",
-        label="baseline_BP"
-    )
-    if d["baseline_bp"] == _UNDETERMINED:
-        d["baseline_bp"] = None
-
-    d["recovery_hr"] = _extract_numeric(text, r"Recovery\s+Heart\s+Rate\s+(\d+)")
-    rec_bp_raw = re.search(r"Recovery\s+Blood\s+Pressure\s+([\d/]+)", text, re.I)
-    d["recovery_bp"] = rec_bp_raw.group(1) if rec_bp_raw else None
-
-    d["control_readings"] = _extract_phase_readings(text, "Control")
-    d["phase2_readings"] = _extract_phase_readings(text, "Phase 2")
-
-    # ── Clinician notes ───────────────────────────────────────
-    ctrl_note_m = re.search(
-        r"^(?!Any\s+symptoms)(?!Phase)([A-Z][^\n]{9,120}?)[ \t]+Control[ \t]+\d+[ \t]+minute\b",
-        text, re.IGNORECASE | re.MULTILINE
-    )
-    d["control_notes"] = ctrl_note_m.group(1).strip() if ctrl_note_m else ""
-
-    p2_note_m = re.search(
-        r"Any\s+symptoms\?[^\n]*\n([^\n]+)\n\s*Phase\s+2\s+10\s+minute",
-        text, re.IGNORECASE
-    )
-    if p2_note_m:
-        raw_note = p2_note_m.group(1)
-        raw_note = re.sub(r"\s*projectredcap\.org\s*", " ", raw_note)
-        clean_tokens = [t for t in raw_note.split() if not re.search(r"\d", t)]
-        d["phase2_notes"] = " ".join(clean_tokens).strip()
-    else:
-        d["phase2_notes"] = ""
-
-    # ── Phase 2 stop minute ───────────────────────────────────
-    last_p2_min = None
-    for pm in re.finditer(r"Phase\s+2\s+(\d+)\s+minute\s+(\d{2,3})\s+(\d{2,3})", text, re.I):
-        last_p2_min = int(pm.group(1))
-    d["phase2_stop_minute"] = last_p2_min
-
     # ── Calculated tilt results (used as fallback narrative) ──
     d["control_result_calc"] = _calculate_control_result(d)
-    d["control_tolerance"] = _infer_tolerance(text, "control", d)
-    d["control_symptom_severity"] = _infer_severity(text, "control")
-    d["control_symptom_text"] = _extract_study_symptoms(text, "control", d)
+    d["control_tolerance"] = _infer_tolerance(sections, "control", d)
+    d["control_symptom_severity"] = _infer_severity(sections, "control")
+    d["control_symptom_text"] = _extract_study_symptoms(sections, "control", d)
 
     d["phase2_result_calc"] = _calculate_phase2_result(d)
-    d["phase2_tolerance"] = _infer_tolerance(text, "phase 2", d)
-    d["phase2_symptom_text"] = _extract_study_symptoms(text, "phase 2", d)
+    d["phase2_tolerance"] = _infer_tolerance(sections, "phase 2", d)
+    d["phase2_symptom_text"] = _extract_study_symptoms(sections, "phase 2", d)
 
     return d
 
 
-# ─────────────────────────────────────────────────────────────
-# Unit normalisers
-# ─────────────────────────────────────────────────────────────
-
-def _normalise_unit(raw):
-    r = raw.lower().rstrip("s") + "s"
-    if r in ("years", "months", "weeks", "days"):
-        return r
-    return raw
-
-
-def _unit_to_frequency(unit_str, count_str=None):
-    """Convert a count + unit to a qualitative frequency word: daily/weekly/monthly/rarely."""
-    unit_lower = unit_str.lower()
-
-    count = 1
-    if count_str and count_str not in ("", "______"):
-        try:
-            count = int(count_str)
-        except (ValueError, TypeError):
-            count = 1
-
-    # Approximate weekly rate for bucketing
-    per_week = {
-        "day": count * 7,
-        "week": count,
-        "month": count / 4.33,
-        "year": count / 52,
-    }.get(unit_lower, count)
-
-    if per_week >= 6:
-        return "daily"
-    if per_week >= 1:
-        return "weekly"
-    if per_week >= 0.2:
-        return "monthly"
-    return "rarely"
-
-
-# ─────────────────────────────────────────────────────────────
-# BP / HR extraction
-# ─────────────────────────────────────────────────────────────
-
-def _extract_numeric(text, pattern):
-    m = re.search(pattern, text, re.IGNORECASE)
-    try:
-        return int(m.group(1)) if m else None
-    except (ValueError, AttributeError):
-        return None
-
-
-def _extract_phase_readings(text, phase_label):
-    """Extract (systolic_bp, hr) tuples from results table for a given phase."""
-    if phase_label.lower() == "control":
-        block_pat = (
-            r"Control\s+Tilting.*?"
-            r"(?=Phase\s+2|Phase\s+Stage|$)"
-        )
-    else:
-        block_pat = (
-            r"Phase\s+2\s+Phase\s+2\s+Baseline.*?"
-            r"(?=Phase\s+Stage|Results\s+Conclusion|$)"
-        )
-
-    bm = re.search(block_pat, text, re.DOTALL | re.IGNORECASE)
-    block = bm.group(0) if bm else ""
-
-    readings = []
-    for m in re.finditer(r"(\d{2,3})\s+(\d{2,3})\s*$", block, re.MULTILINE):
-        sbp, hr = int(m.group(1)), int(m.group(2))
-        if 40 <= sbp <= 250 and 20 <= hr <= 250:
-            readings.append((sbp, hr))
-
-    return readings
-
-
 # ─────────────────────────────────────────────────────────────
 # Tilt result calculation from numeric data (fallback for narrative)
 # ─────────────────────────────────────────────────────────────
@@ -1034,7 +1891,7 @@ def _calculate_phase2_result(d):
     return _RESULT_NORMAL
 
 
-def _extract_study_symptoms(text, phase, d):
+def _extract_study_symptoms(sections, phase, d):
     """
     Extract and clean the clinician's free-text symptom notes from the
     'Any symptoms?' section of the tilt test for a given phase.
@@ -1043,13 +1900,12 @@ def _extract_study_symptoms(text, phase, d):
     """
     if phase == "control":
         notes = d.get("control_notes", "")
-        section_pat = r"Any\s+symptoms\?(.{0,200}?)(?:Phase\s+2|Phase\s+Stage|$)"
+        block = sections.symptom_block("control", 200)
     else:
         notes = d.get("phase2_notes", "")
-        section_pat = r"Any\s+symptoms\?(.{0,400}?)(?:Results\s+Conclusion|$)"
+        block = sections.symptom_block("phase 2", 400)
 
-    sm = re.search(section_pat, text, re.DOTALL | re.IGNORECASE)
-    raw = (sm.group(1) if sm else "") + " " + (notes or "")
+    raw = block + " " + (notes or "")
 
     # Strip page footers, URLs, dates
     raw = re.sub(r"projectredcap\.org[^\n]*", " ", raw, flags=re.I)
@@ -1089,16 +1945,15 @@ def _extract_study_symptoms(text, phase, d):
     return result if len(result) >= 3 else None
 
 
-def _infer_tolerance(text, phase, d):
+def _infer_tolerance(sections, phase, d):
     if phase == "control":
         notes = d.get("control_notes", "")
-        section_pat = r"Any\s+symptoms\?(.{0,200}?)(?:Phase\s+2|Phase\s+Stage|$)"
+        block = sections.symptom_block("control", 200)
     else:
         notes = d.get("phase2_notes", "")
-        section_pat = r"Any\s+symptoms\?(.{0,400}?)(?:Results\s+Conclusion|$)"
+        block = sections.symptom_block("phase 2", 400)
 
-    sm = re.search(section_pat, text, re.DOTALL | re.IGNORECASE)
-    section = (sm.group(1) if sm else "") + " " + (notes or "")
+    section = block + " " + (notes or "")
 
     no_loc = bool(re.search(r"\bno\s+loc\b|\bno\s+loss\s+of\s+consciousness\b|\bdid\s+not\s+(?:lose|faint)\b", section, re.I))
 
@@ -1129,14 +1984,11 @@ def _infer_tolerance(text, phase, d):
         return "tolerated the test well"
 
 
-def _infer_severity(text, phase):
+def _infer_severity(sections, phase):
     if phase == "control":
-        section_pat = r"Any\s+symptoms\?(.{0,300}?)(?:Phase\s+2|Phase\s+Stage|$)"
+        section = sections.symptom_block("control", 300)
     else:
-        section_pat = r"Any\s+symptoms\?(.{0,400}?)(?:Results\s+Conclusion|$)"
-
-    sm = re.search(section_pat, text, re.DOTALL | re.IGNORECASE)
-    section = sm.group(1) if sm else ""
+        section = sections.symptom_block("phase 2", 400)
 
     if re.search(r"\bsevere\b", section, re.I):
         return "severe"
@@ -1322,6 +2174,24 @@ def _yn(v):
 # Narrative composers — each returns one or more sentences
 # ─────────────────────────────────────────────────────────────
 
+# Sentences that embed free text typed into REDCap are wrapped in these
+# private-use characters. build_report(tagged=True) keeps them so the LLM
+# cleanup can send only those sentences; every other sentence is a fixed
+# template that is already grammatical.
+_FREE_TEXT_OPEN = "\ue000"
+_FREE_TEXT_CLOSE = "\ue001"
+_FREE_TEXT_RE = re.compile("\ue000(.*?)\ue001", re.S)
+
+
+def _free_text(sentence):
+    return f"{_FREE_TEXT_OPEN}{sentence}{_FREE_TEXT_CLOSE}"
+
+
+def _untag(text):
+    """Remove free-text markers."""
+    return text.replace(_FREE_TEXT_OPEN, "").replace(_FREE_TEXT_CLOSE, "")
+
+
 def _compose_demographics(f):
     age = _val(f.get("age"))
     sex = _val(f.get("sex"))
@@ -1394,11 +2264,10 @@ def _compose_history(f):
             sub.append("emotional trauma")
         if _has(detail):
             context = _lc_first(_trim_trailing_period(detail))
-        elif sub:
-            context = _join_and(sub)
+            parts.append(_free_text(f"Symptom onset occurred in the context of {context}."))
         else:
-            context = "a known event"
-        parts.append(f"Symptom onset occurred in the context of {context}.")
+            context = _join_and(sub) if sub else "a known event"
+            parts.append(f"Symptom onset occurred in the context of {context}.")
     elif _yn(ile) == "no":
         parts.append("No clear precipitating illness/factors identified.")
     else:
@@ -1462,13 +2331,13 @@ def _compose_triggers(f):
     md = f.get("menstrual_detail")
     if mc == "yes":
         if _has(md):
-            parts.append(f"Menstrual cycle correlation: {_lc_first(_trim_trailing_period(md))}.")
+            parts.append(_free_text(f"Menstrual cycle correlation: {_lc_first(_trim_trailing_period(md))}."))
         else:
             parts.append("A correlation with the menstrual cycle was observed.")
 
     obs = f.get("other_observations")
     if _has(obs):
-        parts.append(f"Other observations: {_lc_first(_trim_trailing_period(obs))}.")
+        parts.append(_free_text(f"Other observations: {_lc_first(_trim_trailing_period(obs))}."))
 
     return " ".join(parts)
 
@@ -1626,7 +2495,7 @@ def _compose_investigations(f):
     else:
         parts.append(f"Significant investigation results (as per patient): {_UNDETERMINED}.")
     if _has(comm):
-        parts.append(f"Additional investigation notes: {_trim_trailing_period(comm)}.")
+        parts.append(_free_text(f"Additional investigation notes: {_trim_trailing_period(comm)}."))
     return " ".join(parts)
 
 
@@ -1674,11 +2543,11 @@ def _compose_test(f):
     ctrl_readings = f.get("control_readings", [])
     baseline_sbp = _extract_systolic(f.get("baseline_bp"))
     ctrl_hr_rise = _max_hr_rise_control(f)
-    ctrl_phrase = _interp_phrase(
-        ctrl_calc, ctrl_readings, baseline_sbp, ctrl_hr_rise,
-        _study_suffix(f.get("control_symptom_text"))
-    )
+    ctrl_suffix = _study_suffix(f.get("control_symptom_text"))
+    ctrl_phrase = _interp_phrase(ctrl_calc, ctrl_readings, baseline_sbp, ctrl_hr_rise, ctrl_suffix)
     baseline_line = f"Baseline tilt interpretation: {ctrl_phrase}."
+    if ctrl_suffix and ctrl_suffix in baseline_line:
+        baseline_line = _free_text(baseline_line)  # carries the clinician's symptom notes
 
     paragraphs = [baseline_line]
 
@@ -1691,10 +2560,8 @@ def _compose_test(f):
         p2_baseline_sbp = p2_readings[0][0] if p2_readings else None
         p2_subsequent = p2_readings[1:] if len(p2_readings) > 1 else []
         p2_hr_rise = _max_hr_rise_phase2(f)
-        p2_phrase = _interp_phrase(
-            p2_calc, p2_subsequent, p2_baseline_sbp, p2_hr_rise,
-            _study_suffix(f.get("phase2_symptom_text"))
-        )
+        p2_suffix = _study_suffix(f.get("phase2_symptom_text"))
+        p2_phrase = _interp_phrase(p2_calc, p2_subsequent, p2_baseline_sbp, p2_hr_rise, p2_suffix)
 
         if drug == "Isoprenaline":
             drug_label = "Isoprenaline"
@@ -1704,12 +2571,14 @@ def _compose_test(f):
             drug_label = "Pharmacological"
 
         drug_line = f"{drug_label} tilt interpretation: {p2_phrase}."
+        if p2_suffix and p2_suffix in drug_line:
+            drug_line = _free_text(drug_line)
         paragraphs.append(drug_line)
 
     # Free-text results conclusion from clinician
     rc = f.get("results_conclusion")
     if _has(rc):
-        paragraphs.append(f"Clinician's results conclusion: {_trim_trailing_period(rc)}.")
+        paragraphs.append(_free_text(f"Clinician's results conclusion: {_trim_trailing_period(rc)}."))
 
     return "\n".join(paragraphs)
 
@@ -1845,12 +2714,15 @@ def _compose_recommendation(diagnosis):
 # Report builder
 # ─────────────────────────────────────────────────────────────
 
-def build_report(fields):
+def build_report(fields, tagged=False):
     """
     Populate the HealthTrack report from extracted fields.
     Output is one flowing narrative under 'Summary', then 'Conclusion'
     and 'Recommendation' single-line headings.
     Returns (report_text: str, undetermined_count: int).
+
+    With tagged, sentences that embed free text are left wrapped in the
+    _FREE_TEXT_OPEN/_FREE_TEXT_CLOSE markers for llm_cleanup_report().
     """
     regular_blocks = [
         _compose_history(fields),
@@ -1897,109 +2769,1246 @@ def build_report(fields):
     )
 
     undetermined_count = len(re.findall(re.escape(_UNDETERMINED), full_report))
+    if not tagged:
+        full_report = _untag(full_report)
     return full_report, undetermined_count
 
 
+# ─────────────────────────────────────────────────────────────
+# Stage instrumentation
+# ─────────────────────────────────────────────────────────────
+
+# tracemalloc costs 10–30% on allocation-heavy stages, so memory peaks are
+# opt-in; wall and CPU time are always recorded.
+_TRACE_MEMORY = os.getenv("TILT_TRACE_MEMORY", "").lower() in ("1", "true", "yes")
+
+
+class StageTimer:
+    """
+    Per-stage instrumentation for one PDF / request.
+
+    Each `with timer.stage(name):` block records wall time, CPU time of the
+    calling thread (poppler runs as a subprocess, so a large wall−CPU gap in
+    "ocr" is rendering) and, with TILT_TRACE_MEMORY set, the tracemalloc
+    peak above the stage's starting heap. tracemalloc is process-wide, so
+    with threaded workers a peak can include concurrent requests.
+
+    counts holds event counters (pages, OCR pages rendered, OCR crops, ...).
+    on_stage, if given, is called with each stage name as the stage starts
+    (progress reporting for background jobs); it must be cheap and not raise.
+    """
+
+    def __init__(self, trace_memory=None, on_stage=None):
+        self.trace_memory = _TRACE_MEMORY if trace_memory is None else trace_memory
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.on_stage = on_stage
+        self.stages = {}
+        self.counts = {}
+        self._t0 = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.on_stage is not None:
+            self.on_stage(name)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            heap0 = tracemalloc.get_traced_memory()[0]
+        wall0 = time.perf_counter()
+        cpu0 = time.thread_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {"wall_ms": 0.0, "cpu_ms": 0.0})
+            entry["wall_ms"] += (time.perf_counter() - wall0) * 1000
+            entry["cpu_ms"] += (time.thread_time() - cpu0) * 1000
+            if self.trace_memory:
+                peak_kb = (tracemalloc.get_traced_memory()[1] - heap0) / 1024
+                entry["peak_kb"] = max(entry.get("peak_kb", 0.0), peak_kb)
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self._t0) * 1000
+
+    def as_dict(self):
+        """JSON-serialisable summary: {"total_ms", "stages": {...}, "counts": {...}}."""
+        return {
+            "total_ms": round(self.total_ms, 1),
+            "stages": {name: {k: round(v, 1) for k, v in entry.items()}
+                       for name, entry in self.stages.items()},
+            "counts": dict(self.counts),
+        }
+
+    def server_timing(self):
+        """Server-Timing header value, e.g. 'ocr;dur=812.4;desc="cpu 95.0ms", ...'."""
+        metrics = []
+        for name, entry in self.stages.items():
+            desc = f"cpu {entry['cpu_ms']:.1f}ms"
+            if "peak_kb" in entry:
+                desc += f", peak {entry['peak_kb'] / 1024:.1f}MB"
+            metrics.append(f'{name};dur={entry["wall_ms"]:.1f};desc="{desc}"')
+        for name, value in self.counts.items():
+            metrics.append(f'{name};desc="{value}"')
+        metrics.append(f"total;dur={self.total_ms:.1f}")
+        return ", ".join(metrics)
+
+
+# ─────────────────────────────────────────────────────────────
+# Result cache (content-addressed, on disk)
+# ─────────────────────────────────────────────────────────────
+
+# Disabled unless TILT_CACHE_DIR is set: entries hold patient data (PHI), so
+# the directory must live on storage approved for it.
+_CACHE_DIR = os.getenv("TILT_CACHE_DIR") or None
+_CACHE_MAX_BYTES = int(os.getenv("TILT_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# Bump when extraction behaviour changes in a way the code fingerprint below
+# can't see (e.g. a poppler upgrade or a change to pdfplumber tolerances upstream).
+_CACHE_SCHEMA_VERSION = 1
+
+# Everything reachable from these determines the cached fields + report, and
+# the cleaned text respectively.
+_EXTRACTION_ROOTS = ("_run_pipeline", "extract_text_from_pdf", "_ocr_checkboxes",
+                     "extract_fields", "build_report")
+_CLEANUP_ROOTS = ("llm_cleanup_report",)
+
+
+def _stable_repr(value, pending):
+    """repr() without memory addresses; module functions/classes met on the way are queued in pending."""
+    if isinstance(value, (types.FunctionType, type)):
+        if getattr(value, "__module__", None) == __name__:
+            pending.append(value.__name__)
+        return f"<{value.__qualname__}>"
+    if isinstance(value, re.Pattern):
+        return f"re({value.pattern!r}, {value.flags})"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{_stable_repr(k, pending)}: {_stable_repr(v, pending)}"
+                               for k, v in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(_stable_repr(v, pending) for v in value) + "]"
+    if isinstance(value, (set, frozenset)):
+        return "{" + ", ".join(sorted(_stable_repr(v, pending) for v in value)) + "}"
+    return repr(value)
+
+
+def _code_names(code):
+    """Global names referenced by a code object and any nested functions/comprehensions."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _member_codes(cls):
+    """Code objects of a class's methods, properties and cached properties."""
+    codes = []
+    for member in vars(cls).values():
+        for fn in (member, getattr(member, "__func__", None),
+                   getattr(member, "fget", None), getattr(member, "func", None)):
+            if isinstance(fn, types.FunctionType):
+                codes.append(fn.__code__)
+    return codes
+
+
+def _code_fingerprint(roots):
+    """
+    SHA-256 over the source of every module-level function/class reachable from
+    roots, plus the value of every module-level constant they reference
+    (_CHECKBOX_FIELDS, _FIELD_SPECS, compiled patterns, thresholds, ...).
+    Editing any of them changes the fingerprint.
+    """
+    module = globals()
+    parts = {}
+    pending = list(roots)
+    while pending:
+        name = pending.pop()
+        if name in parts or name not in module:
+            continue
+        obj = inspect.unwrap(module[name])  # see through functools.lru_cache
+        if isinstance(obj, types.ModuleType):
+            parts[name] = ""
+        elif isinstance(obj, (types.FunctionType, type)) and obj.__module__ == __name__:
+            parts[name] = inspect.getsource(obj)
+            codes = _member_codes(obj) if isinstance(obj, type) else [obj.__code__]
+            for code in codes:
+                pending.extend(_code_names(code))
+        else:
+            parts[name] = _stable_repr(obj, pending)
+    # hash in name order: traversal order follows set iteration and varies per run
+    digest = hashlib.sha256()
+    for name in sorted(parts):
+        digest.update(f"{name}\0{parts[name]}\0".encode())
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _cache_versions():
+    """(extraction version, cleanup version) — computed once per process."""
+    extraction = _code_fingerprint(_EXTRACTION_ROOTS)
+    extraction = hashlib.sha256(f"{_CACHE_SCHEMA_VERSION}:{extraction}".encode()).hexdigest()
+    return extraction[:16], _code_fingerprint(_CLEANUP_ROOTS)[:16]
+
+
+class _ResultCache:
+    """
+    One JSON file per (PDF content, extractor version):
+        <dir>/<key[:2]>/<key>.json
+        {"fields": {...}, "report": str, "review_count": int,
+         "cleaned": str | null, "cleanup_version": str | null}
+    Reads touch the file's mtime; writes evict least-recently-used files once
+    the directory exceeds max_bytes. Writes go through a temp file + rename so
+    concurrent gunicorn workers never see a torn entry.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, pdf_bytes):
+        extraction_version, _ = _cache_versions()
+        return f"{hashlib.sha256(pdf_bytes).hexdigest()}-{extraction_version}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Discarding unreadable cache entry %s: %s", key, e)
+            return None
+        # JSON turns the (sbp, hr) reading tuples into lists
+        fields = entry.get("fields") or {}
+        for name, value in fields.items():
+            if name.endswith("_readings") and isinstance(value, list):
+                fields[name] = [tuple(row) for row in value]
+        return entry
+
+    def put(self, key, entry):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, default=str)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Could not write cache entry %s: %s", key, e)
+            return
+        self._evict()
+
+    def _evict(self):
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                full = os.path.join(root, name)
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, full))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, full in sorted(files):
+            try:
+                os.remove(full)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+_result_cache = _ResultCache(_CACHE_DIR, _CACHE_MAX_BYTES) if _CACHE_DIR else None
+
+
+# ─────────────────────────────────────────────────────────────
+# LLM cleanup providers
+# ─────────────────────────────────────────────────────────────
+
+# Overall wall-clock budget for the cleanup step; when it runs out the
+# deterministic report is returned as-is. If the preferred provider hasn't
+# answered after the hedge delay, the fallback is started alongside it and
+# the first usable answer wins.
+_LLM_BUDGET_S = float(os.getenv("TILT_LLM_BUDGET_S", "30"))
+_LLM_HEDGE_S = float(os.getenv("TILT_LLM_HEDGE_S", "8"))
+_LLM_MAX_TOKENS = 2500
+
+_CLEANUP_SYSTEM_PROMPT = (
+    "You are a clinical documentation assistant helping format a tilt table test report "
+    "for a physiotherapy electronic medical record.\n\n"
+    "Your task: improve the grammar, sentence flow and readability of the report text "
+    "provided by the user. The text is a set of excerpts from a longer report, one per "
+    "line.\n\n"
+    "Rules you must follow without exception:\n"
+    "1. Do NOT add, remove or change any clinical facts, numbers, diagnoses, dates, "
+    "medications, measurements or values.\n"
+    "2. Do NOT add any clinical interpretations, opinions or recommendations not already "
+    "present in the text.\n"
+    "3. If any of the section headings (Summary, Conclusions, Recommendations) appear, keep "
+    "them exactly as-is — same capitalisation, no colons, each on its own line. Do not add "
+    "headings that are not in the text.\n"
+    "4. Keep every [undetermined] placeholder as the exact literal string [undetermined].\n"
+    "5. Keep any 'Mr/Ms/Mx [Name]' patient references exactly as-is. Also keep "
+    "<HMS-Patient_FirstName> exactly as-is if it appears.\n"
+    "6. Normalise capitalisation: common nouns and condition names that appear "
+    "mid-sentence should be lowercase (e.g. 'emotional stress', 'brain fog', "
+    "'chronic fatigue'). Preserve medical acronyms in uppercase: POTS, IBS, ECG, "
+    "ECHO, EEG, MRI, CT, EP, SSRI, SNRI, ADHD, MCAS, GTN, OCP.\n"
+    "7. Return exactly as many lines as you were given, in the same order, each the cleaned "
+    "version of the corresponding line. Do not merge, split or drop lines.\n"
+    "8. Return only the cleaned text — no preamble, no explanation."
+)
+
+
+def _normalise_cleanup(text):
+    """Strip trailing whitespace from each line of an LLM answer."""
+    return "\n".join(line.rstrip() for line in text.splitlines())
+
+
+@functools.lru_cache(maxsize=None)
+def _llm_client(provider, api_key):
+    """
+    One client per (provider, key) per process, created on first use, so
+    HTTPS connections are kept alive between reports. SDK retries are off:
+    the hedged fallback and the budget take their place.
+    """
+    import httpx  # installed with both SDKs
+    http_client = httpx.Client(
+        timeout=_LLM_BUDGET_S,
+        limits=httpx.Limits(max_connections=8, max_keepalive_connections=4, keepalive_expiry=120),
+    )
+    if provider == "claude":
+        import anthropic
+        return anthropic.Anthropic(api_key=api_key, http_client=http_client, max_retries=0)
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+@functools.lru_cache(maxsize=1)
+def _llm_executor():
+    """Threads the provider calls run on (a call can't be cancelled, only abandoned to its timeout)."""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="tilt-llm")
+
+
+def _claude_cleanup(api_key, report_text, deadline):
+    message = _llm_client("claude", api_key).messages.create(
+        model="claude-sonnet-4-6",
+        max_tokens=_LLM_MAX_TOKENS,
+        system=_CLEANUP_SYSTEM_PROMPT,
+        messages=[{"role": "user", "content": report_text}],
+        timeout=max(1.0, deadline - time.monotonic()),
+    )
+    return message.content[0].text.strip()
+
+
+def _openai_cleanup(api_key, report_text, deadline):
+    response = _llm_client("openai", api_key).chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": _CLEANUP_SYSTEM_PROMPT},
+            {"role": "user", "content": report_text},
+        ],
+        temperature=0.1,
+        max_tokens=_LLM_MAX_TOKENS,
+        timeout=max(1.0, deadline - time.monotonic()),
+    )
+    return response.choices[0].message.content.strip()
+
+
+def _call_provider(key, call, text, deadline, events):
+    """Executor task: run one provider call and put (key, answer), or (key, error), on the shared queue."""
+    try:
+        events.put((key, call(text, deadline)))
+    except Exception as e:
+        events.put((key, e))
+
+
+# Blocks of build_report() output that start with one of these lines keep it
+# out of the LLM request (and out of its reach).
+_REPORT_HEADINGS = ("Summary", "Conclusions", "Recommendations")
+_FACT_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_FACT_ACRONYM_RE = re.compile(r"\b[A-Z][A-Z0-9]+\b")
+
+
+def _split_sections(report_text):
+    """
+    Split a report into its blank-line separated blocks (Summary, tilt
+    interpretation, Conclusions, Recommendations) as (heading, body) pairs;
+    heading is the heading line with its newline, or "" for blocks without
+    one. _join_sections() puts them back together exactly.
+    """
+    sections = []
+    for block in report_text.split("\n\n"):
+        first, sep, rest = block.partition("\n")
+        if first.strip() in _REPORT_HEADINGS:
+            sections.append((first + sep, rest))
+        else:
+            sections.append(("", block))
+    return sections
+
+
+def _join_sections(sections):
+    return "\n\n".join(heading + body for heading, body in sections)
+
+
+def _fact_mismatch(original, cleaned):
+    """
+    Why an LLM-cleaned section can't be trusted, or None if it can: it must
+    keep every number (with repeats), the number of [undetermined] markers
+    and the set of acronyms of the deterministic text.
+    """
+    if sorted(_FACT_NUMBER_RE.findall(original)) != sorted(_FACT_NUMBER_RE.findall(cleaned)):
+        return "numbers changed"
+    if original.count("[undetermined]") != cleaned.count("[undetermined]"):
+        return "[undetermined] markers changed"
+    if set(_FACT_ACRONYM_RE.findall(original)) != set(_FACT_ACRONYM_RE.findall(cleaned)):
+        return "acronyms changed"
+    return None
+
+
+class _CleanupPlan:
+    """
+    What a report's LLM cleanup sends, and how the answers are put back.
+
+    A tagged report (build_report(tagged=True)) sends, per block, only its
+    free-text sentences, one per line; blocks without free text aren't sent
+    at all. Untagged text sends whole block bodies. texts[k] is request k
+    for block blocks[k]; accept(k, cleaned) splices the answer in. For a
+    tagged plan it checks each line itself, keeping the original of any line
+    that fails _fact_mismatch(), so _cleanup_sections() should be run with
+    verify=not plan.tagged.
+    """
+
+    def __init__(self, report_text):
+        self.tagged = _FREE_TEXT_OPEN in report_text
+        self.sections = _split_sections(report_text)
+        self.blocks = []
+        self.texts = []
+        for i, (_, body) in enumerate(self.sections):
+            if self.tagged:
+                lines = [span for span in _FREE_TEXT_RE.findall(body) if span.strip() and "\n" not in span]
+                text = "\n".join(lines)
+            else:
+                text = body
+            if text.strip():
+                self.blocks.append(i)
+                self.texts.append(text)
+
+    def accept(self, k, cleaned, stats=None):
+        """
+        Splice request k's answer into its block; False if none of it could
+        be used. stats: optional dict; "llm_rejected" counts rejected lines.
+        """
+        i = self.blocks[k]
+        heading, body = self.sections[i]
+        if not self.tagged:
+            self.sections[i] = (heading, cleaned)
+            return True
+        originals = self.texts[k].split("\n")
+        lines = [line.strip() for line in cleaned.splitlines() if line.strip()]
+        if len(lines) != len(originals):
+            logger.warning("LLM cleanup of block %d returned %d lines for %d — keeping original text",
+                           i, len(lines), len(originals))
+            return False
+        replacements = {}
+        for old, new in zip(originals, lines):
+            reason = _fact_mismatch(old, new)
+            if reason:
+                logger.warning("LLM cleanup of a line in block %d rejected: %s — keeping original text", i, reason)
+                if stats is not None:
+                    stats["llm_rejected"] = stats.get("llm_rejected", 0) + 1
+            else:
+                replacements[old] = new
+        if not replacements:
+            return False
+        self.sections[i] = (heading, _FREE_TEXT_RE.sub(
+            lambda m: _free_text(replacements.get(m.group(1), m.group(1))), body))
+        return True
+
+    def block(self, i):
+        heading, body = self.sections[i]
+        return _untag(heading + body)
+
+    def report(self):
+        return _untag(_join_sections(self.sections))
+
+
+def _cleanup_sections(texts, anthropic_api_key=None, openai_api_key=None, stats=None, verify=True):
+    """
+    Clean several texts (report sections) concurrently, one LLM request each.
+    Per text the preferred provider starts at once and the fallback after
+    TILT_LLM_HEDGE_S without an answer (or straight away if the first fails);
+    the first answer is kept and the other request abandoned. All texts
+    share one TILT_LLM_BUDGET_S deadline.
+
+    Yields (i, text, cleaned) once per text, in completion order: the
+    cleaned text if it passes _fact_mismatch() (checked here only with
+    verify; a tagged _CleanupPlan checks line by line in accept()),
+    otherwise the original with cleaned False.
+
+    stats: optional dict; "llm_<provider>" (sections answered by it),
+    "llm_hedged" and "llm_rejected" are incremented in it.
+    """
+    providers = []
+    if anthropic_api_key:
+        providers.append(("claude", functools.partial(_claude_cleanup, anthropic_api_key)))
+    if openai_api_key:
+        providers.append(("openai", functools.partial(_openai_cleanup, openai_api_key)))
+
+    def _count(name):
+        if stats is not None:
+            stats[name] = stats.get(name, 0) + 1
+
+    start = time.monotonic()
+    deadline = start + _LLM_BUDGET_S
+    events = queue.Queue()
+    started = [[] for _ in texts]   # provider names started, per text
+    live = [set() for _ in texts]   # started and not yet answered
+    pending = set(range(len(texts)))
+
+    def _start_next(i):
+        name, call = providers[len(started[i])]
+        started[i].append(name)
+        live[i].add(name)
+        _llm_executor().submit(_call_provider, (i, name), call, texts[i], deadline, events)
+
+    def _finish(i, cleaned):
+        pending.discard(i)
+        if cleaned and verify:
+            reason = _fact_mismatch(texts[i], cleaned)
+            if reason:
+                logger.warning("LLM cleanup of section %d rejected: %s — keeping original text", i, reason)
+                _count("llm_rejected")
+                cleaned = ""
+        if not cleaned:
+            return i, texts[i], False
+        # keep the original's trailing whitespace so the report reassembles cleanly
+        return i, cleaned + texts[i][len(texts[i].rstrip()):], True
+
+    if not providers:
+        for i in range(len(texts)):
+            yield _finish(i, None)
+        return
+    for i in range(len(texts)):
+        _start_next(i)
+
+    while pending:
+        now = time.monotonic()
+        if now >= deadline:
+            logger.warning("LLM cleanup exceeded its %.1fs budget — keeping original text for %d section(s)",
+                           _LLM_BUDGET_S, len(pending))
+            for i in sorted(pending):
+                yield _finish(i, None)
+            return
+        wait = deadline - now
+        hedgeable = [i for i in pending if len(started[i]) < len(providers)]
+        for i in hedgeable:
+            wait = min(wait, max(0.0, start + _LLM_HEDGE_S * len(started[i]) - now))
+        try:
+            (i, name), answer = events.get(timeout=wait)
+        except queue.Empty:
+            now = time.monotonic()
+            for i in hedgeable:
+                if now >= start + _LLM_HEDGE_S * len(started[i]):
+                    logger.info("LLM cleanup: %s slow on section %d after %.1fs — starting %s in parallel",
+                                "/".join(live[i]), i, _LLM_HEDGE_S, providers[len(started[i])][0])
+                    _count("llm_hedged")
+                    _start_next(i)
+            continue
+        if i not in pending:
+            continue  # late answer from a provider that lost the race
+        live[i].discard(name)
+        if isinstance(answer, str) and answer.strip():
+            _count(f"llm_{name}")
+            yield _finish(i, _normalise_cleanup(answer.strip()))
+            continue
+        if isinstance(answer, Exception):
+            logger.warning("%s LLM cleanup failed: %s", name, answer)
+        else:
+            logger.warning("%s LLM cleanup returned an empty answer", name)
+        if not live[i] and len(started[i]) < len(providers):
+            _start_next(i)
+        elif not live[i]:
+            yield _finish(i, None)
+
+
 # ─────────────────────────────────────────────────────────────
 # Public entry point
 # ─────────────────────────────────────────────────────────────
 
-def llm_cleanup_report(report_text, anthropic_api_key=None, openai_api_key=None):
+def llm_cleanup_report(report_text, anthropic_api_key=None, openai_api_key=None, stats=None):
     """
     Optional post-processing step: pass the deterministic report through an LLM
-    for grammar and prose cleanup. Claude Sonnet is preferred; falls back to
-    GPT-4o-mini if only an OpenAI key is available.
+    for grammar and prose cleanup. Claude Sonnet is preferred; GPT-4o-mini is
+    the fallback, started early (hedged) if Claude is slow to answer.
+
+    Given a tagged report (build_report(tagged=True)) only the sentences that
+    embed free text are sent — the templated sentences are already
+    grammatical — one request per report block, concurrently. Untagged text
+    is cleaned block by block. The result is always untagged.
 
     Clinical facts, values, and [undetermined] markers are never modified —
-    the system prompt enforces this strictly.
+    the system prompt asks for this, and every cleaned sentence/block is
+    checked mechanically (_fact_mismatch) before it is used.
 
-    Returns the cleaned report on success, or the original report if the API
-    call fails (network error, quota, invalid key, etc.).
+    Anything that can't be cleaned (network error, quota, invalid key, past
+    TILT_LLM_BUDGET_S, failed check) keeps its original text, so the original
+    report comes back if nothing could be cleaned.
+
+    stats: optional dict; see _cleanup_sections().
 
     NOTE: calling this function sends the report text (including patient data such
     as age, sex, clinical findings) to the API provider. The caller is responsible
     for ensuring this is appropriate for their clinical context and privacy obligations.
     """
-    system_prompt = (
-        "You are a clinical documentation assistant helping format a tilt table test report "
-        "for a physiotherapy electronic medical record.\n\n"
-        "Your task: improve the grammar, sentence flow and readability of the report text "
-        "provided by the user.\n\n"
-        "Rules you must follow without exception:\n"
-        "1. Do NOT add, remove or change any clinical facts, numbers, diagnoses, dates, "
-        "medications, measurements or values.\n"
-        "2. Do NOT add any clinical interpretations, opinions or recommendations not already "
-        "present in the text.\n"
-        "3. Keep the three section headings (Summary, Conclusions, Recommendations) exactly "
-        "as-is — same capitalisation, no colons, each on its own line.\n"
-        "4. Keep every [undetermined] placeholder as the exact literal string [undetermined].\n"
-        "5. Keep any 'Mr/Ms/Mx [Name]' patient references exactly as-is. Also keep "
-        "<HMS-Patient_FirstName> exactly as-is if it appears.\n"
-        "6. Normalise capitalisation: common nouns and condition names that appear "
-        "mid-sentence should be lowercase (e.g. 'emotional stress', 'brain fog', "
-        "'chronic fatigue'). Preserve medical acronyms in uppercase: POTS, IBS, ECG, "
-        "ECHO, EEG, MRI, CT, EP, SSRI, SNRI, ADHD, MCAS, GTN, OCP.\n"
-        "7. Return only the cleaned report text — no preamble, no explanation."
-    )
+    plan = _CleanupPlan(report_text)
+    for k, text, cleaned in _cleanup_sections(plan.texts, anthropic_api_key, openai_api_key, stats=stats,
+                                              verify=not plan.tagged):
+        if cleaned:
+            plan.accept(k, text, stats)
+    return plan.report()
 
-    def _normalise_output(text):
-        lines = [line.rstrip() for line in text.splitlines()]
-        return "\n".join(lines)
 
-    # Prefer Claude Sonnet
-    if anthropic_api_key:
+def _run_pipeline(pdf_bytes, timer=None):
+    """
+    Parse → text → checkbox OCR → fields → report for one PDF.
+    Returns (fields, report_text, undetermined_count). If timer (a
+    StageTimer) is given it records the "parse", "text", "ocr", "fields"
+    and "report" stages plus page / OCR counts.
+    """
+    if timer is None:
+        timer = StageTimer(trace_memory=False)
+
+    with timer.stage("parse"):
         try:
-            import anthropic
-            client = anthropic.Anthropic(api_key=anthropic_api_key)
-            message = client.messages.create(
-                model="claude-sonnet-4-6",
-                max_tokens=2500,
-                system=system_prompt,
-                messages=[{"role": "user", "content": report_text}],
-            )
-            cleaned = message.content[0].text.strip()
-            if cleaned:
-                return _normalise_output(cleaned)
+            doc = _ParsedDocument(pdf_bytes)
         except Exception as e:
-            logger.warning("Claude LLM cleanup failed: %s — trying OpenAI fallback", e)
+            logger.error("PDF extraction failed: %s", e)
+            raise ValueError(f"Could not read PDF: {e}")
 
-    # Fallback: OpenAI GPT-4o-mini
-    if openai_api_key:
+    with doc:
+        timer.count("pages", len(doc.pages))
+        with timer.stage("text"):
+            try:
+                text = extract_text_from_pdf(doc)
+                logger.debug("Extracted %d characters from PDF", len(text))
+            except Exception as e:
+                logger.error("PDF extraction failed: %s", e)
+                raise ValueError(f"Could not read PDF: {e}")
+
+        with timer.stage("ocr"):
+            ocr_results = _ocr_checkboxes(doc, timer.counts)
+            logger.debug("Checkbox OCR results: %s", ocr_results)
+
+    with timer.stage("fields"):
+        fields = extract_fields(text, ocr_results)
+
+    with timer.stage("report"):
+        report, undetermined_count = build_report(fields)
+    return fields, report, undetermined_count
+
+
+def _cached_extraction(pdf_bytes, timer=None):
+    """
+    _run_pipeline() behind the result cache. Returns (entry, cache_key) where
+    entry holds "fields", "report" and "review_count" (plus "cleaned" once a
+    cleanup has been stored); cache_key is None when caching is disabled.
+    On a hit the timer records a "cache" stage and a "cache_hit" count
+    instead of the pipeline stages.
+    """
+    if _result_cache is None:
+        fields, report, review_count = _run_pipeline(pdf_bytes, timer)
+        return {"fields": fields, "report": report, "review_count": review_count}, None
+
+    if timer is None:
+        timer = StageTimer(trace_memory=False)
+    with timer.stage("cache"):
+        key = _result_cache.key(pdf_bytes)
+        entry = _result_cache.get(key)
+    if entry is not None:
+        logger.debug("Result cache hit %s", key)
+        timer.count("cache_hit")
+        return entry, key
+
+    fields, report, review_count = _run_pipeline(pdf_bytes, timer)
+    entry = {"fields": fields, "report": report, "review_count": review_count,
+             "cleaned": None, "cleanup_version": None}
+    with timer.stage("cache"):
+        _result_cache.put(key, entry)
+    return entry, key
+
+
+def process_pdf(pdf_bytes, timer=None):
+    """
+    Main entry point. Takes raw PDF bytes, returns (report_text, undetermined_count).
+    The upload is parsed once; text extraction and checkbox OCR share that parse.
+    Pass a StageTimer to collect per-stage timings.
+    """
+    entry, _ = _cached_extraction(pdf_bytes, timer)
+    return entry["report"], entry["review_count"]
+
+
+def _tagged_report(entry):
+    """The entry's report with free-text markers (build_report(tagged=True)), rebuilt from its fields."""
+    tagged = build_report(entry["fields"], tagged=True)[0]
+    # Should always match; if it doesn't, clean whole blocks rather than the wrong sentences
+    return tagged if _untag(tagged) == entry["report"] else entry["report"]
+
+
+def generate_report(pdf_bytes, anthropic_api_key=None, openai_api_key=None, timer=None):
+    """
+    process_pdf() followed by llm_cleanup_report() when an API key is given.
+    Returns (report_text, undetermined_count). With TILT_CACHE_DIR set, a
+    re-upload of the same PDF returns the stored (cleaned) report without
+    re-running extraction or the LLM call. The LLM call is timed as the
+    "cleanup" stage.
+    """
+    if timer is None:
+        timer = StageTimer(trace_memory=False)
+    entry, key = _cached_extraction(pdf_bytes, timer)
+    report, review_count = entry["report"], entry["review_count"]
+    if not (anthropic_api_key or openai_api_key):
+        return report, review_count
+
+    cleanup_version = _cache_versions()[1] if key else None
+    if key and entry.get("cleaned") and entry.get("cleanup_version") == cleanup_version:
+        return entry["cleaned"], review_count
+
+    with timer.stage("cleanup"):
+        cleaned = llm_cleanup_report(
+            _tagged_report(entry),
+            anthropic_api_key=anthropic_api_key,
+            openai_api_key=openai_api_key,
+            stats=timer.counts,
+        )
+    # llm_cleanup_report() hands back the input unchanged when every provider
+    # fails — don't pin that in the cache.
+    if key and cleaned != report:
+        entry["cleaned"] = cleaned
+        entry["cleanup_version"] = cleanup_version
+        with timer.stage("cache"):
+            _result_cache.put(key, entry)
+    return cleaned, review_count
+
+
+def generate_report_stream(pdf_bytes, anthropic_api_key=None, openai_api_key=None, timer=None,
+                           use_pool=False):
+    """
+    generate_report() for streaming responses. Yields event dicts:
+
+        {"event": "report", "report", "review_count", "cleanup", "sections"}
+            the deterministic report, as soon as extraction finishes;
+            cleanup is True if polished text will follow. sections is the
+            report split into its blocks (joined by blank lines)
+        {"event": "section", "section", "text", "cleaned"}
+            the polished text of one block, as soon as it is ready (blocks
+            are cleaned concurrently); cleaned False means it kept its
+            original text. Only blocks with free text are sent for cleanup,
+            so only those get an event
+        {"event": "done", "report", "review_count", "cleaned"}
+            the final report; cleaned is True if any block was polished
+
+    Extraction errors (ValueError) are raised by the first next(), before
+    anything has been sent. Cached cleaned reports are sent without section
+    events.
+
+    use_pool: run the extraction on the shared process pool (see
+    _extract_in_pool) so only the LLM cleanup, which mostly waits on the
+    network, runs in the calling process.
+    """
+    if timer is None:
+        timer = StageTimer(trace_memory=False)
+    entry, key = (_extract_in_pool if use_pool else _cached_extraction)(pdf_bytes, timer)
+    report, review_count = entry["report"], entry["review_count"]
+
+    def _report_event(text, cleanup):
+        return {"event": "report", "report": text, "review_count": review_count, "cleanup": cleanup,
+                "sections": [heading + body for heading, body in _split_sections(text)]}
+
+    plan = _CleanupPlan(_tagged_report(entry)) if (anthropic_api_key or openai_api_key) else None
+    if plan is None or not plan.texts:
+        yield _report_event(report, False)
+        yield {"event": "done", "report": report, "review_count": review_count, "cleaned": False}
+        return
+
+    cleanup_version = _cache_versions()[1] if key else None
+    if key and entry.get("cleaned") and entry.get("cleanup_version") == cleanup_version:
+        yield _report_event(entry["cleaned"], False)
+        yield {"event": "done", "report": entry["cleaned"], "review_count": review_count, "cleaned": True}
+        return
+
+    yield _report_event(report, True)
+    any_cleaned = False
+    with timer.stage("cleanup"):
+        for k, text, cleaned in _cleanup_sections(plan.texts, anthropic_api_key, openai_api_key,
+                                                  stats=timer.counts, verify=not plan.tagged):
+            cleaned = cleaned and plan.accept(k, text, timer.counts)
+            any_cleaned = any_cleaned or cleaned
+            yield {"event": "section", "section": plan.blocks[k], "text": plan.block(plan.blocks[k]),
+                   "cleaned": cleaned}
+    if not any_cleaned:
+        yield {"event": "done", "report": report, "review_count": review_count, "cleaned": False}
+        return
+    cleaned = plan.report()
+    if key:
+        entry["cleaned"] = cleaned
+        entry["cleanup_version"] = cleanup_version
+        with timer.stage("cache"):
+            _result_cache.put(key, entry)
+    yield {"event": "done", "report": cleaned, "review_count": review_count, "cleaned": True}
+
+
+# ─────────────────────────────────────────────────────────────
+# Worker warm-up
+# ─────────────────────────────────────────────────────────────
+
+# Layout of the warm-up sample: (x, y, text) lines and (x, y, filled) checkboxes,
+# in PDF user space. Enough REDCap labels to exercise every pipeline stage.
+_WARM_UP_LINES = [
+    (40, 800, "Tilt Table Test"),
+    (40, 786, "Surname Sample"),
+    (40, 772, "Eastern Health MRN 1000000"),
+    (40, 758, "Age (years) 30"),
+    (40, 744, "Usual Posture at symptom onset"),
+    (60, 730, "Standing"),
+    (140, 730, "Sitting"),
+    (40, 716, "Does change in posture from lying to standing provoke symptoms?"),
+    (60, 702, "No"),
+    (120, 702, "Yes"),
+    (40, 688, "Baseline Heart Rate 70"),
+    (40, 674, "Control Tilting"),
+    (40, 660, "Control 1 minute 118 80"),
+    (40, 646, "Phase Stage"),
+    (40, 632, "Results Conclusion"),
+    (40, 618, "Normal response"),
+]
+_WARM_UP_BOXES = [(48, 728.5, True), (128, 728.5, False), (48, 700.5, False), (108, 700.5, True)]
+
+
+def _warm_up_pdf():
+    """A one-page REDCap-like PDF (Helvetica text + 8pt checkboxes), built in memory."""
+    ops = ["BT /F1 9 Tf"]
+    for x, y, text in _WARM_UP_LINES:
+        escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        ops.append(f"1 0 0 1 {x} {y} Tm ({escaped}) Tj")
+    ops.append("ET 0.6 w")
+    for x, y, filled in _WARM_UP_BOXES:
+        ops.append(f"{x} {y} 8 8 re S")
+        if filled:
+            ops.append(f"{x + 1.2} {y + 1.2} 5.6 5.6 re f")
+    content = "\n".join(ops).encode("latin-1")
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content),
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+_warmed_up = False
+
+
+def warm_up(run_sample=True):
+    """
+    Pay every first-use cost up front so a fresh worker's first upload is as
+    fast as its hundredth: resolve (and touch) poppler, create the pooled LLM
+    clients for the providers with keys configured, compute the result-cache
+    version and, with run_sample, push a small in-memory PDF through the whole
+    pipeline — which fills the regex cache, the option-token cache and numpy's
+    lazy paths.
+
+    Idempotent; call from gunicorn's post_fork hook or the batch pool
+    initialiser. Returns per-step timings in ms (empty if already warm).
+    """
+    global _warmed_up
+    if _warmed_up:
+        return {}
+    timings = {}
+
+    t0 = time.perf_counter()
+    pdftoppm = _pdftoppm_path()
+    if pdftoppm:
+        # First exec of the binary pulls it and its shared libraries into the page cache
+        try:
+            subprocess.run([pdftoppm, "-v"], capture_output=True, timeout=10)
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning("poppler warm-up failed: %s", e)
+    timings["poppler_ms"] = (time.perf_counter() - t0) * 1000
+
+    t0 = time.perf_counter()
+    # Build the pooled LLM clients so the first cleanup call doesn't pay for SDK imports
+    for provider, env in (("claude", "ANTHROPIC_API_KEY"), ("openai", "OPENAI_API_KEY")):
+        if os.getenv(env):
+            try:
+                _llm_client(provider, os.getenv(env))
+            except ImportError:
+                pass
+    if _result_cache is not None:
+        _cache_versions()
+    timings["imports_ms"] = (time.perf_counter() - t0) * 1000
+
+    if run_sample:
+        t0 = time.perf_counter()
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=openai_api_key)
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": report_text},
-                ],
-                temperature=0.1,
-                max_tokens=2500,
+            _run_pipeline(_warm_up_pdf())
+        except Exception as e:
+            logger.warning("Extractor warm-up sample failed: %s", e)
+        timings["sample_ms"] = (time.perf_counter() - t0) * 1000
+
+    _warmed_up = True
+    logger.info("Tilt extractor warmed up: %s",
+                ", ".join(f"{k} {v:.0f}" for k, v in timings.items()))
+    return timings
+
+
+# ─────────────────────────────────────────────────────────────
+# Batch processing (bounded process pool)
+# ─────────────────────────────────────────────────────────────
+#
+# The same pool runs the extraction for background jobs (_extract_in_pool).
+
+# The pool is per gunicorn worker, so the host runs up to (web workers ×
+# this) extractor processes, each as large as one extraction. Keep it small;
+# raise TILT_BATCH_WORKERS only with memory to match.
+_BATCH_MAX_WORKERS = int(os.getenv("TILT_BATCH_WORKERS", "0")) or min(2, os.cpu_count() or 1)
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+_stage_manager = None       # carries stage names back from pool workers, see _extract_in_pool()
+_STAGE_POLL_S = 0.25
+
+
+def _batch_worker_init():
+    """Pool initialiser: warm the extractor once per worker process."""
+    warm_up()
+
+
+def _get_batch_pool():
+    """The shared process pool, created on first use and reused across batches."""
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            # spawn: never fork a (possibly threaded) web worker
+            _batch_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=_BATCH_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_batch_worker_init,
             )
-            cleaned = response.choices[0].message.content.strip()
-            if cleaned:
-                return _normalise_output(cleaned)
+        return _batch_pool
+
+
+def _reset_batch_pool(pool):
+    """Discard a broken pool (a worker died, e.g. OOM-killed) so the next submit gets a fresh one."""
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is pool:
+            _batch_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _process_batch_item(name, pdf_bytes, cleanup=False):
+    """Run one PDF of a batch inside a pool worker. Returns (name, result dict)."""
+    try:
+        if cleanup:
+            report, review_count = generate_report(
+                pdf_bytes,
+                anthropic_api_key=os.getenv("ANTHROPIC_API_KEY"),
+                openai_api_key=os.getenv("OPENAI_API_KEY"),
+            )
+        else:
+            report, review_count = process_pdf(pdf_bytes)
+        return name, {"report": report, "review_count": review_count}
+    except ValueError as e:
+        return name, {"error": str(e)}
+    except Exception as e:
+        logger.error("Unexpected error processing %s in batch: %s", name, e)
+        return name, {"error": "An unexpected error occurred while processing the PDF."}
+
+
+def process_pdf_batch(items, cleanup=False):
+    """
+    Process many PDFs in parallel on the shared process pool.
+
+    items:   iterable of (name, pdf_bytes).
+    cleanup: also run llm_cleanup_report() (keys taken from the environment).
+
+    Yields (name, result) in completion order as each PDF finishes, where
+    result is {"report", "review_count"} or {"error"}. At most two PDFs per
+    worker are queued at a time, so memory stays bounded on large batches.
+
+    If a worker process dies, every PDF in flight on that pool gets an
+    {"error"} result, the pool is replaced and the rest of the batch carries
+    on; later batches aren't affected.
+    """
+    window = _BATCH_MAX_WORKERS * 2
+    pending = {}        # future -> (name, pool it was submitted to)
+    items = iter(items)
+
+    while True:
+        for name, pdf_bytes in items:
+            pool = _get_batch_pool()
+            try:
+                fut = pool.submit(_process_batch_item, name, pdf_bytes, cleanup)
+            except concurrent.futures.BrokenExecutor:
+                _reset_batch_pool(pool)
+                pool = _get_batch_pool()
+                fut = pool.submit(_process_batch_item, name, pdf_bytes, cleanup)
+            pending[fut] = (name, pool)
+            if len(pending) >= window:
+                break
+        if not pending:
+            return
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for fut in done:
+            name, pool = pending.pop(fut)
+            try:
+                result = fut.result()
+            except concurrent.futures.BrokenExecutor:
+                logger.error("Batch worker process died while processing %s", name)
+                _reset_batch_pool(pool)
+                result = name, {"error": "The PDF could not be processed (the worker stopped unexpectedly). "
+                                         "Please try again."}
+            yield result
+
+
+def _pooled_extraction(pdf_bytes, stages=None):
+    """
+    _cached_extraction() inside a pool worker. Each stage name is put on
+    stages (a manager queue) as it starts. Returns (entry, cache_key,
+    stage timings, counts).
+    """
+    def on_stage(name):
+        try:
+            stages.put(name)
+        except Exception:
+            pass    # progress is best-effort; the result still comes back
+
+    timer = StageTimer(on_stage=on_stage if stages is not None else None)
+    entry, key = _cached_extraction(pdf_bytes, timer)
+    return entry, key, timer.stages, timer.counts
+
+
+def _stage_queue():
+    """A fresh queue on the shared stage manager (started on first use), or None if it can't be had."""
+    global _stage_manager
+    with _batch_pool_lock:
+        try:
+            if _stage_manager is None:
+                _stage_manager = multiprocessing.get_context("spawn").Manager()
+            return _stage_manager.Queue()
         except Exception as e:
-            logger.warning("OpenAI LLM cleanup failed: %s — returning original report", e)
+            logger.warning("Stage progress unavailable: %s", e)
+            _stage_manager = None
+            return None
+
+
+def _extract_in_pool(pdf_bytes, timer):
+    """
+    _cached_extraction() on the shared process pool, so parsing, rendering
+    and OCR don't compete with request threads for the calling process's
+    GIL. While the worker runs, its stage names are relayed to
+    timer.on_stage; its stage timings and counts are then merged into
+    timer. Raises ValueError for an unreadable PDF, as _cached_extraction()
+    does, and when the worker process dies (the pool is replaced).
+    """
+    stages = _stage_queue() if timer.on_stage is not None else None
+    pool = _get_batch_pool()
+    try:
+        fut = pool.submit(_pooled_extraction, pdf_bytes, stages)
+    except concurrent.futures.BrokenExecutor:
+        _reset_batch_pool(pool)
+        pool = _get_batch_pool()
+        fut = pool.submit(_pooled_extraction, pdf_bytes, stages)
+
+    while stages is not None:
+        finished = fut.done()
+        try:
+            name = stages.get(block=not finished, timeout=_STAGE_POLL_S)
+        except queue.Empty:
+            if finished:
+                break
+            continue
+        except (OSError, EOFError):
+            break           # stage manager gone; just wait for the result
+        timer.on_stage(name)
+
+    try:
+        entry, key, stage_timings, counts = fut.result()
+    except concurrent.futures.BrokenExecutor:
+        logger.error("Extraction worker process died")
+        _reset_batch_pool(pool)
+        raise ValueError("The PDF could not be processed (the worker stopped unexpectedly). Please try again.")
+    timer.stages.update(stage_timings)
+    for name, n in counts.items():
+        timer.count(name, n)
+    return entry, key
+
 
-    return report_text
+# ─────────────────────────────────────────────────────────────
+# Command-line bulk mode
+#   python -m tilt_table_extractor <dir-or-files> --jobs N --out <dir>
+# ─────────────────────────────────────────────────────────────
+
+_CLI_STAGES = ("parse", "text", "ocr", "fields", "report", "total")
+
+
+def _collect_cli_pdfs(paths):
+    """Expand files/directories into (pdf_path, output_stem) pairs. Directories are walked recursively."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(".pdf") and not name.startswith("."):
+                        full = os.path.join(root, name)
+                        # keep the sub-directory layout so same-named PDFs don't collide
+                        found.append((full, os.path.splitext(os.path.relpath(full, path))[0]))
+        elif os.path.isfile(path):
+            found.append((path, os.path.splitext(os.path.basename(path))[0]))
+        else:
+            logger.warning("Skipping %s: no such file or directory", path)
+    return found
 
 
-def process_pdf(pdf_bytes):
+def _process_cli_item(pdf_path, out_path):
     """
-    Main entry point. Takes raw PDF bytes, returns (report_text, undetermined_count).
+    Pool worker for the CLI: run one PDF and write {source, report,
+    review_count, fields, timing} as JSON to out_path.
+    Returns (pdf_path, timing, error) — timing is StageTimer.as_dict(),
+    error is None on success.
     """
+    timer = StageTimer()
     try:
-        text = extract_text_from_pdf(pdf_bytes)
-        logger.debug("Extracted %d characters from PDF", len(text))
+        with open(pdf_path, "rb") as f:
+            pdf_bytes = f.read()
+        entry, _ = _cached_extraction(pdf_bytes, timer)
+        timing = timer.as_dict()
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "source": pdf_path,
+                "report": entry["report"],
+                "review_count": entry["review_count"],
+                "fields": entry["fields"],
+                "timing": timing,
+            }, f, indent=2, default=str)
+        return pdf_path, timing, None
     except Exception as e:
-        logger.error("PDF extraction failed: %s", e)
-        raise ValueError(f"Could not read PDF: {e}")
+        return pdf_path, timer.as_dict(), str(e)
+
 
-    ocr_results = _ocr_checkboxes(pdf_bytes)
-    logger.debug("Checkbox OCR results: %s", ocr_results)
+def _peak_rss_mb():
+    """Peak RSS (MB) of this process and of the largest finished child, or (None, None) where unsupported."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None, None
+    # ru_maxrss is kilobytes on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m tilt_table_extractor",
+        description="Generate tilt table reports for many REDCap PDFs in parallel.",
+    )
+    parser.add_argument("paths", nargs="+", help="PDF files and/or directories of PDFs")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: number of CPUs)")
+    parser.add_argument("--out", "-o", required=True,
+                        help="output directory; one <name>.json per PDF")
+    parser.add_argument("--verbose", "-v", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(levelname)s %(name)s: %(message)s")
+
+    pdfs = _collect_cli_pdfs(args.paths)
+    if not pdfs:
+        print("No PDFs found.", file=sys.stderr)
+        return 1
+    jobs = max(1, min(args.jobs, len(pdfs)))
+
+    stage_times = {stage: [] for stage in _CLI_STAGES}
+    failed = []
+    cache_hits = 0
+    t0 = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_batch_worker_init,
+    ) as pool:
+        futures = [
+            pool.submit(_process_cli_item, pdf_path, os.path.join(args.out, stem + ".json"))
+            for pdf_path, stem in pdfs
+        ]
+        for done, fut in enumerate(concurrent.futures.as_completed(futures), 1):
+            pdf_path, timing, error = fut.result()
+            if error:
+                failed.append(pdf_path)
+                print(f"[{done}/{len(pdfs)}] FAILED {pdf_path}: {error}", file=sys.stderr)
+                continue
+            stage_times["total"].append(timing["total_ms"])
+            if timing["counts"].get("cache_hit"):
+                cache_hits += 1
+            else:
+                for stage in _CLI_STAGES[:-1]:
+                    stage_times[stage].append(timing["stages"].get(stage, {}).get("wall_ms", 0.0))
+            if args.verbose:
+                print(f"[{done}/{len(pdfs)}] {pdf_path} {timing['total_ms'] / 1000:.2f}s",
+                      file=sys.stderr)
+    elapsed = time.perf_counter() - t0
+
+    ok = len(pdfs) - len(failed)
+    print(f"Processed {ok}/{len(pdfs)} PDFs in {elapsed:.2f}s with {jobs} worker(s) "
+          f"— {len(pdfs) / elapsed:.2f} PDFs/s")
+    if cache_hits:
+        print(f"Result cache hits: {cache_hits} (excluded from per-stage timings)")
+    if ok:
+        print(f"{'stage':<8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        for stage in _CLI_STAGES:
+            if not stage_times[stage]:
+                continue
+            p50, p90, p99, mx = np.percentile(stage_times[stage], [50, 90, 99, 100])
+            print(f"{stage:<8} {p50:>9.1f} {p90:>9.1f} {p99:>9.1f} {mx:>9.1f}")
+    own_rss, child_rss = _peak_rss_mb()
+    if own_rss is not None:
+        print(f"Peak RSS: {own_rss:.1f} MB (main), {child_rss:.1f} MB (largest worker)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
 
-    fields = extract_fields(text, ocr_results)
-    report, undetermined_count = build_report(fields)
-    return report, undetermined_count